@@ -29,7 +29,6 @@ from .qt import *
 from copy import copy
 
 # Console widget
-from IPython.qt.console.rich_ipython_widget import RichIPythonWidget
 
 from collections import defaultdict
 
@@ -44,11 +43,12 @@ import time
 from .globals import styles, notebook_queue, \
                      current_tools, current_tools_by_id, installed_plugin_names, current_datasets, \
                      settings, url_handlers, app_launchers, mono_fontFamily, available_tools_by_category, \
-                     plugin_categories, plugin_manager, plugin_metadata
+                     plugin_categories, plugin_manager, plugin_metadata, memory_manager
 
 from . import utils
 from . import ui
 from . import plugins  # plugin helper/manager
+from . import workspace
 from .editor.editor import WorkspaceEditorView  # EDITOR_MODE_NORMAL, EDITOR_MODE_TEXT, EDITOR_MODE_REGION
 
 # Translation (@default context)
@@ -162,6 +162,9 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super(MainWindow, self).__init__()
 
+        self.workspace_filename = None  # Current workspace (.mpw) file, for Save
+        self.workflow_run = None  # Batch run of a workflow as it loads
+
         # Initiate logging
         self.logView = QTextEdit()
         self.logView.setReadOnly(True)
@@ -234,7 +237,7 @@ class MainWindow(QMainWindow):
         openAction.setShortcut('Ctrl+O')
         openAction.setStatusTip(tr('Open previous analysis workspace'))
         openAction.triggered.connect(self.onOpenWorkspace)
-        #self.menuBars['file'].addAction(openAction)
+        self.menuBars['file'].addAction(openAction)
 
         openAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'folder-open-document.png')), tr('&Open Workflow…'), self)
         openAction.setStatusTip(tr('Open an analysis workflow'))
@@ -247,11 +250,13 @@ class MainWindow(QMainWindow):
         saveAction.setShortcut('Ctrl+S')
         saveAction.setStatusTip(tr('Save current workspace for future use'))
         saveAction.triggered.connect(self.onSaveWorkspace)
+        self.menuBars['file'].addAction(saveAction)
 
         saveAsAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'disk--pencil.png')), tr('Save &As…'), self)
-        saveAsAction.setShortcut('Ctrl+A')
+        saveAsAction.setShortcut('Ctrl+Shift+S')
         saveAsAction.setStatusTip(tr('Save current workspace for future use'))
         saveAsAction.triggered.connect(self.onSaveWorkspaceAs)
+        self.menuBars['file'].addAction(saveAsAction)
 
         saveAsAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'disk--pencil.png')), tr('Save Workflow As…'), self)
         saveAsAction.setStatusTip(tr('Save current workflow for future use'))
@@ -293,7 +298,7 @@ class MainWindow(QMainWindow):
 
         refresh_pluginsAction = QAction(tr('&Rebuild toolbox'), self)
         refresh_pluginsAction.setStatusTip('Refresh toolbox with available plugins')
-        refresh_pluginsAction.triggered.connect(self.buildToolbox)
+        refresh_pluginsAction.triggered.connect(self.onRebuildToolbox)
         self.menuBars['plugins'].addAction(refresh_pluginsAction)
 
         linemarkerstyleAction = QAction('Line and marker styles…', self)
@@ -425,19 +430,17 @@ class MainWindow(QMainWindow):
         self.editView = WorkspaceEditorView(self)
         self.editor = self.editView.scene
 
-        # IPython Widget for internal (user) console
-        self.console = RichIPythonWidget()
-        self.console._call_tip = lambda: None
-        self.console.kernel_manager = notebook_queue.in_process_runner.kernel_manager
-        self.console.kernel_client = notebook_queue.in_process_runner.kernel_client
+        # IPython Widget for internal (user) console; created when first shown
+        self.console = None
 
         self.central = QTabWidget()
         self.central.setDocumentMode(True)
         self.central.setTabPosition(QTabWidget.South)
 
         self.central.addTab(self.editView, '&Editor')
-        self.central.addTab(self.console, '&Console')
+        self.central.addTab(QWidget(), '&Console')
         self.central.addTab(self.logView, '&Log')
+        self.central.currentChanged.connect(self.onWorkspaceTabChanged)
 
         self.workspaceDock = QDockWidget(tr('Workspace'))
         self.workspaceDock.setWidget(self.central)
@@ -489,9 +492,32 @@ class MainWindow(QMainWindow):
         else:
             self.statusBar().showMessage(tr('Ready'))
 
-    def buildToolbox(self):
+    def onWorkspaceTabChanged(self, index):
+        if index == 1 and self.console is None:
+            self.createConsole()
+
+    def createConsole(self):
+        # The Qt console is slow to import; only done if the console is used
+        from IPython.qt.console.rich_ipython_widget import RichIPythonWidget
 
-        plugins.get_available_plugins()
+        self.console = RichIPythonWidget()
+        self.console._call_tip = lambda: None
+        self.console.kernel_manager = notebook_queue.in_process_runner.kernel_manager
+        self.console.kernel_client = notebook_queue.in_process_runner.kernel_client
+
+        self.central.blockSignals(True)
+        self.central.removeTab(1)
+        self.central.insertTab(1, self.console, '&Console')
+        self.central.setCurrentIndex(1)
+        self.central.blockSignals(False)
+
+    def onRebuildToolbox(self):
+        # Re-scan the plugin folders, ignoring the manifest
+        self.buildToolbox(use_manifest=False)
+
+    def buildToolbox(self, use_manifest=True):
+
+        plugins.get_available_plugins(use_manifest=use_manifest)
         disabled_plugins = settings.get('Plugins/Disabled')
 
         tool_category_icons = {
@@ -568,6 +594,11 @@ class MainWindow(QMainWindow):
         interrupt_kernelsAction.triggered.connect(self.onInterruptKernels)
         t.addAction(interrupt_kernelsAction)
 
+        profilerAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'report.png')), 'Execution timeline…', self)
+        profilerAction.setStatusTip('Show where time is spent running the workflow')
+        profilerAction.triggered.connect(self.onShowProfiler)
+        t.addAction(profilerAction)
+
     def addEditorToolBar(self):
         t = self.addToolBar('Editor')
         t.setIconSize(QSize(16, 16))
@@ -850,19 +881,60 @@ class MainWindow(QMainWindow):
 
     ### OPEN/SAVE WORKSPACE
     def onOpenWorkspace(self):
-        self.openWorkspace('/Users/mxf793/Desktop/test.mpw')
+        filename, _ = QFileDialog.getOpenFileName(self, 'Open workspace', '', "Pathomx Workspace Format (*.mpw)")
+        if filename:
+            self.openWorkspace(filename)
 
     def openWorkspace(self, fn):
-        pass
+        '''
+        Open a workspace: the workflow plus the stored results of each tool. Tools whose state
+        (code, config, inputs) matches the stored results are restored without re-running.
+        '''
+        logging.info("Loading workspace... %s" % fn)
+        reader = workspace.WorkspaceReader(fn)
+        appref = self.loadWorkflow(reader.workflow_file())
+
+        # State keys include the (default) code, which is otherwise loaded after init
+        for app in appref.values():
+            app.load_source()
+
+        dirty = []
+        for tool_id, app in appref.items():
+            state = reader.state(tool_id)
+            if state is not None and app.state_key() == state:
+                app.restore(reader.results(tool_id), state)
+            else:
+                if state is not None:
+                    logging.info("- %s has changed; results not restored" % app.name)
+                dirty.append(app)
+
+        logging.info("...Restored results for %d of %d tools." % (len(appref) - len(dirty), len(appref)))
+        self.runWorkflow(appref.values(), dirty)
+        self.workspace_filename = fn
 
     def onSaveWorkspace(self):
-        self.saveWorkspace('/Users/mxf793/Desktop/test.mpw')
+        if self.workspace_filename:
+            self.saveWorkspace(self.workspace_filename)
+        else:
+            self.onSaveWorkspaceAs()
 
     def onSaveWorkspaceAs(self):
-        self.saveWorkspace('/Users/mxf793/Desktop/test.mpw')
+        filename, _ = QFileDialog.getSaveFileName(self, 'Save current workspace', '', "Pathomx Workspace Format (*.mpw)")
+        if filename:
+            self.saveWorkspace(filename)
 
     def saveWorkspace(self, fn):
-        pass
+        '''
+        Save the workflow along with the current results of each tool.
+        '''
+        tools = []
+        for t in current_tools:
+            # Only results that are up to date with the tool's current state
+            if t._latest_generator_result and t._output_state is not None and t._output_state == t.state_key():
+                tools.append((t.id, t._output_state, t._latest_generator_result))
+
+        workspace.save_workspace(fn, et.tostring(self.getXMLWorkflow()), tools)
+        self.workspace_filename = fn
 
     def onOpenDemoWorkflow(self, fn):
         reply = QMessageBox.question(self, "Open demo workflow", "Are you sure you want to open the demo workflow? Your current workflow will be lost.",
@@ -881,8 +953,13 @@ class MainWindow(QMainWindow):
 
         global current_tools, current_tools_by_id, current_datasets
 
+        if self.workflow_run is not None:
+            self.workflow_run.release()
+            self.workflow_run = None
+
         for t in current_tools[:]:
             try:
+                t.release_results()
                 t.deleteLater()
             except:
                 pass
@@ -903,6 +980,7 @@ class MainWindow(QMainWindow):
         self.editView.resetScene()
         self.editor = self.editView.scene
 
+        self.workspace_filename = None
         self.workspace_updated.emit()
 
     ### OPEN/SAVE WORKFLOWS
@@ -912,7 +990,10 @@ class MainWindow(QMainWindow):
             self.saveWorkflow(filename)
 
     def saveWorkflow(self, fn):
+        tree = et.ElementTree(self.getXMLWorkflow())
+        tree.write(fn)  # , pretty_print=True)
 
+    def getXMLWorkflow(self):
         root = et.Element("Workflow")
         root.set('xmlns:mpwfml', "http://pathomx.org/schema/Workflow/2013a")
 
@@ -956,8 +1037,7 @@ class MainWindow(QMainWindow):
                 code = et.SubElement(app, "Code")
                 code.text = v.code
 
-        tree = et.ElementTree(root)
-        tree.write(fn)  # , pretty_print=True)
+        return root
 
     def onOpenWorkflow(self):
         """ Open a data file"""
@@ -966,6 +1046,28 @@ class MainWindow(QMainWindow):
             self.openWorkflow(filename)
 
     def openWorkflow(self, fn):
+        appref = self.loadWorkflow(fn)
+        self.runWorkflow(appref.values())
+
+    def runWorkflow(self, tools, dirty=None):
+        '''
+        Run the tools of a newly loaded workflow as one batch: each dirty tool (by default all)
+        runs once, in order, when all tools have initialised. Nothing runs if none are dirty.
+        '''
+        self.workflow_run = ui.WorkflowRun(tools, dirty)
+        self.workflow_run.finished.connect(self.onWorkflowRunFinished)
+
+    def onWorkflowRunFinished(self):
+        logging.info("Workflow run complete.")
+        self.workflow_run = None
+
+    def loadWorkflow(self, fn):
+        '''
+        Build the tools and links of a workflow file, without running anything.
+
+        :param fn: Filename or file object of the workflow (.mpf)
+        :rtype: dict of workflow tool id to tool
+        '''
         logging.info("Loading workflow... %s" % fn)
         # Wipe existing workspace
         self.clearWorkspace()
@@ -1021,6 +1123,7 @@ class MainWindow(QMainWindow):
         logging.info("Load complete.")
         # Focus the home tab & refresh the view
         self.workspace_updated.emit()
+        return appref
 
     def onExportIPyNotebook(self):
         filename, _ = QFileDialog.getSaveFileName(self, 'Export workflow to IPython notebook', '', "IPython Notebook (*.ipynb)")
@@ -1150,6 +1253,10 @@ class MainWindow(QMainWindow):
     def onInterruptKernels(self):
         notebook_queue.restart()
 
+    def onShowProfiler(self):
+        dialog = ui.DialogProfiler(self)
+        dialog.exec_()
+
 #class QApplicationExtend(QApplication):
     #def event(self, e):
     #    if e.type() == QEvent.FileOpen:
@@ -1224,5 +1331,6 @@ def main():
     app.exec_()  # Enter Qt application main loop
 
     notebook_queue.stop_cluster()
+    memory_manager.close()
 
     logging.info('Exiting.')
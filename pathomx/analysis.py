@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+'''
+Vectorised statistics helpers for use from tool scripts running on the kernel.
+
+These operate on whole blocks of a DataFrame at once (masked matrix products) rather
+than looping over variables in Python, so they remain usable for screens across
+thousands of variables.
+'''
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+import scipy as sp
+import scipy.stats
+
+REGRESSION_COLUMNS = ['x', 'y', 'n', 'r', 'r2', 'p', 'slope', 'intercept', 'std_err']
+
+
+def get_variable_labels(data):
+    '''
+    Return a flat list of labels for the variables (columns) of a DataFrame, taking the
+    first level of a MultiIndex.
+    '''
+    if type(data.columns) == pd.MultiIndex:
+        return [v[0] for v in data.columns.values]
+    else:  # pd.Index
+        return list(data.columns.values)
+
+
+def _centred_and_mask(values):
+    '''
+    Centre each column on its (NaN-aware) mean and zero the missing values, returning the
+    centred values and a float mask of the present values. Centring does not change the
+    pairwise statistics but keeps the sums of squares numerically stable.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    mask = ~np.isnan(values)
+    with np.errstate(invalid='ignore'):
+        centred = values - np.nanmean(values, axis=0)
+    centred[~mask] = 0
+    return centred, mask.astype(np.float64)
+
+
+def _rank(values):
+    '''
+    Rank each column (average ties), leaving missing values as NaN.
+    '''
+    return pd.DataFrame(values).rank(axis=0).values
+
+
+def _spearman(values, a=None, b=None):
+    '''
+    Spearman correlation coefficients for the pairs (a[i], b[i]), or the full variables x
+    variables matrix if not given. Ranks are taken over the rows where both variables are present.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if a is None:
+        # pandas re-ranks each pair with missing values over its complete rows
+        return pd.DataFrame(values).corr(method='spearman').values
+
+    r = _moments_to_regression(*_pair_moments(_rank(values), a, b))[0]
+
+    # Ranks of whole columns are only right for pairs without missing values; re-rank the others
+    missing = np.isnan(values).any(axis=0)
+    for i in np.flatnonzero(missing[a] | missing[b]):
+        x, y = values[:, a[i]], values[:, b[i]]
+        both = ~np.isnan(x) & ~np.isnan(y)
+        if both.sum() < 2:
+            r[i] = np.nan
+            continue
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r[i] = np.corrcoef(sp.stats.rankdata(x[both]), sp.stats.rankdata(y[both]))[0, 1]
+
+    return r
+
+
+def _p_value(r, n):
+    '''
+    Two-sided p value for correlation coefficients r over n pairs of values.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df = n - 2
+        t = r * np.sqrt(df / ((1. - r) * (1. + r)))
+        return 2 * sp.stats.t.sf(np.abs(t), df)
+
+
+def _pair_moments(values, a=None, b=None):
+    '''
+    Calculate the sums required for correlation and regression over the rows where both
+    variables are present.
+
+    If `a` and `b` (arrays of column indexes) are given the sums are calculated for the
+    pairs (a[i], b[i]), otherwise for the full variables x variables matrix.
+    '''
+    x, m = _centred_and_mask(values)
+
+    if a is None:
+        x2 = x ** 2
+        n = m.T.dot(m)
+        sx = x.T.dot(m)
+        sxx = x2.T.dot(m)
+        sxy = x.T.dot(x)
+        return n, sx, sx.T, sxx, sxx.T, sxy
+
+    xa, xb = x[:, a], x[:, b]
+    ma, mb = m[:, a], m[:, b]
+    n = (ma * mb).sum(axis=0)
+    sx = (xa * mb).sum(axis=0)
+    sy = (xb * ma).sum(axis=0)
+    sxx = (xa ** 2 * mb).sum(axis=0)
+    syy = (xb ** 2 * ma).sum(axis=0)
+    sxy = (xa * xb).sum(axis=0)
+    return n, sx, sy, sxx, syy, sxy
+
+
+def _moments_to_regression(n, sx, sy, sxx, syy, sxy):
+    '''
+    Convert pairwise sums into correlation coefficient, p value, least-squares slope and
+    intercept of y on x and the standard error of the slope (as scipy.stats.linregress).
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ssx = sxx - sx ** 2 / n
+        ssy = syy - sy ** 2 / n
+        sxy = sxy - sx * sy / n
+
+        r = np.clip(sxy / np.sqrt(ssx * ssy), -1., 1.)
+        slope = sxy / ssx
+        intercept = (sy - slope * sx) / n
+        std_err = np.sqrt((1. - r ** 2) * ssy / ssx / (n - 2))
+
+    p = _p_value(r, n)
+
+    return r, p, slope, intercept, std_err
+
+
+def _undo_centring(values, a, b, intercept, slope):
+    '''
+    Intercepts are calculated on centred data; shift them back to the original scale.
+    '''
+    with np.errstate(invalid='ignore'):
+        means = np.nanmean(np.asarray(values, dtype=np.float64), axis=0)
+    return intercept + means[b] - slope * means[a]
+
+
+def regression(data, pairs=None, method='pearson'):
+    '''
+    Calculate correlation and linear regression statistics for pairs of variables (columns)
+    in `data`, ignoring missing values pairwise.
+
+    :param data: The source data, samples x variables
+    :type data: pandas.DataFrame
+    :param pairs: List of (x, y) column index tuples. If None all unique pairs of variables are used.
+    :type pairs: list
+    :param method: Correlation method, either 'pearson' or 'spearman'. Spearman ranks are taken over
+        the rows where both variables are present. Slope and intercept are always calculated on the untransformed values.
+    :type method: str
+    :rtype: pandas.DataFrame with one row per pair and the columns given by REGRESSION_COLUMNS
+    '''
+    values = data.values
+    labels = get_variable_labels(data)
+
+    if pairs is not None and len(pairs) == 0:
+        return pd.DataFrame([], columns=REGRESSION_COLUMNS)
+
+    def moments(values):
+        if pairs is None:
+            # All pairs; matrix products then take the upper triangle
+            return [m[a, b] for m in _pair_moments(values)]
+        else:
+            return _pair_moments(values, a, b)
+
+    if pairs is None:
+        a, b = np.triu_indices(values.shape[1], 1)
+    else:
+        a, b = np.array(pairs, dtype=np.intp).T
+
+    n, sx, sy, sxx, syy, sxy = moments(values)
+    r, p, slope, intercept, std_err = _moments_to_regression(n, sx, sy, sxx, syy, sxy)
+    intercept = _undo_centring(values, a, b, intercept, slope)
+
+    if method == 'spearman':
+        r = _spearman(values)[a, b] if pairs is None else _spearman(values, a, b)
+        r = np.clip(r, -1., 1.)
+        p = _p_value(r, n)
+
+    labels = np.array(labels, dtype=object)
+    result = pd.DataFrame({
+        'x': labels[a],
+        'y': labels[b],
+        'n': n.astype(np.int64),
+        'r': r,
+        'r2': r ** 2,
+        'p': p,
+        'slope': slope,
+        'intercept': intercept,
+        'std_err': std_err,
+    })
+    return result[REGRESSION_COLUMNS]
+
+
+def correlation_matrix(data, method='pearson'):
+    '''
+    Calculate the full variables x variables correlation matrix for `data`, ignoring
+    missing values pairwise.
+
+    :param data: The source data, samples x variables
+    :type data: pandas.DataFrame
+    :param method: Correlation method, either 'pearson' or 'spearman'
+    :type method: str
+    :rtype: pandas.DataFrame
+    '''
+    if method == 'spearman':
+        r = _spearman(data.values)
+    else:
+        r, _, _, _, _ = _moments_to_regression(*_pair_moments(data.values))
+    return pd.DataFrame(r, index=data.columns, columns=data.columns)
+
+
+def impute_minima(data, per_variable=False):
+    '''
+    Replace zero and negative values with half of the smallest positive value, either across
+    the whole dataset or separately for each variable (column). Missing values are kept.
+
+    :param data: The source data, samples x variables
+    :type data: pandas.DataFrame
+    :param per_variable: Use the minimum of each variable rather than the global minimum
+    :type per_variable: bool
+    :rtype: pandas.DataFrame
+    '''
+    values = data.values.astype(np.float64)
+    positive = np.where(values > 0, values, np.nan)
+
+    with np.errstate(invalid='ignore'):
+        if per_variable:
+            minima = np.nanmin(positive, axis=0) / 2
+        else:
+            minima = np.nanmin(positive) / 2
+
+        values = np.where(values <= 0, minima, values)  # Broadcasts per-variable minima across rows
+
+    return pd.DataFrame(values, index=data.index, columns=data.columns)
+
+
+def class_means(data, level='Class'):
+    '''
+    Calculate the mean of every variable for every class in a single grouped reduction,
+    ignoring missing values.
+
+    :param data: The source data, samples x variables, with `level` in the row index
+    :type data: pandas.DataFrame
+    :param level: Name of the index level holding the class
+    :type level: str
+    :rtype: pandas.DataFrame classes x variables
+    '''
+    return data.groupby(level=level).mean()
+
+
+def fold_change(data, control=None, level='Class'):
+    '''
+    Calculate the log2 fold change of the class means of every variable.
+
+    If `control` is given each other class is compared against it, giving a classes x variables
+    result indexed by the test class. Otherwise every ordered pair of classes is compared, giving
+    a result indexed by (Test, Control).
+
+    :param data: The source data, samples x variables, with `level` in the row index
+    :type data: pandas.DataFrame
+    :param control: The control class, or None for all pairwise comparisons
+    :param level: Name of the index level holding the class
+    :type level: str
+    :rtype: pandas.DataFrame
+    '''
+    means = class_means(data, level=level)
+    classes = list(means.index)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log2(means.values)
+
+    if control is not None:
+        test = np.array([c != control for c in classes])
+        fc = logs[test] - logs[classes.index(control)]
+        index = pd.Index([c for c in classes if c != control], name=level)
+
+    else:
+        # All pairs at once: (test, control, variable)
+        test, ctrl = np.nonzero(~np.eye(len(classes), dtype=bool))
+        fc = (logs[:, np.newaxis, :] - logs[np.newaxis, :, :])[test, ctrl]
+        index = pd.MultiIndex.from_arrays(
+            [[classes[i] for i in test], [classes[i] for i in ctrl]], names=['Test', 'Control'])
+
+    return pd.DataFrame(fc, index=index, columns=data.columns)
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks of the processing tools.
+
+Runs the tool scripts headless (no Qt, no kernel) against synthetic spectra at a range of
+scales, recording wall time, peak resident memory and allocations for each. Results can be
+stored as a baseline and later runs compared against it, flagging regressions.
+
+Tools are found from the plugin loaders: each tool class gives the script (<shortname>.py),
+its input slots and config defaults. Loaders are read with ast rather than imported, so Qt
+is not needed. Each tool is run in a separate process for a clean peak memory measurement.
+
+Usage::
+
+    python -m pathomx.benchmark --scales small,medium --save-baseline baseline.json
+    python -m pathomx.benchmark --scales small,medium --baseline baseline.json
+
+'''
+from __future__ import unicode_literals, division, print_function
+
+import os
+import io
+import sys
+import ast
+import csv
+import copy
+import json
+import time
+import shutil
+import fnmatch
+import platform
+import tempfile
+import subprocess
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .profiler import peak_memory, estimate_size
+
+PLUGIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plugins')
+
+# Synthetic datasets as (samples, points)
+SCALES = OrderedDict([
+    ('small', (100, 1000)),
+    ('medium', (1000, 32000)),
+    ('large', (5000, 64000)),
+])
+
+# Tools to benchmark, as <plugin folder>/<shortname> patterns
+DEFAULT_TOOLS = [
+    'spectra/spectra_*',
+    'transform/*',
+    'multivariate/*',
+    'fold_change/fold_change',
+    'hierarchical/hierarchical',
+    'regression/regression',
+    'import_*/import_*',
+]
+
+CLASSES = ['Control', 'Test']
+
+# Config (on top of the loader defaults) and limits for each tool. 'max_variables' takes the
+# first n variables of the dataset, for tools that scale with variables squared.
+BENCHMARK_SETTINGS = {
+    'fold_change': {'config': {'experiment_control': 'Control', 'experiment_test': 'Test'}},
+    'pls_da': {'config': {'experiment_control': 'Control', 'experiment_test': 'Test'}},
+    'regression': {'config': {'variables': [(n, n + 1) for n in range(0, 200, 2)]}},
+    'hierarchical': {'max_variables': 2000},
+}
+
+# Tools reading files; a function to write the dataset in the expected format, returning config
+IMPORT_FIXTURES = {}
+
+
+def import_fixture(shortname):
+    def register(fn):
+        IMPORT_FIXTURES[shortname] = fn
+        return fn
+    return register
+
+
+@import_fixture('import_text')
+def _text_fixture(data, path):
+    filename = os.path.join(path, 'data.csv')
+    data.to_csv(filename)
+    return {'filename': filename}
+
+
+@import_fixture('import_image')
+def _image_fixture(data, path):
+    from PIL import Image
+    values = data.values
+    values = (255 * (values - values.min()) / (np.ptp(values) or 1)).astype(np.uint8)
+    filename = os.path.join(path, 'data.png')
+    Image.fromarray(values).save(filename)
+    return {'filename': filename}
+
+
+def synthetic_spectra(samples, points, classes=CLASSES, peaks=60, seed=0):
+    '''
+    Generate a set of 1D NMR-like spectra: Lorentzian peaks on a sloping baseline with noise.
+    Peak heights differ by class, so there is something to find.
+
+    :param samples: Number of spectra (rows)
+    :param points: Number of points in each spectrum (columns)
+    :param classes: Class labels; samples are split evenly between them
+    :param peaks: Number of peaks
+    :param seed: Random seed; the same arguments always give the same data
+    :rtype: pandas.DataFrame with a Sample/Class index and ppm columns
+    '''
+    rs = np.random.RandomState(seed)
+    ppm = np.linspace(10., -0.5, points)
+
+    # Peak shapes (peaks x points); TMSP reference at 0ppm then random metabolites
+    centres = np.concatenate([[0.], rs.uniform(0.5, 9.5, peaks - 1)])
+    widths = rs.uniform(0.002, 0.01, peaks)
+    shapes = widths[:, None] ** 2 / ((ppm[None, :] - centres[:, None]) ** 2 + widths[:, None] ** 2)
+
+    # Heights (samples x peaks), with a class effect on a third of the peaks
+    sample_classes = np.arange(samples) * len(classes) // samples
+    heights = rs.lognormal(0., 0.3, (samples, peaks)) * rs.uniform(1., 100., peaks)
+    effect = np.ones((len(classes), peaks))
+    effect[:, rs.permutation(peaks)[:peaks // 3]] = rs.uniform(0.5, 2., (len(classes), peaks // 3))
+    heights *= effect[sample_classes]
+
+    values = heights.dot(shapes)
+    values += np.linspace(0, 1, points)[None, :] * rs.uniform(0, 2, (samples, 1))
+    values += rs.normal(0, 0.05, (samples, points))
+
+    index = pd.MultiIndex.from_arrays([
+        ['S%d' % (n + 1) for n in range(samples)],
+        [classes[c] for c in sample_classes],
+    ], names=['Sample', 'Class'])
+
+    return pd.DataFrame(values, index=index, columns=pd.Index(ppm, name='ppm'))
+
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        # Module constants e.g. csv.QUOTE_MINIMAL
+        return eval(compile(ast.Expression(node), '<loader>', 'eval'), {'__builtins__': {}, 'csv': csv})
+
+
+def _string(node):
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        return None
+    return value if isinstance(value, (type(''), type(b''))) else None
+
+
+def _class_definition(cls):
+    definition = {'shortname': None, 'inputs': [], 'defaults': {}}
+    for node in cls.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id == 'shortname':
+            definition['shortname'] = _string(node.value)
+
+    for node in ast.walk(cls):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.args):
+            continue
+        # self.data.add_input('name')
+        if node.func.attr == 'add_input' and _string(node.args[0]):
+            definition['inputs'].append(_string(node.args[0]))
+        # self.config.set_defaults({...})
+        elif node.func.attr == 'set_defaults' and isinstance(node.args[0], ast.Dict):
+            for k, v in zip(node.args[0].keys, node.args[0].values):
+                try:
+                    definition['defaults'][_literal(k)] = _literal(v)
+                except Exception:
+                    pass
+    return definition
+
+
+def read_loader(filename):
+    '''
+    Read the tools defined in a plugin loader, without importing it.
+
+    :param filename: Path of the loader.py
+    :rtype: list of dicts of shortname, inputs and (literal) config defaults
+    '''
+    with io.open(filename, 'rb') as f:
+        tree = ast.parse(f.read(), filename)
+
+    classes = dict((n.name, n) for n in tree.body if isinstance(n, ast.ClassDef))
+
+    def resolve(name, seen=()):
+        # Inherit inputs and defaults from base classes in the same module
+        cls = classes[name]
+        definition = {'shortname': None, 'inputs': [], 'defaults': {}}
+        for base in cls.bases:
+            if isinstance(base, ast.Name) and base.id in classes and base.id not in seen:
+                inherited = resolve(base.id, seen + (name,))
+                definition['inputs'].extend(inherited['inputs'])
+                definition['defaults'].update(inherited['defaults'])
+
+        own = _class_definition(cls)
+        definition['shortname'] = own['shortname']
+        definition['inputs'].extend(i for i in own['inputs'] if i not in definition['inputs'])
+        definition['defaults'].update(own['defaults'])
+        return definition
+
+    tools = [resolve(name) for name in classes]
+    return [t for t in tools if t['shortname']]
+
+
+def discover_tools(patterns=DEFAULT_TOOLS, plugin_path=PLUGIN_PATH):
+    '''
+    Find the tools matching any of the patterns.
+
+    :param patterns: List of <plugin folder>/<shortname> patterns, e.g. 'spectra/spectra_*'
+    :param plugin_path: Folder holding the plugins
+    :rtype: OrderedDict of tool id (<plugin folder>/<shortname>) to tool definition
+    '''
+    tools = OrderedDict()
+    for folder in sorted(os.listdir(plugin_path)):
+        loader = os.path.join(plugin_path, folder, 'loader.py')
+        if not os.path.exists(loader):
+            continue
+
+        for tool in read_loader(loader):
+            tool_id = '%s/%s' % (folder, tool['shortname'])
+            script = os.path.join(plugin_path, folder, '%s.py' % tool['shortname'])
+            if os.path.exists(script) and any(fnmatch.fnmatch(tool_id, p) for p in patterns):
+                tool['id'] = tool_id
+                tool['path'] = os.path.join(plugin_path, folder)
+                tool['script'] = script
+                tools[tool_id] = tool
+    return tools
+
+
+def progress(progress):
+    pass
+
+
+def run_tool(tool, scale, repeat=3, trace=True):
+    '''
+    Run a tool script against the synthetic dataset for a scale, in this process.
+
+    :param tool: Tool definition, from discover_tools
+    :param scale: Name of the scale (see SCALES)
+    :param repeat: Number of timed runs, after a warm-up run; the fastest is reported
+    :param trace: Make an additional run with tracemalloc to count allocations
+    :rtype: dict of measurements
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    try:
+        from mplstyler import StylesManager
+        styles = StylesManager()
+    except ImportError:
+        styles = None
+
+    settings = BENCHMARK_SETTINGS.get(tool['shortname'], {})
+    samples, points = SCALES[scale]
+    data = synthetic_spectra(samples, points)
+    if settings.get('max_variables'):
+        data = data.iloc[:, :settings['max_variables']]
+
+    config = dict(tool['defaults'])
+    config.update(settings.get('config', {}))
+
+    if tool['shortname'].startswith('import_') and tool['shortname'] not in IMPORT_FIXTURES:
+        return {'status': 'skipped', 'error': 'No synthetic input for this importer'}
+
+    with io.open(tool['script'], 'rb') as f:
+        code = compile(f.read(), tool['script'], 'exec')
+
+    cache_path = tempfile.mkdtemp(prefix='pathomx-benchmark-')
+    if tool['shortname'] in IMPORT_FIXTURES:
+        config.update(IMPORT_FIXTURES[tool['shortname']](data, cache_path))
+
+    def namespace():
+        vars = {
+            '__name__': '__main__',
+            'config': copy.deepcopy(config),
+            'styles': styles,
+            'progress': progress,
+            '_pathomx_tool_path': tool['path'],
+            '_pathomx_cache_path': cache_path,
+            '_pathomx_database_path': os.path.join(os.path.dirname(PLUGIN_PATH), 'database'),
+        }
+        # Each run gets its own copy of the inputs, as on the kernel
+        for i in tool['inputs']:
+            vars[i] = data.copy()
+        return vars
+
+    result = {
+        'status': 'ok',
+        'input_shape': list(data.shape) if tool['inputs'] else None,
+        'input_bytes': estimate_size(data) if tool['inputs'] else None,
+    }
+
+    try:
+        # An untimed first run, so imports by the script aren't counted (kernels are kept warm)
+        exec(code, namespace())
+        plt.close('all')
+
+        times = []
+        for n in range(repeat):
+            vars = namespace()
+            t = time.time()
+            exec(code, vars)
+            times.append(time.time() - t)
+            plt.close('all')
+
+        result['wall_time'] = min(times)
+        result['wall_times'] = times
+        result['peak_rss'] = peak_memory()
+
+        if trace:
+            result.update(trace_allocations(code, namespace()))
+            plt.close('all')
+
+    finally:
+        shutil.rmtree(cache_path, ignore_errors=True)
+
+    return result
+
+
+def trace_allocations(code, vars):
+    '''
+    Run code under tracemalloc, returning the peak traced memory and net allocated blocks.
+    '''
+    try:
+        import tracemalloc
+    except ImportError:  # Python 2
+        return {}
+
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        exec(code, vars)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'traced_peak': peak,
+        'allocated_blocks': sys.getallocatedblocks() - blocks,
+    }
+
+
+def run_isolated(tool_id, scale, repeat=3, trace=True, timeout=None):
+    '''
+    Run a single benchmark in a fresh Python process.
+
+    :rtype: dict of measurements
+    '''
+    cmd = [sys.executable, '-m', 'pathomx.benchmark', '--run-one', tool_id, '--scales', scale, '--repeat', str(repeat)]
+    if not trace:
+        cmd.append('--no-trace')
+
+    # Output to files rather than pipes, so a chatty script can't block on a full pipe
+    stdout, stderr = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    p = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, cwd=os.path.dirname(os.path.dirname(PLUGIN_PATH)))
+    t = time.time()
+    while p.poll() is None:
+        if timeout and time.time() - t > timeout:
+            p.kill()
+            p.wait()
+            return {'status': 'timeout', 'error': 'Exceeded %ds' % timeout}
+        time.sleep(0.1)
+
+    stdout.seek(0)
+    stderr.seek(0)
+    stdout, stderr = stdout.read(), stderr.read()
+    for line in reversed(stdout.decode('utf-8', 'replace').splitlines()):
+        if line.startswith('____pathomx_benchmark_result '):
+            return json.loads(line.split(' ', 1)[1])
+
+    lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+    return {'status': 'error', 'error': lines[-1] if lines else 'Exit code %d' % p.returncode}
+
+
+def environment():
+    '''
+    Versions of the platform and the key libraries, stored with results.
+    '''
+    import scipy
+    import matplotlib
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+    }
+
+
+def compare(results, baseline, tolerance=0.2, memory_tolerance=0.1):
+    '''
+    Compare results against a baseline.
+
+    :param results: dict of '<tool id>@<scale>' to measurements
+    :param baseline: Stored results, in the same form
+    :param tolerance: Allowed fractional increase in wall time
+    :param memory_tolerance: Allowed fractional increase in peak RSS and traced memory
+    :rtype: list of (key, measure, baseline value, current value) for each regression
+    '''
+    regressions = []
+    for key, r in results.items():
+        b = baseline.get(key)
+        if b is None or b.get('status') != 'ok':
+            continue
+
+        if r.get('status') != 'ok':
+            regressions.append((key, 'status', b['status'], r.get('status')))
+            continue
+
+        for measure, allowed in [('wall_time', tolerance), ('peak_rss', memory_tolerance), ('traced_peak', memory_tolerance)]:
+            if b.get(measure) and r.get(measure) and r[measure] > b[measure] * (1 + allowed):
+                regressions.append((key, measure, b[measure], r[measure]))
+
+    return regressions
+
+
+def _format(measure, value):
+    if measure == 'wall_time':
+        return '%.3fs' % value
+    elif isinstance(value, (int, float)):
+        return '%.1fMB' % (value / 1024. ** 2)
+    return '%s' % value
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the Pathomx processing tools on synthetic spectra.')
+    parser.add_argument('--tools', default=','.join(DEFAULT_TOOLS),
+                        help='Comma-separated <plugin>/<shortname> patterns of tools to run (default: %(default)s)')
+    parser.add_argument('--scales', default='small',
+                        help='Comma-separated scales to run, from %s, or all (default: %%(default)s)' % ', '.join(SCALES))
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs of each tool; the fastest is reported')
+    parser.add_argument('--no-trace', action='store_true', help='Skip the tracemalloc run counting allocations')
+    parser.add_argument('--timeout', type=int, default=3600, help='Seconds allowed for each benchmark')
+    parser.add_argument('--output', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Compare against the baseline in this file')
+    parser.add_argument('--save-baseline', help='Save the results as a baseline to this file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed fractional increase in wall time')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1, help='Allowed fractional increase in memory')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    scales = list(SCALES) if args.scales == 'all' else args.scales.split(',')
+    for scale in scales:
+        if scale not in SCALES:
+            parser.error('Unknown scale %s' % scale)
+
+    if args.run_one:
+        # Child process; report the result on stdout
+        tool = discover_tools([args.run_one])[args.run_one]
+        result = run_tool(tool, scales[0], args.repeat, not args.no_trace)
+        print('____pathomx_benchmark_result %s' % json.dumps(result))
+        return 0
+
+    tools = discover_tools(args.tools.split(','))
+    results = OrderedDict()
+    for scale in scales:
+        for tool_id in tools:
+            key = '%s@%s' % (tool_id, scale)
+            sys.stdout.write('%-45s ' % key)
+            sys.stdout.flush()
+            results[key] = r = run_isolated(tool_id, scale, args.repeat, not args.no_trace, args.timeout)
+            if r['status'] == 'ok':
+                print('%10s %10s %10s' % (_format('wall_time', r['wall_time']), _format('peak_rss', r['peak_rss']),
+                                          _format('traced_peak', r['traced_peak']) if r.get('traced_peak') else ''))
+            else:
+                print('%s: %s' % (r['status'], r.get('error')))
+
+    data = {'environment': environment(), 'results': results}
+    for filename in args.output, args.save_baseline:
+        if filename:
+            with io.open(filename, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(data, indent=1, sort_keys=True))
+
+    if args.baseline:
+        with io.open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        if baseline.get('environment') != data['environment']:
+            print('\nWarning: baseline was recorded in a different environment')
+            for k, v in sorted(data['environment'].items()):
+                if baseline.get('environment', {}).get(k) != v:
+                    print('  %s: %s (baseline %s)' % (k, v, baseline.get('environment', {}).get(k)))
+
+        regressions = compare(results, baseline['results'], args.tolerance, args.memory_tolerance)
+        if regressions:
+            print('\n%d regressions against %s:' % (len(regressions), args.baseline))
+            for key, measure, was, now in regressions:
+                print('  %-45s %-12s %10s -> %s' % (key, measure, _format(measure, was), _format(measure, now)))
+            return 1
+
+        print('\nNo regressions against %s' % args.baseline)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,6 +18,8 @@ import pandas as pd
 import numpy as np
 from PIL import Image
 
+from .workspace import DeferredDict
+
 class DataTreeItem(object):
     '''
     a python object used to return row/column data, and keep note of
@@ -203,7 +205,7 @@ class DataManager(QObject):
         self.consumes = []  # Holds list of data objects that are consumed
 
         self.i = {}  # Inputs: dict of 'interface' tuples: (origin,interface)
-        self.o = {}  # Outputs
+        self.o = DeferredDict()  # Outputs; may be Deferred (e.g. restored from a workspace) until used
 
         self.watchers = defaultdict(set)  # List of watchers on each output interface
 
@@ -252,6 +254,14 @@ class DataManager(QObject):
         self.watchers[interface] = set()
         self.o[interface] = None  # DataSet(manager=self) # Empty dso (temp; replace with None later?)
 
+    # Check what is on an input interface without copying or loading it
+    def peek(self, interface):
+        if interface in self.i and self.i[interface] is not None:
+            source_manager, source_interface = self.i[interface]
+            return source_manager.o.peek(source_interface)
+
+        return None
+
     # Get a dataset through output interface id;
     def geto(self, interface):
         if interface in self.o:
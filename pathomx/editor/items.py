@@ -531,10 +531,10 @@ class ToolInterface(BaseInteractiveItem):  # QGraphicsPolygonItem):
     def get_interface_status(self):
         if self.interface_type == 'input':
             return (self.app.data.i[self.interface_name] is not None) and \
-                   (self.app.data.get(self.interface_name) is not None)
+                   (self.app.data.peek(self.interface_name) is not None)
 
         elif self.interface_type == 'output':
-            return not self.app.data.o[self.interface_name] is None
+            return not self.app.data.o.peek(self.interface_name) is None
 
     def updateShape(self, l):
         ''' Update polygon shape to the specified length (to match inner text) '''
@@ -676,7 +676,7 @@ class LinkItem(QGraphicsPathItem):
         # Determine maximum length of text by horribly kludge
             max_length = self.bezierPath.length() / 10
             source_manager, source_interface = self.data
-            dataobj = source_manager.o[source_interface]
+            dataobj = source_manager.o.peek(source_interface)  # Don't load deferred data just for the label
             if dataobj is not None:
                 strs = [source_interface]
                 if hasattr(dataobj, 'shape'):
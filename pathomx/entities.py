@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+'''
+Shared BioCyc entity resolution for tool scripts running on the kernel.
+
+Tools resolve lists of BioCyc ids to objects in a single call through an EntityResolver.
+Resolved objects are held in a process-wide LRU and persisted in a local SQLite store,
+so repeated runs (and other tools) never repeat a lookup. The store is pre-seeded with the
+compounds, genes, proteins, pathways and reactions of the bundled database; ids that cannot
+be fetched (e.g. when offline) resolve to a lightweight Entity record from the seed data.
+'''
+from __future__ import unicode_literals
+
+import os
+import json
+import sqlite3
+import logging
+from collections import OrderedDict
+
+import pandas as pd
+
+from .identifiers import sources_key
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Bundled database tables: (file, entity type, dblinks column)
+ENTITY_TABLES = [
+    ('compounds', 'compound', 3),
+    ('genes', 'gene', 2),
+    ('proteins', 'protein', 4),
+    ('pathways', 'pathway', None),
+    ('reactions', 'reaction', None),
+]
+
+# Maximum number of parameters in a single SQLite query
+SQLITE_MAX_VARIABLES = 500
+
+# Seconds to wait for the store while another kernel writes to it
+SQLITE_TIMEOUT = 30
+
+_MISSING = object()
+
+
+class Entity(object):
+    '''
+    Offline record for a BioCyc entity, built from the bundled database.
+    '''
+
+    def __init__(self, id, type, name=None, dblinks=None):
+        self.id = id
+        self.type = type
+        self.name = name
+        self.dblinks = dblinks or {}
+
+    def __repr__(self):
+        return self.id
+
+    def __str__(self):
+        return self.name or self.id
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class LRUCache(object):
+    '''
+    Minimal least-recently-used mapping, evicting the oldest entries above `size`.
+    '''
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def put(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _parse_dblinks(s):
+    dblinks = {}
+    for x in s.split(';'):
+        db, _, dbid = x.partition(':')
+        if db and dbid:
+            dblinks[db] = dbid
+    return dblinks
+
+
+class EntityResolver(object):
+    '''
+    Resolve BioCyc ids to objects in bulk, via a process-wide LRU and a persistent SQLite store.
+
+    :param store_path: Path of the SQLite store (created if it doesn't exist)
+    :param database_path: Path to the bundled database folder, used to seed the store
+    :param organism: BioCyc organism to resolve against
+    :param online: Fetch ids missing from the store from BioCyc; if False only stored and seeded entities are used
+    :param size: Number of objects to hold in the LRU
+    '''
+
+    def __init__(self, store_path, database_path, organism='HUMAN', online=True, size=4096):
+        self.database_path = database_path
+        self.organism = organism
+        self.online = online
+        self.cache = LRUCache(size)
+
+        try:
+            from biocyc import biocyc
+        except ImportError:
+            self.biocyc = None
+        else:
+            biocyc.set_organism(organism)
+            secondary_cache_path = os.path.join(database_path, 'biocyc')
+            if secondary_cache_path not in biocyc.secondary_cache_paths:
+                biocyc.secondary_cache_paths.append(secondary_cache_path)
+            self.biocyc = biocyc
+
+        if not os.path.exists(os.path.dirname(store_path)):
+            os.makedirs(os.path.dirname(store_path))
+
+        # The store is shared by all the kernels
+        self.db = sqlite3.connect(store_path, timeout=SQLITE_TIMEOUT)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS entities (id TEXT PRIMARY KEY, type TEXT, name TEXT, dblinks TEXT);
+            CREATE TABLE IF NOT EXISTS objects (organism TEXT, id TEXT, data BLOB, PRIMARY KEY (organism, id));
+        ''')
+        self.seed()
+
+    def seed(self):
+        '''
+        Load the bundled database entities into the store, if it changed since last seeded.
+        '''
+        sources = [(os.path.join(self.database_path, fn), t, c) for fn, t, c in ENTITY_TABLES]
+        sources = [s for s in sources if os.path.exists(s[0])]
+
+        key = sources_key([s[0] for s in sources])
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'seed'").fetchone()
+        if row is not None and row[0] == key:
+            return
+
+        rows = []
+        for path, entity_type, dblinks_col in sources:
+            t = pd.read_csv(path, header=None, dtype=str, keep_default_na=False, encoding='utf-8').values
+            for r in t:
+                dblinks = _parse_dblinks(r[dblinks_col]) if dblinks_col is not None else {}
+                rows.append((r[0], entity_type, r[1] or None, json.dumps(dblinks)))
+
+        self._write([
+            ("INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)", rows),
+            ("INSERT OR REPLACE INTO meta VALUES ('seed', ?)", [(key,)]),
+        ])
+
+    def _write(self, statements):
+        # Storing is an optimisation; if the store is busy (locked by another kernel) skip it
+        try:
+            with self.db:
+                for query, rows in statements:
+                    self.db.executemany(query, rows)
+        except sqlite3.OperationalError as e:
+            logging.warning("Could not write to the entity store: %s" % e)
+
+    def _select(self, query, ids, params=()):
+        # Other parameters of the query (params) come before the ids
+        ids = list(ids)
+        for n in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            chunk = ids[n:n + SQLITE_MAX_VARIABLES]
+            for row in self.db.execute(query % ','.join('?' * len(chunk)), list(params) + chunk):
+                yield row
+
+    def _fetch(self, id):
+        if self.biocyc is None or not self.online:
+            return None
+        try:
+            return self.biocyc.get(id)
+        except Exception:
+            return None
+
+    def get_many(self, ids):
+        '''
+        Resolve a list of BioCyc ids to objects. Each distinct id is looked up once; objects
+        (anything with an `id`) are passed through unchanged.
+
+        :param ids: List of BioCyc ids
+        :rtype: list of objects, None where an id could not be resolved
+        '''
+        results = {}
+        missing = set()
+        for i in ids:
+            if i is None or hasattr(i, 'id') or i in results:
+                continue
+
+            o = self.cache.get(i, _MISSING)
+            if o is _MISSING:
+                missing.add(i)
+            else:
+                results[i] = o
+
+        if missing:
+            # Previously fetched objects
+            query = "SELECT id, data FROM objects WHERE organism = ? AND id IN (%s)"
+            for i, data in self._select(query, missing, (self.organism,)):
+                try:
+                    results[i] = pickle.loads(bytes(data))
+                except Exception:
+                    continue
+                missing.discard(i)
+
+            # Fetch the remainder, storing whatever can be persisted
+            stored = []
+            for i in missing:
+                o = self._fetch(i)
+                if o is not None:
+                    results[i] = o
+                    try:
+                        stored.append((self.organism, i, sqlite3.Binary(pickle.dumps(o, pickle.HIGHEST_PROTOCOL))))
+                    except Exception:
+                        pass
+
+            if stored:
+                self._write([("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)", stored)])
+
+            # Anything left falls back to the bundled database
+            missing = [i for i in missing if i not in results]
+            for i, entity_type, name, dblinks in self._select("SELECT id, type, name, dblinks FROM entities WHERE id IN (%s)", missing):
+                results[i] = Entity(i, entity_type, name, json.loads(dblinks))
+
+            # Unresolved ids aren't cached, so they are tried again (e.g. once back online)
+            for i, o in results.items():
+                self.cache.put(i, o)
+
+        return [i if i is None or hasattr(i, 'id') else results.get(i) for i in ids]
+
+    def get(self, id):
+        '''
+        Resolve a single BioCyc id to an object.
+
+        :param id: BioCyc id
+        :rtype: object or None
+        '''
+        return self.get_many([id])[0]
+
+
+_resolvers = {}
+
+
+def get_resolver(store_path, database_path, organism='HUMAN', online=True):
+    '''
+    Return the process-wide EntityResolver for a store, creating it on first use.
+
+    :param store_path: Path of the SQLite store
+    :param database_path: Path to the bundled database folder
+    :param organism: BioCyc organism to resolve against
+    :param online: Fetch ids missing from the store from BioCyc
+    :rtype: EntityResolver
+    '''
+    key = (store_path, organism)
+    if key not in _resolvers:
+        _resolvers[key] = EntityResolver(store_path, database_path, organism=organism, online=online)
+
+    resolver = _resolvers[key]
+    resolver.online = online
+    return resolver
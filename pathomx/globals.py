@@ -7,7 +7,8 @@ import os
 from collections import defaultdict
 
 from .qt import *
-from .runqueue import RunManager
+from .runqueue import RunManager, DEFAULT_PRELOAD_MODULES
+from .memory import MemoryManager
 from pyqtconfig import QSettingsManager
 from yapsy.PluginManager import PluginManagerSingleton
 
@@ -45,7 +46,6 @@ if not ON_RTD:
     # Manager objects
     logging.debug('Setting up managers...')
     styles = StylesManager()
-    notebook_queue = RunManager()
 
     settings = QSettingsManager()
     settings.set_defaults({
@@ -61,11 +61,22 @@ if not ON_RTD:
 
         'Resources/MATLAB_path': 'matlab',
 
+        'Kernels/Pool_size': 0,  # 0 for one per core (less one for the UI)
+        'Kernels/Recycle_after': 0,  # Jobs per kernel before it is replaced; 0 for never
+        'Kernels/Preload': DEFAULT_PRELOAD_MODULES,
+        'Kernels/Preload_languages': [],
+        'Kernels/Config_run_delay': 300,  # ms to wait after a config change before running; 0 to run at once
+
+        'Memory/Budget': 4096,  # MB of tool results to hold in memory before spilling to disk; 0 for no limit
+
         'Editor/Snap_to_grid': False,
         'Editor/Show_grid': True,
         'Editor/Auto_position': False,
     })
 
+    notebook_queue = RunManager(settings)
+    memory_manager = MemoryManager(settings)
+
     mono_fontFamilies = {'Windows': 'Courier New',
                     'Darwin': 'Menlo'}
     mono_fontFamily = mono_fontFamilies.get(platform.system(), 'Monospace')
@@ -114,6 +125,7 @@ else:
 
     styles = None
     notebook_queue = None
+    memory_manager = None
 
     settings = None
     mono_fontFamily = None
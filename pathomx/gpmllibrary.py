@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+'''
+Local, content-addressed library of GPML pathway files.
+
+Pathway files are stored by the SHA1 of their content, with an index from WikiPathways id
+(and revision) to content. Once a pathway is in the library it is loaded from disk, so runs
+are reproducible and work offline; the server is only contacted for pathways not yet held.
+The server can be pointed at a local stand-in for WikiPathways.
+
+GPML and rendered SVG are also held in memory for the life of the process. Renders are keyed
+on the content with the node colours left as tokens, so re-running with new data only
+substitutes the colours and unchanged pathways are never parsed again.
+'''
+from __future__ import unicode_literals
+
+import os
+import io
+import json
+import hashlib
+
+from .entities import LRUCache
+from .graphcache import fill_colours
+
+WIKIPATHWAYS_URL = 'http://www.wikipathways.org/'
+
+_gpml_cache = LRUCache(64)
+_svg_cache = LRUCache(64)
+
+
+class GPMLLibrary(object):
+    '''
+    Content-addressed store of GPML files.
+
+    :param path: Folder holding the library
+    :param server: Base URL of the WikiPathways (or compatible) server
+    :param online: Fetch pathways not in the library from the server
+    '''
+
+    def __init__(self, path, server=WIKIPATHWAYS_URL, online=True):
+        self.path = path
+        self.server = server or WIKIPATHWAYS_URL
+        self.online = online
+
+        self.objects_path = os.path.join(path, 'objects')
+        if not os.path.exists(self.objects_path):
+            os.makedirs(self.objects_path)
+
+        self.index_filename = os.path.join(path, 'index.json')
+        try:
+            with io.open(self.index_filename, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.index = {}
+
+    def _write_index(self):
+        tmp = '%s.%d.tmp' % (self.index_filename, os.getpid())
+        with io.open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.index, indent=1, sort_keys=True))
+        if os.path.exists(self.index_filename):
+            os.remove(self.index_filename)
+        os.rename(tmp, self.index_filename)
+
+    def store(self, gpml):
+        '''
+        Add GPML to the library, returning its content key.
+
+        :param gpml: GPML document
+        :type gpml: str
+        :rtype: str
+        '''
+        data = gpml.encode('utf-8')
+        key = hashlib.sha1(data).hexdigest()
+        filename = os.path.join(self.objects_path, '%s.gpml' % key)
+        if not os.path.exists(filename):
+            with open(filename, 'wb') as f:
+                f.write(data)
+
+        _gpml_cache.put(key, gpml)
+        return key
+
+    def load(self, key):
+        '''
+        Load GPML from the library by content key.
+
+        :param key: Content key, as returned by store
+        :rtype: str
+        '''
+        gpml = _gpml_cache.get(key)
+        if gpml is None:
+            with open(os.path.join(self.objects_path, '%s.gpml' % key), 'rb') as f:
+                gpml = f.read().decode('utf-8')
+            _gpml_cache.put(key, gpml)
+        return gpml
+
+    def add_file(self, filename):
+        '''
+        Add a GPML file to the library, returning its content key and the GPML.
+
+        :param filename: Path of the GPML file
+        :rtype: tuple of (key, gpml)
+        '''
+        with open(filename, 'rb') as f:
+            gpml = f.read().decode('utf-8')
+        return self.store(gpml), gpml
+
+    def get_wikipathways(self, pathway_id, revision=0):
+        '''
+        Return the content key and GPML for a WikiPathways pathway, fetching it from the server
+        only if it is not already in the library.
+
+        :param pathway_id: WikiPathways id e.g. WP78
+        :param revision: Pathway revision; 0 for the revision first stored
+        :rtype: tuple of (key, gpml)
+        '''
+        name = '%s@%s' % (pathway_id, revision)
+        if name in self.index:
+            return self.index[name], self.load(self.index[name])
+
+        if not self.online:
+            raise Exception("Pathway %s is not in the GPML library (offline)" % pathway_id)
+
+        import requests
+        r = requests.get(self.server.rstrip('/') + '/wpi/wpi.php', params={
+                            'action': 'downloadFile',
+                            'type': 'gpml',
+                            'pwTitle': 'Pathway:%s' % pathway_id,
+                            'revision': revision,
+                        })
+        if r.status_code != 200:
+            raise Exception("Error loading GPML from WikiPathways (%d)" % r.status_code)
+
+        key = self.store(r.text)
+        self.index[name] = key
+        self._write_index()
+        return key, r.text
+
+
+def render_gpml(key, gpml, node_colors=None, xref_synonyms=None, xref_urls=None):
+    '''
+    Render GPML to SVG with gpml2svg, reusing the render for unchanged content and xrefs.
+
+    The pathway is rendered with a numbered token in place of each node colour and cached
+    keyed on the content, the coloured xrefs and the xref mappings; a change that only
+    recolours the nodes substitutes the new colours into the cached SVG.
+
+    :param key: Content key of the GPML
+    :param gpml: GPML document
+    :param node_colors: dict of (database, id) to (fill, text) colours
+    :param xref_synonyms: dict of (database, id) to additional (database, id)
+    :param xref_urls: dict of database to URL template
+    :rtype: tuple of (svg, metadata)
+    '''
+    node_colors = node_colors or {}
+    xref_synonyms = xref_synonyms or {}
+    # Sort by repr; ids in one database can mix int and str (e.g. from a mixed-type column level)
+    xrefs = sorted(node_colors.keys(), key=repr)
+    state = json.dumps([key, xrefs, sorted(xref_synonyms.items(), key=repr),
+                        sorted((xref_urls or {}).items(), key=repr)], default=str)
+    render_key = hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+    result = _svg_cache.get(render_key)
+    if result is None:
+        from gpml2svg import gpml2svg
+        tokens = dict((x, ('#@c%d@' % (2 * n), '#@c%d@' % (2 * n + 1))) for n, x in enumerate(xrefs))
+        kwargs = {'xref_urls': xref_urls} if xref_urls else {}
+        result = gpml2svg.gpml2svg(gpml, node_colors=tokens, xref_synonyms=xref_synonyms, **kwargs)
+        _svg_cache.put(render_key, result)
+
+    template, metadata = result
+    colours = [c for x in xrefs for c in node_colors[x][:2]]
+    return fill_colours(template, colours), metadata
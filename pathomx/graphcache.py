@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+'''
+Cached Graphviz rendering, split into layout and styling stages.
+
+Colours do not affect a Graphviz layout, so hex colours are lifted out of the graph source
+before layout. The positioned layout is cached on disk, keyed on the colour-free source; a
+change that only recolours the graph reuses it, and the new colours are substituted back in
+and rendered with the layout engine in no-op mode (-n2). Finished renders are cached too,
+keyed on the layout and the (quantised) colours, so an identical graph is never redrawn.
+'''
+from __future__ import unicode_literals
+
+import os
+import re
+import hashlib
+import subprocess
+
+HEX_COLOUR_RE = re.compile(r'#[0-9a-fA-F]{6}(?:[0-9a-fA-F]{2})?(?![0-9a-fA-F])')
+COLOUR_TOKEN_RE = re.compile(r'#@c(\d+)@')
+
+
+def quantise_colour(hexcol, step=8):
+    '''
+    Round each channel of a #rrggbb(aa) colour to a multiple of `step`, so near-identical
+    colour mappings share a cache entry.
+    '''
+    channels = [int(hexcol[n:n + 2], 16) for n in range(1, len(hexcol), 2)]
+    return '#' + ''.join('%02x' % min(255, int(round(c / float(step))) * step) for c in channels)
+
+
+def split_colours(source):
+    '''
+    Replace each hex colour in a dot source with a numbered token.
+
+    :param source: Graphviz dot source
+    :rtype: tuple of (template, list of colours)
+    '''
+    colours = []
+
+    def tokenise(m):
+        colours.append(m.group(0))
+        return '#@c%d@' % (len(colours) - 1)
+
+    return HEX_COLOUR_RE.sub(tokenise, source), colours
+
+
+def fill_colours(template, colours):
+    '''
+    Substitute the colours back into a template (or a layout generated from it).
+    '''
+    return COLOUR_TOKEN_RE.sub(lambda m: colours[int(m.group(1))], template)
+
+
+def _graphviz_program(prog):
+    try:
+        import pydot
+        progs = pydot.find_graphviz()
+    except Exception:
+        progs = None
+    return progs.get(prog, prog) if progs else prog
+
+
+def run_graphviz(source, prog='neato', format='svg', args=None):
+    '''
+    Run a Graphviz program over a dot source, returning the output.
+
+    :param source: Graphviz dot source
+    :param prog: Layout program, e.g. 'neato' or 'dot'
+    :param format: Output format
+    :param args: Additional command line arguments
+    :rtype: bytes
+    '''
+    p = subprocess.Popen([_graphviz_program(prog), '-T%s' % format] + (args or []),
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = p.communicate(source.encode('utf-8'))
+    if p.returncode != 0:
+        raise Exception('%s failed: %s' % (prog, stderr.decode('utf-8', 'replace')))
+    return stdout
+
+
+class GraphRenderCache(object):
+    '''
+    On-disk cache of Graphviz layouts and renders.
+
+    :param path: Folder to store the cache in; persists between sessions
+    :param max_renders: Number of finished renders to keep (layouts are kept)
+    '''
+
+    def __init__(self, path, max_renders=256):
+        self.layout_path = os.path.join(path, 'layouts')
+        self.render_path = os.path.join(path, 'renders')
+        self.max_renders = max_renders
+
+        for p in self.layout_path, self.render_path:
+            if not os.path.exists(p):
+                os.makedirs(p)
+
+    def layout(self, template, prog='neato'):
+        '''
+        Return the positioned dot for a colour-free template, running the layout only if not cached.
+        '''
+        filename = os.path.join(self.layout_path, '%s.dot' % self._layout_key(template, prog))
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                return f.read().decode('utf-8')
+
+        layout = run_graphviz(template, prog, 'dot').decode('utf-8')
+        self._write(filename, layout.encode('utf-8'))
+        return layout
+
+    def render(self, source, prog='neato', format='svg'):
+        '''
+        Render a dot source, reusing a cached render or layout where possible.
+
+        :param source: Graphviz dot source
+        :param prog: Layout program
+        :param format: Output format
+        :rtype: bytes
+        '''
+        template, colours = split_colours(source)
+        colours = [quantise_colour(c) for c in colours]
+
+        key = hashlib.sha1(('%s\n%s\n%s' % (self._layout_key(template, prog), format, ','.join(colours))).encode('utf-8')).hexdigest()
+        filename = os.path.join(self.render_path, '%s.%s' % (key, format))
+        if os.path.exists(filename):
+            os.utime(filename, None)  # Mark as recently used
+            with open(filename, 'rb') as f:
+                return f.read()
+
+        # Style only; positions come from the cached layout
+        output = run_graphviz(fill_colours(self.layout(template, prog), colours), prog, format, ['-n2'])
+        self._write(filename, output)
+        self.prune()
+        return output
+
+    def prune(self):
+        '''
+        Remove the least recently used renders above max_renders.
+        '''
+        renders = [os.path.join(self.render_path, fn) for fn in os.listdir(self.render_path)]
+        if len(renders) <= self.max_renders:
+            return
+
+        renders.sort(key=os.path.getmtime)
+        for fn in renders[:len(renders) - self.max_renders]:
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+
+    def _layout_key(self, template, prog):
+        return hashlib.sha1(('%s\n%s' % (prog, template)).encode('utf-8')).hexdigest()
+
+    def _write(self, filename, data):
+        # Write then rename so a partial file is never read back
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(tmp, filename)
+        except OSError:  # Already written by another process
+            os.remove(tmp)
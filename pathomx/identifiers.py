@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+'''
+Persistent identifier index for mapping entity names and database identifiers to BioCyc ids.
+
+The index is built once from the bundled database (compounds, genes, proteins, synonyms) and
+the cross-reference tables of the entity mapping tool, then stored as sorted, fixed-width
+key and id arrays. On open these are memory-mapped, so a lookup over every label in a
+dataset is a single vectorised binary search rather than a name-by-name search.
+'''
+from __future__ import unicode_literals
+
+import os
+import re
+import json
+import hashlib
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Cross-reference tables (BioCyc id, external id) keyed by the namespace they provide
+MAP_TABLES = {
+    'BiGG': 'bigg',
+    'BioPath': 'biopath',
+    'BRENDA': 'brenda',
+    'FIMA': 'fima',
+    'HMDB': 'hmdb',
+    'KEGG': 'kegg',
+    'LIPID MAPS': 'lipidmaps',
+    'SEED': 'seed',
+    'UPA': 'upa',
+}
+
+# Database prefixes used in the bundled xref columns and synonyms, mapped to namespaces
+XREF_NAMESPACES = {
+    'BIGG': 'BiGG',
+    'BIOPATH': 'BioPath',
+    'BRENDA': 'BRENDA',
+    'HMDB': 'HMDB',
+    'KEGG': 'KEGG',
+    'LIPIDMAPS': 'LIPID MAPS',
+    'SEED': 'SEED',
+    'UPA': 'UPA',
+}
+
+# Bundled database tables: (file, namespace, id column, name columns, xref column)
+DATABASE_TABLES = [
+    ('compounds', 'Compound', 0, [1], 3),
+    ('genes', 'Gene', 0, [1], 2),
+    ('proteins', 'Protein', 0, [1], 4),
+]
+
+INDEX_VERSION = 1
+
+_strip_re = re.compile(r'[\s\-_,\'"()\[\]{}]+', re.UNICODE)
+
+
+def normalise(names):
+    '''
+    Normalise names for matching; case-insensitive and ignoring whitespace, hyphens, commas,
+    quotes and brackets (so 'L-Alanine', 'l alanine' and 'L-ALANINE' are equivalent).
+
+    :param names: Sequence of names
+    :rtype: list of str
+    '''
+    return [_strip_re.sub('', '%s' % n).lower() if n is not None else '' for n in names]
+
+
+def _keys(namespace, names):
+    return np.array([('%s\t%s' % (namespace, n)).encode('utf-8') for n in normalise(names)])
+
+
+def _read_table(path):
+    return pd.read_csv(path, header=None, dtype=str, keep_default_na=False, encoding='utf-8').values
+
+
+def identifier_sources(database_path, tables_path):
+    '''
+    Return the list of source files the index is built from.
+    '''
+    sources = [os.path.join(database_path, fn) for fn, _, _, _, _ in DATABASE_TABLES]
+    sources.append(os.path.join(database_path, 'synonyms'))
+    sources.extend(os.path.join(tables_path, fn) for fn in sorted(MAP_TABLES.values()))
+    return [s for s in sources if os.path.exists(s)]
+
+
+def sources_key(sources, *args):
+    '''
+    Generate a key for data built from the files `sources` (plus any additional JSON serialisable
+    arguments); changes whenever any source file does.
+    '''
+    stats = [[os.path.abspath(s), os.stat(s).st_mtime, os.stat(s).st_size] for s in sources]
+    key = json.dumps(list(args) + stats, sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def build_identifier_index(path, database_path, tables_path):
+    '''
+    Build the identifier index from the bundled database and mapping tables and store it at `path`.
+
+    Names and mapping table ids are indexed under their own namespace and under 'Any'; database
+    xrefs only under their own namespace. Where a key maps to more
+    than one id the first source wins, in the order: mapping tables, database names, synonyms.
+
+    :param path: Folder to write the index to (created; replaced atomically if it exists)
+    :param database_path: Path to the bundled database folder
+    :param tables_path: Path to the folder holding the mapping tables
+    '''
+    keys, ids = [], []
+
+    def add(namespace, names, targets, also_any=True):
+        keys.append(_keys(namespace, names))
+        ids.append(np.array(targets, dtype=object))
+        if also_any:
+            keys.append(_keys('Any', names))
+            ids.append(np.array(targets, dtype=object))
+
+    def add_xrefs(targets, xrefs):
+        by_namespace = {}
+        for target, xref in zip(targets, xrefs):
+            for x in xref.split(';'):
+                db, _, xid = x.partition(':')
+                if db in XREF_NAMESPACES and xid:
+                    by_namespace.setdefault(XREF_NAMESPACES[db], ([], []))
+                    by_namespace[XREF_NAMESPACES[db]][0].append(xid)
+                    by_namespace[XREF_NAMESPACES[db]][1].append(target)
+
+        for namespace, (names, targets) in by_namespace.items():
+            add(namespace, names, targets, also_any=False)
+
+    for namespace, fn in sorted(MAP_TABLES.items()):
+        table_path = os.path.join(tables_path, fn)
+        if os.path.exists(table_path) and os.path.getsize(table_path) > 0:
+            t = _read_table(table_path)
+            add(namespace, t[:, 1], t[:, 0])
+
+    for fn, namespace, idc, namecs, xrefc in DATABASE_TABLES:
+        table_path = os.path.join(database_path, fn)
+        if not os.path.exists(table_path):
+            continue
+
+        t = _read_table(table_path)
+        add(namespace, t[:, idc], t[:, idc])
+        for c in namecs:
+            add(namespace, t[:, c], t[:, idc])
+        add_xrefs(t[:, idc], t[:, xrefc])
+
+    table_path = os.path.join(database_path, 'synonyms')
+    if os.path.exists(table_path):
+        t = _read_table(table_path)
+        add('Any', t[:, 1], t[:, 0], also_any=False)
+        add_xrefs(t[:, 0], t[:, 1])
+
+    keys = np.concatenate(keys)
+    ids = np.concatenate(ids)
+
+    # np.unique sorts, and returns the first occurrence of each key
+    keys, first = np.unique(keys, return_index=True)
+    unique_ids, targets = np.unique(ids[first].astype('U'), return_inverse=True)
+
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    # Write to a temporary folder first so a partially written index is never opened
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+    try:
+        np.save(os.path.join(tmp_path, 'keys.npy'), keys)
+        np.save(os.path.join(tmp_path, 'targets.npy'), targets.astype(np.int32))
+        np.save(os.path.join(tmp_path, 'ids.npy'), np.char.encode(unique_ids, 'utf-8'))
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+class IdentifierIndex(object):
+    '''
+    A memory-mapped identifier index, as written by build_identifier_index.
+    '''
+
+    def __init__(self, path):
+        self.keys = np.load(os.path.join(path, 'keys.npy'), mmap_mode='r')
+        self.targets = np.load(os.path.join(path, 'targets.npy'), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+
+    def lookup(self, labels, namespace='Any'):
+        '''
+        Look up BioCyc ids for all `labels` in a single pass.
+
+        :param labels: Sequence of names or identifiers
+        :param namespace: Namespace to search, one of 'Any', 'Compound', 'Gene', 'Protein' or a mapping table namespace (e.g. 'HMDB')
+        :rtype: numpy.ndarray of BioCyc ids (str), None where not found
+        '''
+        query = _keys(namespace, labels)
+        result = np.empty(len(query), dtype=object)
+        if len(query) == 0 or len(self.keys) == 0:
+            return result
+
+        pos = np.searchsorted(self.keys, query)
+        pos[pos == len(self.keys)] = 0
+        found = self.keys[pos] == query
+
+        result[found] = [i.decode('utf-8') for i in self.ids[self.targets[pos[found]]]]
+        return result
+
+
+def open_identifier_index(cache_path, database_path, tables_path):
+    '''
+    Open the identifier index stored under `cache_path`, building it first if it is missing or
+    out of date with the source files.
+
+    :param cache_path: Folder to store indexes in
+    :param database_path: Path to the bundled database folder
+    :param tables_path: Path to the folder holding the mapping tables
+    :rtype: IdentifierIndex
+    '''
+    key = sources_key(identifier_sources(database_path, tables_path), INDEX_VERSION)
+    path = os.path.join(cache_path, 'identifiers-%s' % key)
+    if not os.path.exists(path):
+        build_identifier_index(path, database_path, tables_path)
+
+    return IdentifierIndex(path)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+'''
+Offline KEGG pathway map colouring.
+
+KEGG maps are drawn from a local library of KGML (node positions) and base images, filled
+from the KEGG REST API the first time a map is used. Node colours are composited onto the
+base image as an SVG overlay in-process, so colouring needs no network once a map is held
+and can run in batch.
+'''
+from __future__ import unicode_literals
+
+import os
+import re
+import base64
+import struct
+
+from .entities import LRUCache
+
+try:
+    import xml.etree.cElementTree as et
+except ImportError:
+    import xml.etree.ElementTree as et
+
+KEGG_REST_URL = 'http://rest.kegg.jp/'
+
+_maps_cache = LRUCache(32)
+
+
+class KEGGMapLibrary(object):
+    '''
+    Local store of KEGG pathway maps: <id>.kgml and <id>.png for each map.
+
+    :param path: Folder holding the maps; files can be placed here directly for offline use
+    :param server: Base URL of the KEGG REST API
+    :param online: Fetch maps not in the library from the server
+    '''
+
+    def __init__(self, path, server=KEGG_REST_URL, online=True):
+        self.path = path
+        self.server = server or KEGG_REST_URL
+        self.online = online
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _file(self, pathway_id, kind, ext):
+        filename = os.path.join(self.path, '%s.%s' % (pathway_id, ext))
+        if not os.path.exists(filename):
+            if not self.online:
+                raise Exception("KEGG map %s is not in the library (offline)" % pathway_id)
+
+            import requests
+            r = requests.get('%sget/%s/%s' % (self.server.rstrip('/') + '/', pathway_id, kind))
+            if r.status_code != 200:
+                raise Exception("Error loading %s for %s from KEGG (%d)" % (kind, pathway_id, r.status_code))
+
+            tmp = '%s.%d.tmp' % (filename, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(r.content)
+            os.rename(tmp, filename)
+
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def get(self, pathway_id):
+        '''
+        Return the parsed map for a pathway, loading (and if needed fetching) it once per process.
+
+        :param pathway_id: KEGG pathway id e.g. hsa00010
+        :rtype: KEGGMap
+        '''
+        m = _maps_cache.get(pathway_id)
+        if m is None:
+            m = KEGGMap(self._file(pathway_id, 'kgml', 'kgml'), self._file(pathway_id, 'image', 'png'))
+            _maps_cache.put(pathway_id, m)
+        return m
+
+
+def png_size(png):
+    '''
+    Return the (width, height) of a PNG image from its header.
+    '''
+    return struct.unpack('>II', png[16:24])
+
+
+class KEGGMap(object):
+    '''
+    A parsed KEGG map: the base image and the graphics of each compound and gene node.
+
+    :param kgml: KGML document
+    :param png: Base image
+    '''
+
+    def __init__(self, kgml, png):
+        tree = et.fromstring(kgml)
+        self.name = tree.get('name')
+        self.title = tree.get('title')
+        self.png = png
+        self.width, self.height = png_size(png)
+
+        # Nodes as (KEGG ids, type, shape, x, y, width, height); x, y are the centre
+        self.nodes = []
+        for entry in tree.iterfind('entry'):
+            g = entry.find('graphics')
+            if g is None or entry.get('type') not in ('compound', 'gene'):
+                continue
+
+            self.nodes.append((
+                entry.get('name', '').split(),
+                entry.get('type'),
+                g.get('type'),
+                float(g.get('x', 0)), float(g.get('y', 0)),
+                float(g.get('width', 0)), float(g.get('height', 0)),
+            ))
+
+    def render(self, node_colors, opacity=0.7):
+        '''
+        Render the map as SVG with coloured nodes.
+
+        :param node_colors: dict of KEGG id (e.g. cpd:C00031, hsa:3098) to hex colour
+        :param opacity: Opacity of the colour overlay; the base labels show through
+        :rtype: str
+        '''
+        shapes = []
+        for ids, ntype, shape, x, y, w, h in self.nodes:
+            color = next((node_colors[i] for i in ids if i in node_colors), None)
+            if color is None:
+                continue
+
+            title = ' '.join(ids)
+            if shape == 'circle':
+                shapes.append('<circle cx="%.1f" cy="%.1f" r="%.1f" fill="%s"><title>%s</title></circle>' % (x, y, max(w, h) / 2, color, title))
+            else:
+                shapes.append('<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" fill="%s"><title>%s</title></rect>' % (x - w / 2, y - h / 2, w, h, color, title))
+
+        return '''<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{w}" height="{h}" viewBox="0 0 {w} {h}">
+<image x="0" y="0" width="{w}" height="{h}" xlink:href="data:image/png;base64,{png}"/>
+<g fill-opacity="{opacity}">
+{shapes}
+</g>
+</svg>'''.format(w=self.width, h=self.height, png=base64.b64encode(self.png).decode('ascii'), opacity=opacity, shapes='\n'.join(shapes))
+
+
+def kegg_organism(pathway_id):
+    '''
+    Return the organism code of a pathway id, e.g. hsa for hsa00010.
+    '''
+    m = re.match(r'^([a-z]+)\d+$', pathway_id)
+    return m.group(1) if m else 'map'
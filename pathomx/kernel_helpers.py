@@ -4,6 +4,16 @@ import numpy as np
 import pandas as pd
 import re
 import io
+import json
+import hashlib
+import shutil
+import tempfile
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from matplotlib.figure import Figure, AxesStack
 from matplotlib.axes import Subplot
@@ -12,6 +22,7 @@ from mplstyler import StylesManager
 
 import warnings
 from . import displayobjects
+from .profiler import estimate_size, peak_memory
 from .utils import scriptdir, basedir
 from IPython.core import display
 from copy import deepcopy
@@ -45,6 +56,8 @@ class PathomxTool(object):
 
 
 def pathomx_notebook_start(varsi, vars):
+    # Timings of this run, returned with the outputs (see profiler.JobProfile)
+    profile = {'start_begin': time.time()}
 
     for k, v in varsi.items():
         vars[k] = v
@@ -70,8 +83,14 @@ def pathomx_notebook_start(varsi, vars):
             for k, v in vars['rcParams'].items():
                 rcParams[k] = v
 
+    profile['start_end'] = time.time()
+    vars['_pathomx_profile'] = profile
+
 
 def pathomx_notebook_stop(vars):
+    profile = vars.get('_pathomx_profile', {})
+    profile['stop_begin'] = time.time()
+
     varso = {}
     if '_io' in vars:
         # Handle IO magic
@@ -98,8 +117,76 @@ def pathomx_notebook_stop(vars):
                     else:
                         varso[k] = displayobjects.Html(v)
 
+    profile['output_bytes'] = estimate_size(varso)
+    profile['peak_memory'] = peak_memory()
+    profile['stop_end'] = time.time()
+    varso['_pathomx_profile'] = profile
+
     vars['varso'] = varso
 
+
+def pathomx_profile_code(code, vars, filename='<tool>', limit=25):
+    ''' Run tool code under cProfile, and line_profiler if installed, returning an Html report
+        of the hottest lines of the script and the cumulative time spent in each function '''
+    import cProfile
+    import pstats
+    import types
+    from xml.sax.saxutils import escape
+
+    try:
+        # Apply IPython syntax transformations (magics etc.) as the kernel would
+        code = get_ipython().input_transformer_manager.transform_cell(code)
+    except Exception:
+        pass
+
+    # Module-level code run as a function (on the tool namespace) so line_profiler can trace it
+    run = types.FunctionType(compile(code, filename, 'exec'), vars)
+
+    try:
+        from line_profiler import LineProfiler
+    except ImportError:
+        line_profiler = None
+    else:
+        line_profiler = LineProfiler(run)
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        if line_profiler:
+            line_profiler.runcall(run)
+        else:
+            run()
+    finally:
+        profile.disable()
+
+    html = []
+
+    # Hot lines of the script
+    html.append('<h3>Lines</h3>')
+    if line_profiler:
+        stats = line_profiler.get_stats()
+        timings = [t for k, v in stats.timings.items() if k[0] == filename for t in v]
+        total = sum(t for l, n, t in timings) or 1
+        source = code.split('\n')
+        html.append('<table><tr><th>Line</th><th>Hits</th><th>Time (s)</th><th>%</th><th>Code</th></tr>')
+        for lineno, nhits, t in sorted(timings, key=lambda x: -x[2])[:limit]:
+            html.append('<tr><td>%d</td><td>%d</td><td>%.4f</td><td>%.1f</td><td><pre>%s</pre></td></tr>' % (
+                lineno, nhits, t * stats.unit, 100. * t / total, escape(source[lineno - 1].strip()) if lineno <= len(source) else ''))
+        html.append('</table>')
+    else:
+        html.append('<p>Install line_profiler for line-level timings.</p>')
+
+    # Cumulative function timings
+    stats = pstats.Stats(profile).stats
+    html.append('<h3>Functions</h3>')
+    html.append('<table><tr><th>Calls</th><th>Own time (s)</th><th>Cumulative (s)</th><th>Function</th></tr>')
+    for (fn, lineno, func), (cc, nc, tt, ct, callers) in sorted(stats.items(), key=lambda x: -x[1][3])[:limit]:
+        html.append('<tr><td>%d</td><td>%.4f</td><td>%.4f</td><td>%s</td></tr>' % (
+            nc, tt, ct, escape('%s:%d(%s)' % (os.path.basename(fn), lineno, func))))
+    html.append('</table>')
+
+    return displayobjects.Html('\n'.join(html))
+
     
 def progress(progress):
     ''' Output the current progress to stdout on the remote core
@@ -125,3 +212,55 @@ class open_with_progress(io.IOBase):
         if prg != self._progress:
             self._progress = prg
             progress(prg)
+
+
+def dataframe_cache_key(filename, *args):
+    ''' Generate a cache key for data loaded from a file; keyed by the file path, modification
+        time and size, plus any additional (JSON serialisable) arguments e.g. the tool config '''
+    st = os.stat(filename)
+    key = json.dumps([os.path.abspath(filename), st.st_mtime, st.st_size] + list(args), sort_keys=True, default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def load_dataframe_cache(path, key):
+    ''' Load a DataFrame stored with save_dataframe_cache, or return None if not available.
+        The values are memory-mapped (copy-on-write) so loading is near-instant regardless of size '''
+    cache_path = os.path.join(path, key)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        values = np.load(os.path.join(cache_path, 'values.npy'), mmap_mode='c')
+        with open(os.path.join(cache_path, 'axes.pickle'), 'rb') as f:
+            index, columns = pickle.load(f)
+    except Exception as e:
+        # Unusable entry; remove it so it is replaced by the next save
+        warnings.warn("Discarding unreadable cache entry %s: %s" % (key, e))
+        shutil.rmtree(cache_path, ignore_errors=True)
+        return None
+
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+def save_dataframe_cache(path, key, df):
+    ''' Store a (homogeneous, numeric) DataFrame as a binary cache entry: raw values plus the pickled axes '''
+    cache_path = os.path.join(path, key)
+    if os.path.exists(cache_path):
+        return
+
+    values = np.ascontiguousarray(df.values)
+    if values.dtype.hasobject:
+        raise ValueError("Only numeric DataFrames can be cached; object values can't be memory-mapped")
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    # Write to a temporary folder first so a partially written entry is never loaded
+    tmp_path = tempfile.mkdtemp(dir=path)
+    try:
+        np.save(os.path.join(tmp_path, 'values.npy'), values, allow_pickle=False)
+        with open(os.path.join(tmp_path, 'axes.pickle'), 'wb') as f:
+            pickle.dump((df.index, df.columns), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Memory budget for tool results.
+
+Results of every tool are held in memory for use downstream and in the views. The
+MemoryManager tracks the size of the results held by each tool and, when the total exceeds
+the budget, spills the results of the least recently used tools to compressed files in a
+SpillStore. Spilled results are replaced by Deferred placeholders (see workspace), read back
+from the file on first use.
+
+Tools taking part implement resident_bytes() and spill(store). This module has no Qt dependency.
+'''
+from __future__ import unicode_literals
+
+import os
+import shutil
+import zipfile
+import tempfile
+import logging
+import uuid
+
+from .workspace import Deferred, DeferredDict, _entry_format, _write_entry, _read_entry
+from .profiler import estimate_size
+
+# Results smaller than this are kept in memory; not worth the round trip
+SPILL_MIN_BYTES = 1024 * 1024
+
+
+def resident_size(*results):
+    '''
+    Return the size in bytes of the values held in memory in result dicts, without loading
+    any Deferred values. Values in more than one dict are counted once.
+    '''
+    seen = set()
+    size = 0
+    for r in results:
+        if not r:
+            continue
+
+        for value in dict.values(r):
+            if isinstance(value, Deferred):
+                if not value.is_loaded:
+                    continue
+                value = value.load()
+
+            if id(value) not in seen:
+                seen.add(id(value))
+                size += estimate_size(value)
+
+    return size
+
+
+class SpillStore(object):
+    '''
+    Folder of compressed files holding spilled results; one file per spill.
+
+    :param path: Folder to use; a temporary folder (removed on close) if None
+    '''
+
+    def __init__(self, path=None):
+        self.is_temporary = path is None
+        self.path = tempfile.mkdtemp(prefix='pathomx-spill-') if path is None else path
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def spill(self, results, min_bytes=SPILL_MIN_BYTES):
+        '''
+        Write the large values of a result dict to a file.
+
+        Values already stored in a file (loaded from a workspace or an earlier spill) are not
+        written again; the placeholder is renewed, dropping the loaded value.
+
+        :param results: dict of result values
+        :param min_bytes: Values smaller than this are kept in memory
+        :return: (DeferredDict of the results, name of the file written or None)
+        '''
+        spilled = DeferredDict()
+        filename = os.path.join(self.path, '%s.zip' % uuid.uuid4().hex)
+        written = False
+
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED, True) as z:
+            for n, (name, value) in enumerate(dict.items(results)):
+                if isinstance(value, Deferred):
+                    if value.is_loaded and value.loader == _read_entry:
+                        value = Deferred(value.loader, *value.args, shape=getattr(value, 'shape', None))
+                    spilled[name] = value
+                    continue
+
+                if value is None or estimate_size(value) < min_bytes:
+                    spilled[name] = value
+                    continue
+
+                prefix = 'results/%d' % n
+                fmt = _entry_format(value)
+                try:
+                    _write_entry(z, prefix, value, fmt, self.path)
+                except Exception as e:
+                    logging.warning("Could not spill %s: %s" % (name, e))
+                    spilled[name] = value
+                else:
+                    spilled[name] = Deferred(_read_entry, filename, prefix, fmt, shape=getattr(value, 'shape', None))
+                    written = True
+
+        if not written:
+            os.remove(filename)
+            return spilled, None
+
+        return spilled, filename
+
+    def release(self, filename, *results):
+        '''
+        Remove a spill file, unless values in the given result dicts are still to be read from it.
+
+        :return: True if the file was removed
+        '''
+        for r in results:
+            for value in dict.values(r or {}):
+                if isinstance(value, Deferred) and not value.is_loaded and value.args[:1] == (filename,):
+                    return False
+
+        if os.path.exists(filename):
+            os.remove(filename)
+        return True
+
+    def close(self):
+        if self.is_temporary:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class MemoryManager(object):
+    '''
+    Keeps the results held in memory within a budget by spilling the least recently used.
+
+    :param settings: Settings manager; the budget in MB is read from Memory/Budget (0 for none)
+    :param store: SpillStore to write to; a temporary one if None
+    '''
+
+    def __init__(self, settings=None, store=None):
+        self.settings = settings
+        self.store = store if store is not None else SpillStore()
+        self.holders = []  # Least recently used first
+
+    @property
+    def budget(self):
+        '''
+        Budget in bytes, 0 for none.
+        '''
+        mb = self.settings.get('Memory/Budget') if self.settings is not None else 0
+        return int(mb or 0) * 1024 * 1024
+
+    def touch(self, holder):
+        '''
+        Mark the results of a holder as used; adds the holder if not already tracked.
+        '''
+        if holder in self.holders:
+            self.holders.remove(holder)
+        self.holders.append(holder)
+
+    def remove(self, holder):
+        if holder in self.holders:
+            self.holders.remove(holder)
+
+    def usage(self):
+        '''
+        Bytes held in memory by each holder, as a list of (holder, bytes); least recently used first.
+        '''
+        return [(h, h.resident_bytes()) for h in self.holders]
+
+    def enforce(self, keep=()):
+        '''
+        Spill the results of the least recently used holders until within the budget.
+
+        :param keep: Holders not to spill, e.g. the tool being viewed
+        :return: Bytes held in memory after spilling
+        '''
+        usage = self.usage()
+        total = sum(size for h, size in usage)
+        budget = self.budget
+        if not budget or total <= budget:
+            return total
+
+        for holder, size in usage:
+            if total <= budget:
+                break
+
+            if holder in keep or size < SPILL_MIN_BYTES:
+                continue
+
+            holder.spill(self.store)
+            freed = size - holder.resident_bytes()
+            total -= freed
+            logging.info("Spilled %.1f MB of results to disk; %.1f MB held" % (freed / 1048576., total / 1048576.))
+
+        return total
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+'''
+Pathway (and reaction) mining on a sparse segment x entity incidence matrix.
+
+The incidence matrix is built once from the reactions of the bundled database and cached on
+disk. Scores for every sample are then a single sparse matrix product of the incidence matrix
+with the (transformed) data, rather than a walk over the pathways of each entity in turn.
+'''
+from __future__ import division
+
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+from .identifiers import sources_key
+
+TARGET_PATHWAYS = 0
+TARGET_REACTIONS = 1
+
+# Reactions table columns: id, name, left, right, left (secondary), right (secondary), enzymes, direction, pathways
+REACTION_COMPOUND_COLUMNS = [2, 3]
+REACTION_ENZYME_COLUMN = 6
+REACTION_PATHWAY_COLUMN = 8
+
+INCIDENCE_VERSION = 1
+
+
+def _split(s):
+    return [v for v in s.split('|') if v]
+
+
+class Incidence(object):
+    '''
+    Binary segment x entity incidence matrix, with the size (number of reactions) of each segment.
+
+    :param segments: Segment (pathway or reaction) ids, one per row
+    :param entities: Entity ids, one per column
+    :param matrix: scipy.sparse matrix segments x entities
+    :param sizes: Number of reactions in each segment
+    '''
+
+    def __init__(self, segments, entities, matrix, sizes):
+        self.segments = np.asarray(segments, dtype=object)
+        self.entities = np.asarray(entities, dtype=object)
+        self.matrix = sps.csr_matrix(matrix, dtype=np.float64)
+        self.sizes = np.asarray(sizes, dtype=np.float64)
+        self._segment_idx = {s: n for n, s in enumerate(self.segments)}
+        self._entity_idx = {e: n for n, e in enumerate(self.entities)}
+
+    @classmethod
+    def from_pairs(cls, pairs, sizes=None):
+        '''
+        Build from (segment, entity) pairs; duplicate pairs are counted once.
+
+        :param pairs: List of (segment id, entity id) tuples
+        :param sizes: Dict of segment sizes; segments not in it have size 1
+        '''
+        pairs = list(set(pairs))
+        if not pairs:
+            return cls([], [], sps.csr_matrix((0, 0)), [])
+
+        segment_ids, entity_ids = zip(*pairs)
+        rows, segments = pd.factorize(pd.Series(segment_ids, dtype=object))
+        cols, entities = pd.factorize(pd.Series(entity_ids, dtype=object))
+        matrix = sps.coo_matrix((np.ones(len(pairs)), (rows, cols)), shape=(len(segments), len(entities)))
+
+        sizes = sizes or {}
+        return cls(segments, entities, matrix, [sizes.get(s, 1) for s in segments])
+
+    def extend(self, objects, target=TARGET_PATHWAYS):
+        '''
+        Return a new Incidence with any objects not already present added from their own
+        `pathways` (or `reactions`) attributes, e.g. BioCyc objects fetched from outside the
+        bundled database.
+
+        :param objects: List of entity objects
+        :param target: TARGET_PATHWAYS or TARGET_REACTIONS
+        :rtype: Incidence
+        '''
+        attr = 'pathways' if target == TARGET_PATHWAYS else 'reactions'
+        pairs, sizes = [], {}
+        for o in objects:
+            if o is None or o.id in self._entity_idx:
+                continue
+
+            for s in getattr(o, attr, None) or []:
+                pairs.append((s.id, o.id))
+                if s.id not in self._segment_idx:
+                    sizes[s.id] = len(getattr(s, 'reactions', None) or []) or 1
+
+        if not pairs:
+            return self
+
+        coo = self.matrix.tocoo()
+        pairs.extend(zip(self.segments[coo.row], self.entities[coo.col]))
+        sizes.update(zip(self.segments, self.sizes))
+        return Incidence.from_pairs(pairs, sizes)
+
+    def columns_for(self, entity_ids):
+        '''
+        Return the column index for each entity id, or -1 where not present.
+        '''
+        return np.array([self._entity_idx.get(e, -1) for e in entity_ids], dtype=np.intp)
+
+    def save(self, filename):
+        csr = self.matrix
+        np.savez(filename, data=csr.data, indices=csr.indices, indptr=csr.indptr, shape=csr.shape,
+                 segments=self.segments.astype('U'), entities=self.entities.astype('U'), sizes=self.sizes)
+
+    @classmethod
+    def load(cls, filename):
+        f = np.load(filename)
+        matrix = sps.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+        return cls(f['segments'].astype(object), f['entities'].astype(object), matrix, f['sizes'])
+
+
+def build_incidence(database_path, target=TARGET_PATHWAYS):
+    '''
+    Build the incidence matrix from the reactions of the bundled database. Pathways are linked to
+    the primary compounds, enzymes and enzyme genes of their reactions; reactions to their own.
+
+    :param database_path: Path to the bundled database folder
+    :param target: TARGET_PATHWAYS or TARGET_REACTIONS
+    :rtype: Incidence
+    '''
+    reactions = pd.read_csv(os.path.join(database_path, 'reactions'), header=None, dtype=str, keep_default_na=False).values
+    proteins = pd.read_csv(os.path.join(database_path, 'proteins'), header=None, dtype=str, keep_default_na=False).values
+    genes = {r[0]: r[2] for r in proteins if r[2]}
+
+    pairs, sizes = [], {}
+    for r in reactions:
+        entities = []
+        for c in REACTION_COMPOUND_COLUMNS:
+            entities.extend(_split(r[c]))
+        for enzyme in _split(r[REACTION_ENZYME_COLUMN]):
+            entities.append(enzyme)
+            if enzyme in genes:
+                entities.append(genes[enzyme])
+
+        if target == TARGET_PATHWAYS:
+            segments = _split(r[REACTION_PATHWAY_COLUMN])
+            for s in segments:
+                sizes[s] = sizes.get(s, 0) + 1
+        else:
+            segments = [r[0]]
+
+        pairs.extend((s, e) for s in segments for e in entities)
+
+    return Incidence.from_pairs(pairs, sizes)
+
+
+def load_incidence(cache_path, database_path, target=TARGET_PATHWAYS):
+    '''
+    Load the incidence matrix for `target` from `cache_path`, building and storing it first if
+    it is missing or out of date with the bundled database.
+
+    :param cache_path: Folder to store the matrix in
+    :param database_path: Path to the bundled database folder
+    :param target: TARGET_PATHWAYS or TARGET_REACTIONS
+    :rtype: Incidence
+    '''
+    sources = [os.path.join(database_path, 'reactions'), os.path.join(database_path, 'proteins')]
+    filename = os.path.join(cache_path, 'incidence-%s.npz' % sources_key(sources, INCIDENCE_VERSION, target))
+
+    if os.path.exists(filename):
+        try:
+            return Incidence.load(filename)
+        except Exception:
+            pass
+
+    incidence = build_incidence(database_path, target)
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+    incidence.save(filename)
+    return incidence
+
+
+def score(incidence, data, entity_ids, algorithm='c', shared=True, relative=False):
+    '''
+    Score every segment for every sample (row) of `data` at once.
+
+    Scoring follows pathminer: the score of each entity is transformed by `algorithm` ('c' absolute
+    change, 'u' up-regulation, 'd' down-regulation, 'm' number of entities with data, 't' overall
+    tendency) and summed over the segments it belongs to. Missing values do not contribute.
+
+    :param incidence: The segment x entity incidence
+    :type incidence: Incidence
+    :param data: samples x variables values
+    :type data: numpy.ndarray
+    :param entity_ids: Entity id of each variable (column) of `data`, None for unmapped
+    :param algorithm: Scoring algorithm code
+    :param shared: Share each entity's score between the segments it belongs to
+    :param relative: Divide scores by the size (number of reactions) of each segment
+    :rtype: numpy.ndarray samples x segments
+    '''
+    data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+    cols = incidence.columns_for(entity_ids)
+    present = cols >= 0
+
+    a = incidence.matrix[:, cols[present]]
+    x = data[:, present]
+
+    values = {
+        'c': lambda x: np.abs(x),
+        'u': lambda x: np.maximum(0, x),
+        'd': lambda x: np.abs(np.minimum(0, x)),
+        'm': lambda x: (~np.isnan(x)).astype(np.float64),
+        't': lambda x: x,
+    }[algorithm](x)
+    values[np.isnan(values)] = 0
+
+    if shared and algorithm != 'm':
+        with np.errstate(divide='ignore'):
+            n_segments = np.asarray(a.sum(axis=0)).ravel()
+            values = values * np.where(n_segments > 0, 1. / n_segments, 0)
+
+    scores = np.asarray(a.dot(values.T)).T
+
+    if algorithm == 't':
+        scores = np.abs(scores)
+
+    if relative:
+        scores = scores / incidence.sizes
+
+    return scores
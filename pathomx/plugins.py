@@ -10,7 +10,6 @@ from yapsy.IPlugin import IPlugin
 from yapsy.PluginManager import PluginManagerSingleton
 
 from distutils.version import StrictVersion
-from collections import defaultdict
 
 import re
 import requests
@@ -18,6 +17,8 @@ import hashlib
 import os
 import inspect
 import shutil
+import json
+import sys
 from . import utils
 from . import ui
 from .globals import settings, app_launchers, file_handlers, url_handlers, available_tools_by_category, \
@@ -31,9 +32,203 @@ from .translate import tr
 from pyqtconfig import ConfigManager
 
 
-def get_available_plugins(plugin_places=None, include_deactivated=False):
-    global available_tools_by_category
+PLUGIN_MANIFEST_VERSION = 1
 
+
+def plugin_manifest_path():
+    return os.path.join(QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0], 'plugin-manifest.json')
+
+
+def plugin_places_signature(plugin_places):
+    '''
+    Return a signature of the plugin folders: the modification time of every plugin info file and
+    Python module found under them. Adding, removing, (de)activating or editing a plugin changes it.
+    Folder mtimes are not used directly as writing bytecode caches would change them.
+    '''
+    signature = []
+    for place in plugin_places:
+        for path, dirs, files in os.walk(place):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for fn in sorted(files):
+                if fn.endswith('.py') or '.pathomx-plugin' in fn:
+                    filename = os.path.join(path, fn)
+                    signature.append([filename, os.path.getmtime(filename)])
+    return signature
+
+
+def read_plugin_manifest(signature):
+    '''
+    Return the plugins listed in the stored manifest, or None if there is no manifest or it was
+    written for a different set of plugin files.
+    '''
+    try:
+        with open(plugin_manifest_path(), 'r') as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if manifest.get('version') != PLUGIN_MANIFEST_VERSION or \
+       manifest.get('python') != sys.version_info[0] or \
+       manifest.get('signature') != signature:
+        return None
+
+    return manifest['plugins']
+
+
+def write_plugin_manifest(signature, plugin_objects):
+    '''
+    Store the metadata and tools of the loaded plugins, so the next start can build the
+    toolbox without importing any plugin code.
+    '''
+    plugins = []
+    for plugin in plugin_objects:
+        metadata = dict((k, v) for k, v in plugin.metadata.items() if k != 'info')
+        metadata['version'] = str(metadata['version'])
+        metadata['category'] = plugin.default_workspace_category
+        metadata['tools'] = plugin.tool_launchers
+        metadata['file_handlers'] = plugin.file_handler_launchers
+        plugins.append(metadata)
+
+    filename = plugin_manifest_path()
+    utils.mkdir_p(os.path.dirname(filename))
+    try:
+        with open(filename, 'w') as f:
+            json.dump({
+                'version': PLUGIN_MANIFEST_VERSION,
+                'python': sys.version_info[0],
+                'signature': signature,
+                'plugins': plugins,
+            }, f)
+    except (IOError, OSError):
+        logging.warning("Could not write plugin manifest %s" % filename)
+
+
+def _import_source(name, filename):
+    try:
+        import importlib.util
+    except ImportError:  # Python 2
+        import imp
+        return imp.load_source(name, filename)
+
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_plugin(metadata):
+    '''
+    Import a plugin module and set up its plugin object, registering its tools.
+
+    :param metadata: Plugin metadata, as held in plugin_metadata
+    :rtype: BasePlugin
+    '''
+    logging.info("Loading plugin %s..." % metadata['name'])
+
+    filename = os.path.join(metadata['path'], metadata['module'])
+    if os.path.isdir(filename):
+        filename = os.path.join(filename, '__init__.py')
+    else:
+        filename += '.py'
+
+    module = _import_source('pathomx_plugin_%s' % metadata['shortname'], filename)
+    for obj in vars(module).values():
+        if inspect.isclass(obj) and issubclass(obj, BasePlugin) and obj.__module__ == module.__name__:
+            plugin = obj()
+            installed_plugin_names[id(plugin)] = metadata['name']
+            plugin.post_setup(path=metadata['path'], name=metadata['name'], metadata=metadata)
+            return plugin
+
+    raise Exception("No plugin found in %s" % filename)
+
+
+class LazyPlugin(object):
+    '''
+    Stand-in for a plugin listed in the manifest whose code has not been imported yet.
+
+    Holds what is needed to build the toolbox; the plugin is imported by `load`, the first time
+    one of its tools is created.
+    '''
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.id = metadata['id']
+        self.name = metadata['name']
+        self.path = metadata['path']
+        self.default_workspace_category = metadata['category']
+        self.plugin_object = None
+
+    def load(self):
+        if self.plugin_object is None:
+            self.plugin_object = load_plugin(self.metadata)
+        return self.plugin_object
+
+
+class LazyToolLauncher(object):
+    '''
+    Launcher for a tool of a plugin that has not been imported yet. Calling it loads the plugin,
+    which replaces this launcher with the real tool, then creates the tool.
+
+    :param plugin: LazyPlugin providing the tool
+    :param registry: Launcher registry the key belongs to (app_launchers or file_handlers)
+    :param key: Key of the launcher in the registry
+    '''
+
+    def __init__(self, plugin, registry, key, name=None, icon=None):
+        self.plugin = plugin
+        self.registry = registry
+        self.key = key
+        self.__name__ = key.split('.')[-1]
+        self.icon = icon
+        if name is not None:
+            self.name = name
+
+    def __call__(self, *args, **kwargs):
+        self.plugin.load()
+        launcher = self.registry.get(self.key)
+        if launcher is None or launcher is self:
+            raise Exception("Plugin %s no longer provides %s; rebuild the toolbox" % (self.plugin.name, self.key))
+        return launcher(*args, **kwargs)
+
+
+def register_lazy_plugin(metadata):
+    '''
+    Register the tools of a plugin from its manifest entry, without importing the plugin.
+    '''
+    metadata = dict(metadata, info=None)
+    plugin = LazyPlugin(metadata)
+
+    plugin_metadata[metadata['shortname']] = metadata
+    installed_plugin_names[id(plugin)] = metadata['name']
+
+    for tool in metadata['tools']:
+        launcher = LazyToolLauncher(plugin, app_launchers, tool['id'], tool['name'], tool['icon'])
+        app_launchers[tool['id']] = launcher
+        available_tools_by_category[tool['category']].append({
+            'id': tool['id'],
+            'app': launcher,
+            'plugin': plugin,
+        })
+
+        for lkey in tool['legacy_launchers']:
+            app_launchers[lkey] = LazyToolLauncher(plugin, app_launchers, lkey)
+
+    for ext in metadata['file_handlers']:
+        file_handlers[ext] = LazyToolLauncher(plugin, file_handlers, ext)
+
+
+def get_available_plugins(plugin_places=None, include_deactivated=False, use_manifest=True):
+    '''
+    Find the available plugins and register their tools.
+
+    If the plugin files are unchanged since the manifest was written the plugins are registered
+    from the manifest and only imported when first used; otherwise every plugin is imported
+    and the manifest rewritten.
+
+    :param plugin_places: Folders to search, in addition to the core plugins
+    :param use_manifest: Use the stored manifest if it is up to date
+    '''
     if plugin_places is None:
         plugin_places = settings.get('Plugins/Paths')[:]
 
@@ -47,6 +242,17 @@ def get_available_plugins(plugin_places=None, include_deactivated=False):
     if '' in plugin_places:
         plugin_places.remove('')  # Strip the empty string
 
+    # Cleared in place; the toolbox holds a reference
+    available_tools_by_category.clear()
+
+    signature = plugin_places_signature(plugin_places)
+    manifest = read_plugin_manifest(signature) if use_manifest else None
+    if manifest is not None:
+        logging.info("Loading plugins from manifest...")
+        for metadata in manifest:
+            register_lazy_plugin(metadata)
+        return
+
     logging.info("Searching for plugins...")
 
     plugin_manager.setPluginPlaces(plugin_places)
@@ -64,8 +270,6 @@ def get_available_plugins(plugin_places=None, include_deactivated=False):
     plugin_manager.setCategoriesFilter(categories_filter)
     plugin_manager.collectPlugins()
 
-    available_tools_by_category = defaultdict(list)
-
     # A list of the packages required for all found plugins (when to install?; via pip)
     # pip is available since 2.7.9 via ensurepip (and/or we can package)
     required_packages_all = set()
@@ -110,6 +314,8 @@ def get_available_plugins(plugin_places=None, include_deactivated=False):
 
         plugin.plugin_object.post_setup(path=os.path.dirname(plugin.path), name=plugin.name, metadata=metadata)
 
+    write_plugin_manifest(signature, [p.plugin_object for p in plugin_manager.getAllPlugins()])
+
     # Check and import all packages
     # for pkg_ver in required_packages_all:
     #    pip.main(['install', pkg_ver, '--upgrade'])
@@ -215,7 +421,7 @@ class dialogPluginManagement(ui.GenericDialog):
         self.populate_plugin_list()
 
     def onRefresh(self):
-        get_available_plugins(self.config.get('Plugins/Paths')[:], include_deactivated=True)
+        get_available_plugins(self.config.get('Plugins/Paths')[:], include_deactivated=True, use_manifest=False)
         self.populate_plugin_list()
 
     def __init__(self, parent, **kwargs):
@@ -302,6 +508,10 @@ class BasePlugin(IPlugin):
         self.id = type(self).__name__  # self.__module__
         self.module = self.__module__
         plugin_objects[self.id] = self
+
+        # Registered tools and file handlers, as stored in the plugin manifest
+        self.tool_launchers = []
+        self.file_handler_launchers = []
         #self.name = "%s %s " % (self.default_workspace_category, "Plugin")
 
     def post_setup(self, path=None, name=None, metadata={}):  # Post setup hook
@@ -363,18 +573,33 @@ class BasePlugin(IPlugin):
         if workspace_category is None:
             workspace_category = self.default_workspace_category
 
-        available_tools_by_category[workspace_category].append({
+        self.tool_launchers.append({
             'id': key,
-            'app': tool,
-            'plugin': self,
+            'name': getattr(tool, 'name', None),
+            'icon': tool.icon,
+            'category': workspace_category,
+            'legacy_launchers': list(tool.legacy_launchers),
         })
 
-        # Support legacy app launchers (so moving apps between plugins doesn't kill them)
+        # A plugin loaded on first use replaces its manifest entry; the toolbox holds the entry
+        for entry in available_tools_by_category[workspace_category]:
+            if entry['id'] == key:
+                entry.update({'app': tool, 'plugin': self})
+                break
+        else:
+            available_tools_by_category[workspace_category].append({
+                'id': key,
+                'app': tool,
+                'plugin': self,
+            })
+
+        # Support legacy app launchers (so moving apps between plugins doesn't kill them)
         for lkey in tool.legacy_launchers:
             app_launchers[lkey] = tool
 
     def register_file_handler(self, app, ext):
         file_handlers[ext] = app
+        self.file_handler_launchers.append(ext)
 
     def register_url_handler(self, url_handler):
         url_handlers[self.id].append(url_handler)
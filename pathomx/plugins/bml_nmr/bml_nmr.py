@@ -1,17 +1,10 @@
 import pandas as pd
 import numpy as np
 
-import tempfile
 import zipfile
-import os
-import csv
-
-# Unzip into temporary folder
-folder = tempfile.mkdtemp()  # os.path.join( QDir.tempPath(),
-zf = zipfile.ZipFile(config['filename'])
-zf.extractall(folder)
-f = os.listdir(folder)
-bml_job = f[0]
+import io
+import re
+from multiprocessing.pool import ThreadPool
 
 fns = [
     ('samples_vs_concs_matrix.txt', 'raw'),
@@ -19,41 +12,55 @@ fns = [
     ('samples_vs_concs_matrix_pqnnorm.txt', 'pqn'),
 ]
 
-# We have the data folder; import each of the complete datasets in turn
-# non, PQN, TSA and label appropriately
-datasets = {}
-
-for fn, target in fns:
-    # Load the data file
-    data_path = os.path.join(folder, bml_job, 'overall_result_outputs', fn)
-
-    with open(data_path, 'rb') as f:
-        # Find initial line
-        cr = csv.reader(f, delimiter='\t')
-        for row in cr:
-            if len(row) > 0 and row[0] == 'metabolite':
-                sample_nos = row[1:-2]
-                break
-        else:
-            continue  # Escape to next file
-
-        num_of_samples = len(sample_nos)
-
-        # Pass the open f to read_csv to get the rest
-        # I hate MATLAB strings
-        dataset = pd.read_csv(f, header=None, index_col=[0], sep=r'\x00*\t+', converters={n + 1: np.float64 for n in range(num_of_samples)})
-        #dataset.convert_objects(convert_numeric=True)
-        # Bottom two columns are the metabolite id info, chop off
-        dataset = dataset.T
-        dataset = dataset[:-2]
-        dataset = dataset.astype(float)
-
-        # We've only got sample items, need to add a class column
-        sample_nos = [f.replace('(expno_', '').strip(')') for f in sample_nos]
-        dataset.index = pd.MultiIndex.from_tuples(zip(sample_nos, [''] * len(sample_nos)), names=['Sample', 'Class'])
-
-        vars()[target] = dataset
-        del dataset
+# Locate the result files within the zip (inside the job folder); read in place, no extraction
+with zipfile.ZipFile(config['filename']) as zf:
+    members = {}
+    for name in zf.namelist():
+        for fn, target in fns:
+            if name.endswith('overall_result_outputs/' + fn) and target not in members:
+                members[target] = name
+
+
+def load_matrix(member):
+    # Each thread uses its own handle; ZipFile objects are not safe to share for reading
+    with zipfile.ZipFile(config['filename']) as zf:
+        raw = zf.read(member)
+
+    # I hate MATLAB strings: drop the NUL padding and collapse runs of tabs so the C parser can take it
+    raw = re.sub(b'\t+', b'\t', raw.replace(b'\x00', b''))
+
+    # Find initial line
+    m = re.search(b'^metabolite\t[^\r\n]*', raw, re.MULTILINE)
+    if m is None:
+        return None
+
+    sample_nos = m.group(0).decode('latin-1').rstrip('\t').split('\t')[1:-2]
+    num_of_samples = len(sample_nos)
+
+    # Bottom two columns are the metabolite id info, don't parse them
+    dataset = pd.read_csv(io.BytesIO(raw[m.end():]), header=None, index_col=0, sep='\t', engine='c',
+                          usecols=list(range(num_of_samples + 1)),
+                          dtype={n + 1: np.float64 for n in range(num_of_samples)})
+    dataset = dataset.T
+
+    # We've only got sample items, need to add a class column
+    sample_nos = [s.replace('(expno_', '').strip(')') for s in sample_nos]
+    dataset.index = pd.MultiIndex.from_tuples(list(zip(sample_nos, [''] * len(sample_nos))), names=['Sample', 'Class'])
+    return dataset
+
+# We have the data files; import each of the complete datasets (non, PQN, TSA) at once
+targets = [target for fn, target in fns if target in members]
+pool = ThreadPool(len(targets) or 1)
+try:
+    datasets = dict(zip(targets, pool.map(load_matrix, [members[t] for t in targets])))
+finally:
+    pool.close()
+
+raw = datasets.get('raw')
+tsa = datasets.get('tsa')
+pqn = datasets.get('pqn')
+
+datasets = None
 
 # Generate simple result figure (using pathomx libs)
 from pathomx.figures import spectra
@@ -1,47 +1,35 @@
+import numpy as np
 import pandas as pd
 import re
-from collections import OrderedDict
 
-classes = [i[input_data.index.names.index('Class')] for i in input_data.index.values]
-samples = [i[input_data.index.names.index('Sample')] for i in input_data.index.values]
+# Work on the class codes; Class rules only need to touch the unique class values
+# (missing classes are kept as a value of their own, not given a -1 code)
+codes, classes = pd.factorize(input_data.index.get_level_values('Class'), use_na_sentinel=False)
+classes = np.array(classes, dtype=object)
+samples = pd.Index(input_data.index.get_level_values('Sample')).astype(str)
 
+# Rules apply in order, each to the classes as left by the rules before it
 for search, replace, match in config.get('filters'):
-    classes_f = []
+    search = re.compile(search)
 
     if match == 'Class' or match == 'None':
-
-        for c in classes:
-            print search, c
-            match = re.search(search, c)
-            if match:
-                classes_f.append(replace)
-            else:
-                classes_f.append(c)
+        is_match = pd.Index(classes).astype(str).str.contains(search) & pd.notnull(classes)
+        classes[is_match] = replace
 
     elif match == 'Sample':
-        for n, s in enumerate(samples):
-            match = re.search(search, str(s))
-            if match:
-                classes_f.append(replace)
-            else:
-                classes_f.append(classes[n])
-
-    classes = classes_f
-# Now have classes in a list; rebuild the MultiIndex using this replacement
+        is_match = samples.str.contains(search)
+        if is_match.any():
+            # The matched samples get a class value of their own, seen by later Class rules
+            classes = np.append(classes, replace)
+            codes[is_match] = len(classes) - 1
 
+# Now have the class for each code; rebuild the MultiIndex using this replacement
 output_data = input_data
 
-indexes = OrderedDict()
-for n, idx in enumerate(input_data.index.names):
-    indexes[idx] = input_data.index.levels[n]
-
-indexes['Class'] = classes
-
-# Build some tuples
-new_index_tuples = zip(*indexes.values())
-output_data.index = pd.MultiIndex.from_tuples(new_index_tuples, names=indexes.keys())
-
-output_data
+index = input_data.index
+output_data.index = pd.MultiIndex.from_arrays(
+    [classes[codes] if name == 'Class' else index.get_level_values(n) for n, name in enumerate(index.names)],
+    names=index.names)
 
 # Generate simple result figure (using pathomx libs)
 from pathomx.figures import spectra
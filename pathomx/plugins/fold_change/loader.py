@@ -43,6 +43,8 @@ class FoldChangeApp(ui.AnalysisApp):
 
         self.config.set_defaults({
             'use_baseline_minima': True,
+            'use_variable_minima': False,
+            'pairwise': False,
         })
 
         t = self.addToolBar('Fold change')
@@ -50,6 +52,16 @@ class FoldChangeApp(ui.AnalysisApp):
         self.config.add_handler('use_baseline_minima', t.cb_baseline_minima)
         t.cb_baseline_minima.setStatusTip('Replace zero values with half of the smallest value')
         t.addWidget(t.cb_baseline_minima)
+
+        t.cb_variable_minima = QCheckBox('Per variable')
+        self.config.add_handler('use_variable_minima', t.cb_variable_minima)
+        t.cb_variable_minima.setStatusTip('Use the smallest value of each variable (rather than the whole dataset) for minima')
+        t.addWidget(t.cb_variable_minima)
+
+        t.cb_pairwise = QCheckBox('All pairs')
+        self.config.add_handler('pairwise', t.cb_pairwise)
+        t.cb_pairwise.setStatusTip('Calculate fold change between all pairs of classes (ignores control and test)')
+        t.addWidget(t.cb_pairwise)
         self.toolbars['fold_change'] = t
 
 
@@ -9,9 +9,6 @@ from matplotlib.colors import rgb2hex
 
 from pathomx.utils import luminahex
 
-from biocyc import biocyc
-biocyc.secondary_cache_paths.append(os.path.join(_pathomx_database_path, 'biocyc'))
-
 xref_urls = {
     'BioCyc compound': 'pathomx://db/compound/%s/view',
     'BioCyc gene': 'pathomx://db/gene/%s/view',
@@ -21,9 +18,9 @@ xref_urls = {
 
 #self.dblinks[ e.find('dblink-db').text ] = e.find('dblink-oid').text
 
-def build_xref_list(data):
+def build_xref_list(data, ref):
     # Supplied with a MultiIndex will build a reference table for all
-    # to the BioCyc object type
+    # to the BioCyc object type; ref identifies the dataset (stable between runs)
     xref_translate = {
         'KEGG': ['Kegg Compound', 'Kegg Gene'],
         'NCBI-GENE': ['Entrez Gene'],
@@ -46,7 +43,7 @@ def build_xref_list(data):
                         dbl = [db]
 
                     for dbi in dbl:
-                        xrefs[(dbi, dbid)] = ('PATHOMX%d' % id(data), n)
+                        xrefs[(dbi, dbid)] = (ref, n)
 
     # Use other columns
     for namen, name in enumerate(data.columns.names):
@@ -59,7 +56,7 @@ def build_xref_list(data):
             for sn in names:
                 for n, c in enumerate(thisrow):
                     if c is not None:
-                        xrefs[(sn, c)] = ('PATHOMX%d' % id(data), n)
+                        xrefs[(sn, c)] = (ref, n)
 
     return xrefs
 
@@ -106,7 +103,8 @@ if compound_data is not None or gene_data is not None or protein_data is not Non
     norm = mpl.colors.SymLogNorm(linthresh=0.001, vmin=overall_min, vmax=overall_max, clip=True)
     mapper = cm.ScalarMappable(norm=norm, cmap=colormap)
 
-    for data in datasets:
+    for dn, data in enumerate(datasets):
+        ref = 'PATHOMX%d' % dn
         # We can only use a single row at the moment, so process through fold change etc. first
         values = data.iloc[0]
         for n, v in enumerate(values):
@@ -116,9 +114,9 @@ if compound_data is not None or gene_data is not None or protein_data is not Non
             else:
                 contrast = "#000000"
 
-            node_colors[('PATHOMX%d' % id(data), n)] = (color, contrast)
+            node_colors[(ref, n)] = (color, contrast)
 
-        xref_syns = dict(xref_syns.items() + build_xref_list(data).items())
+        xref_syns.update(build_xref_list(data, ref))
 
 else:
     node_colors = None
@@ -129,9 +127,8 @@ else:
     #    if xref is not None and ecol is not None:
     #        node_colors[xref] = ecol
 
-from gpml2svg import gpml2svg
+from pathomx.gpmllibrary import GPMLLibrary, render_gpml
 from IPython.core.display import SVG
-import requests
 
 # Add our urls to the defaults
 xref_urls = {
@@ -141,31 +138,25 @@ xref_urls = {
     'WikiPathways': 'pathomx://wikipathway/%s/import',
 }
 
+# GPML is held in a local content-addressed library; the server is only used for pathways not yet stored
+library = GPMLLibrary(os.path.join(_pathomx_cache_path, 'library'), server=config.get('gpml_server'), online=not config.get('gpml_offline'))
+
 gpml = None
 if config['gpml_file']:
-    print("Loaded GPML from WikiPathways")
-    with open(config['gpml_file'], 'rU') as f:
-        gpml = f.read()
+    gpml_key, gpml = library.add_file(config['gpml_file'])
+    print("Loaded GPML from file (%s)" % gpml_key)
 
 elif config['gpml_wikipathways_id']:
-    r = requests.get('http://www.wikipathways.org//wpi/wpi.php', params={
-                        'action': 'downloadFile',
-                        'type': 'gpml',
-                        'pwTitle': 'Pathway:%s' % config['gpml_wikipathways_id'],
-                        'revision': 0,
-                    })
-    if r.status_code == 200:
-        print("Loaded GPML from WikiPathways")
-        gpml = r.text
-    else:
-        raise Exception("Error loading GPML from WikiPathways (%d)" % r.status_code)
+    gpml_key, gpml = library.get_wikipathways(config['gpml_wikipathways_id'])
+    print("Loaded GPML for %s (%s)" % (config['gpml_wikipathways_id'], gpml_key))
+
 else:
     raise Exception("Select a source for GPML")
 
 if gpml:
 
 # xref_synonyms_fn=get_extended_xref_via_unification_list,
-    svg, metadata = gpml2svg.gpml2svg(gpml, xref_urls=xref_urls, xref_synonyms=xref_syns, node_colors=node_colors)
+    svg, metadata = render_gpml(gpml_key, gpml, xref_urls=xref_urls, xref_synonyms=xref_syns, node_colors=node_colors)
 
     View = SVG(svg)
 
@@ -44,6 +44,29 @@ class GPMLView(HTMLView):
             #self.v.change_name.emit( metadata['Name'] )
 
 
+class GPMLLibraryConfigPanel(ui.ConfigPanel):
+
+    def __init__(self, *args, **kwargs):
+        super(GPMLLibraryConfigPanel, self).__init__(*args, **kwargs)
+
+        gb = QGroupBox('Pathway library')
+        grid = QGridLayout()
+
+        self.offline_cb = QCheckBox('Offline (use stored pathways only)')
+        grid.addWidget(self.offline_cb, 0, 0, 1, 2)
+        self.config.add_handler('gpml_offline', self.offline_cb)
+
+        self.server_le = QLineEdit()
+        grid.addWidget(QLabel('Server'), 1, 0)
+        grid.addWidget(self.server_le, 1, 1)
+        self.config.add_handler('gpml_server', self.server_le)
+
+        gb.setLayout(grid)
+        self.layout.addWidget(gb)
+
+        self.finalise()
+
+
 # Class for data visualisations using GPML formatted pathways
 # Supports loading from local file and WikiPathways
 class GPMLPathwayApp(ui.AnalysisApp):
@@ -63,7 +86,8 @@ class GPMLPathwayApp(ui.AnalysisApp):
         self.config.set_defaults({
             'gpml_file': None,
             'gpml_wikipathways_id': None,
-        
+            'gpml_offline': False,
+            'gpml_server': 'http://www.wikipathways.org/',
         })
 
         self.data.add_input('compound_data')  # Add input slot
@@ -97,6 +121,8 @@ class GPMLPathwayApp(ui.AnalysisApp):
         t.addAction(load_gpmlAction)
         t.addAction(load_wikipathwaysAction)
 
+        self.addConfigPanel(GPMLLibraryConfigPanel, 'Library')
+
         self.plugin.register_url_handler(self.url_handler)
 
     def url_handler(self, url):
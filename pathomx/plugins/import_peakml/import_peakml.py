@@ -1,91 +1,109 @@
 import pandas as pd
-import csv
+import numpy as np
+import os
 import base64
-from collections import defaultdict
-import xml.etree.ElementTree as et
+
+try:
+    import xml.etree.cElementTree as et
+except ImportError:
+    import xml.etree.ElementTree as et
 
 
 def decode(s):
-    s = base64.decodestring(s)
-    # Each number stored as a 4-chr representation (ascii value, not character)
-    l = []
-    for i in range(0, len(s), 4):
-        c = s[i:i + 4]
-        val = 0
-        for n, v in enumerate(c):
-            val += ord(v) * 10 ** (3 - n)
-        l.append(str(val))
-    return l
-
-# Determine if we've got a csv or peakml file (extension)
-
-# Read data in from peakml format file
-xml = et.parse(config['filename'])
-
-# Get sample ids, names and class groupings
-sets = xml.iterfind('header/sets/set')
-midclass = {}
-classes = set()
-measurements = []
-masses = {}
+    # Each id is stored as a big-endian 32bit integer; decode the whole block at once
+    return np.frombuffer(base64.b64decode(s), dtype='>i4').astype(str)
 
-for aset in sets:
-    id = aset.find('id').text
-    mids = aset.find('measurementids').text
-    for mid in decode(mids):
-        midclass[mid] = id
-        measurements.append(mid)
+# Stream the PeakML file; elements are discarded as soon as they are processed
+file_size = float(os.path.getsize(config['filename']))
 
-    classes.add(id)
+measurements = []
+midclass = []
+row_for_mid = {}
 
-# We have all the sample data now, parse the intensity and identity info
-peaksets = xml.iterfind('peaks/peak')
-quantities = defaultdict(dict)
+identities_idx = {}
 all_identities = []
-
-for peakset in peaksets:
-
-# Find metabolite identities
-    annotations = peakset.iterfind('annotations/annotation')
-    identities = False
-    for annotation in annotations:
-        if annotation.find('label').text == 'identification':
-            identities = annotation.find('value').text.split(', ')
-            all_identities.extend(identities)
-            break
-
-    if identities:
-        # PeakML supports multiple alternative metabolite identities,currently we don't so duplicate
-        # We have identities, now get intensities for the different samples
-        chromatograms = peakset.iterfind('peaks/peak')  # Next level down
-
-        for chromatogram in chromatograms:
-            mid = chromatogram.find('measurementid').text
-            intensity = float(chromatogram.find('intensity').text)
-            mass = float(chromatogram.find('mass').text)
-
-            # Write out to each of the identities table (need to buffer til we have the entire list)
-            for identity in identities:
-                quantities[mid][identity] = intensity
-
-            # Write out to each of the identities table (need to buffer til we have the entire list)
-            for identity in identities:
-                masses[identity] = mass
-
-# Sort the identities/masses into consecutive order
-data = np.zeros((len(measurements), len(all_identities)))
-for mid, identities in list(quantities.items()):
-    for identity, intensity in list(identities.items()):
-        r = measurements.index(mid)
-        c = all_identities.index(identity)
-
-        data[r, c] = intensity
+masses = []
+
+data = None
+n_identities = 0
+last_progress = None
+
+with open(config['filename'], 'rb') as f:
+
+    context = et.iterparse(f, events=('start', 'end'))
+    path, parents = [], []
+
+    for event, elem in context:
+        if event == 'start':
+            path.append(elem.tag)
+            parents.append(elem)
+            continue
+
+        path.pop()
+        parents.pop()
+
+        if elem.tag == 'set' and path[-2:] == ['header', 'sets']:
+            # Get sample ids, names and class groupings
+            id = elem.find('id').text
+            for mid in decode(elem.find('measurementids').text):
+                row_for_mid[mid] = len(measurements)
+                measurements.append(mid)
+                midclass.append(id)
+
+            elem.clear()
+
+        elif elem.tag == 'header' and len(path) == 1:
+            # We have all the sample data now; preallocate for the intensities (columns grow as needed)
+            data = np.zeros((len(measurements), 1024))
+            elem.clear()
+
+        elif elem.tag == 'peak' and path[-1:] == ['peaks'] and len(path) == 2:
+            # Find metabolite identities
+            identities = False
+            for annotation in elem.iterfind('annotations/annotation'):
+                if annotation.find('label').text == 'identification':
+                    identities = annotation.find('value').text.split(', ')
+                    break
+
+            if identities:
+                # PeakML supports multiple alternative metabolite identities, currently we don't so duplicate
+                columns = []
+                for identity in identities:
+                    if identity not in identities_idx:
+                        identities_idx[identity] = n_identities
+                        all_identities.append(identity)
+                        masses.append(0.)
+                        n_identities += 1
+                    columns.append(identities_idx[identity])
+
+                if n_identities > data.shape[1]:
+                    data = np.hstack([data, np.zeros((data.shape[0], max(data.shape[1], n_identities)))])
+
+                # We have identities, now get intensities for the different samples
+                for chromatogram in elem.iterfind('peaks/peak'):  # Next level down
+                    r = row_for_mid[chromatogram.find('measurementid').text]
+                    data[r, columns] = float(chromatogram.find('intensity').text)
+                    mass = float(chromatogram.find('mass').text)
+
+                for c in columns:
+                    masses[c] = mass
+
+            # Drop the processed peak(s) from the tree
+            parents[-1].clear()
+
+            # We only output at 2dp so only emit when that changes
+            prg = round(f.tell() / file_size, 2)
+            if prg != last_progress:
+                last_progress = prg
+                progress(prg)
+
+data = data[:, :n_identities]
 
 output_data = pd.DataFrame(data)
-output_data.index = pd.MultiIndex.from_tuples(zip(measurements, [midclass[mid] for mid in measurements]), names=["Sample", "Class"])
-output_data.columns = pd.MultiIndex.from_tuples(zip(range(len(all_identities)), all_identities, [float(masses[i]) for i in all_identities]), names=['Measurement', 'HMDB', 'Scale'])
+output_data.index = pd.MultiIndex.from_arrays([measurements, midclass], names=["Sample", "Class"])
+output_data.columns = pd.MultiIndex.from_arrays([list(range(n_identities)), all_identities, masses], names=['Measurement', 'HMDB', 'Scale'])
 
-output_data
+data = None
 
 # Generate simple result figure (using pathomx libs)
 from pathomx.figures import spectra
@@ -1,6 +1,9 @@
 import pandas as pd
 import numpy as np
 import csv
+import os
+
+TEXT_IMPORT_CHUNKSIZE = 10000  # Rows per parsed chunk in typed import mode
 
 if config['autodetect_format']:
     try:
@@ -18,7 +21,7 @@ else:
     format_dict = dict(
         sep=config['delimiter'],
         quotechar=config['quotechar'],
-        escapechar=config['escapechar'],
+        escapechar=config['escapechar'] or None,
         quoting=config['quoting'],
         skipinitialspace=config['skipinitialspace'])
 
@@ -35,23 +38,108 @@ else:
     row_headers = list(range(config['row_headers']) )
 
 
-with open(config['filename'], 'rU') as f:
+if config['transpose']:
+    # We're samples across
+    header_rows, index_cols = row_headers, column_headers
+else:
+    header_rows, index_cols = column_headers, row_headers
+
+# Only numeric (typed) imports are cached; the values are memory-mapped on load
+use_cache = config['use_cache'] and config['typed_import']
+
+output_data = None
+if use_cache:
+    from pathomx.kernel_helpers import dataframe_cache_key, load_dataframe_cache, save_dataframe_cache
+    cache_key = dataframe_cache_key(config['filename'], config)
+    output_data = load_dataframe_cache(_pathomx_cache_path, cache_key)
+
+if output_data is not None:
+    pass
+
+elif config['typed_import']:
+    # Read the header rows once, then stream the body through the C parser in typed chunks
+    dtype = np.dtype(config['dtype'])
+    n_header = 0 if header_rows is None else max(header_rows if type(header_rows) == list else [header_rows]) + 1
+    n_index = 0 if index_cols is None else max(index_cols if type(index_cols) == list else [index_cols]) + 1
+    file_size = float(os.path.getsize(config['filename']))
+
+    if dialect is None and format_dict:
+        csv_format = dict(
+            delimiter=config['delimiter'],
+            quotechar=config['quotechar'],
+            escapechar=config['escapechar'] or None,
+            quoting=config['quoting'],
+            skipinitialspace=config['skipinitialspace'])
+    else:
+        csv_format = dict()
+
+    with open(config['filename'], 'r') as f:
+        # Lines are pulled through readline (leaving tell() usable) so quoted fields can span lines
+        header_reader = csv.reader(iter(f.readline, ''), dialect or 'excel', **csv_format)
+        headers = [next(header_reader) for n in range(n_header)]
+
+        # Set the dtype for the data columns only (not the row headers)
+        if headers:
+            n_cols = len(headers[0])
+        else:
+            pos = f.tell()
+            n_cols = len(next(header_reader))
+            f.seek(pos)
+
+        chunks = []
+        reader = pd.read_csv(f,
+                             header=None,
+                             index_col=index_cols,
+                             dialect=dialect,
+                             dtype={n: dtype for n in range(n_index, n_cols)},
+                             engine='c',
+                             chunksize=TEXT_IMPORT_CHUNKSIZE,
+                             **format_dict)
+        for chunk in reader:
+            chunks.append(chunk)
+            progress(f.tell() / file_size)
+
+    output_data = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+    chunks = None
+
+    # Drop the positional names from header=None so the header defaults are applied below
+    if n_index:
+        output_data.index.names = [None] * n_index
+
+    if headers:
+        # Build the (Multi)Index for the columns from the header rows; as for read_csv names for
+        # multiple header rows are in the row header column, otherwise name the row headers
+        columns = [h[n_index:] for h in headers]
+        if n_header == 1:
+            output_data.columns = pd.Index(columns[0])
+            if n_index:
+                output_data.index.names = [h or None for h in headers[0][:n_index]]
+        else:
+            output_data.columns = pd.MultiIndex.from_arrays(columns)
+            if n_index:
+                output_data.columns.names = [h[n_index - 1] or None for h in headers]
 
     if config['transpose']:
-
-        # We're samples across
-        output_data = pd.read_csv(f,
-                                  header=row_headers,
-                                  index_col=column_headers,
-                                  dialect=dialect,
-                                  **format_dict)
         output_data = output_data.T
-    else:
-        output_data = pd.read_csv(f,
-                                  header=column_headers,
-                                  index_col=row_headers,
-                                  dialect=dialect,
-                                  **format_dict)
+
+else:
+    with open(config['filename'], 'rU') as f:
+
+        if config['transpose']:
+
+            # We're samples across
+            output_data = pd.read_csv(f,
+                                      header=row_headers,
+                                      index_col=column_headers,
+                                      dialect=dialect,
+                                      **format_dict)
+            output_data = output_data.T
+        else:
+            output_data = pd.read_csv(f,
+                                      header=column_headers,
+                                      index_col=row_headers,
+                                      dialect=dialect,
+                                      **format_dict)
 
 # Check if we've got a singluar index (not multiindex) and convert
 if not isinstance(output_data.index, pd.MultiIndex):
@@ -80,6 +168,9 @@ if 'Class' not in output_data.index.names:
     output_data['Class'] = [''] * output_data.shape[0]
     output_data.set_index(['Class'], append=True, inplace=True)
 
+if use_cache:
+    save_dataframe_cache(_pathomx_cache_path, cache_key, output_data)
+
 # Generate simple result figure (using pathomx libs)
 from pathomx.figures import spectra, heatmap
 
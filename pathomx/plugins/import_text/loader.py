@@ -28,6 +28,11 @@ class ImportDataConfigPanel(ui.ConfigPanel):
         'None': csv.QUOTE_NONE,
     }
 
+    config_dtypes = {
+        'Single precision (float32)': 'float32',
+        'Double precision (float64)': 'float64',
+    }
+
     def __init__(self, parent, filename=None, *args, **kwargs):
         super(ImportDataConfigPanel, self).__init__(parent, *args, **kwargs)
 
@@ -131,6 +136,32 @@ class ImportDataConfigPanel(ui.ConfigPanel):
         gb.setLayout(grid)
         self.layout.addWidget(gb)
 
+        gb = QGroupBox('Large files')
+        grid = QGridLayout()
+
+        self.cb_typed_import = QCheckBox()
+        grid.addWidget(QLabel('Numeric (chunked) import'), 0, 0)
+        grid.addWidget(self.cb_typed_import, 0, 1)
+        self.config.add_handler('typed_import', self.cb_typed_import)
+
+        self.cb_dtype = QComboBox()
+        self.cb_dtype.addItems(list(self.config_dtypes.keys()))
+        grid.addWidget(QLabel('Data type'), 1, 0)
+        grid.addWidget(self.cb_dtype, 1, 1)
+        self.config.add_handler('dtype', self.cb_dtype, self.config_dtypes)
+
+        self.cb_use_cache = QCheckBox()
+        grid.addWidget(QLabel('Cache imported data'), 2, 0)
+        grid.addWidget(self.cb_use_cache, 2, 1)
+        self.config.add_handler('use_cache', self.cb_use_cache)
+
+        # Only numeric data can be cached (memory-mapped)
+        self.cb_use_cache.setEnabled(self.cb_typed_import.isChecked())
+        self.cb_typed_import.toggled.connect(self.cb_use_cache.setEnabled)
+
+        gb.setLayout(grid)
+        self.layout.addWidget(gb)
+
         self.finalise()
 
 
@@ -160,6 +191,9 @@ class ImportTextApp(ui.GenericTool):
             'column_headers': 1,
             'column_header_defaults': 'Label',
 
+            'typed_import': False,
+            'dtype': 'float64',
+            'use_cache': False,
         })
 
         self.addConfigPanel(ImportDataConfigPanel, 'Settings')
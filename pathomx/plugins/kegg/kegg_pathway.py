@@ -1,71 +1,64 @@
-from matplotlib import cm
-import numpy
-import re
 import os
+import numpy as np
+import pandas as pd
 
-from requests_toolbelt import MultipartEncoder
-import requests
+import matplotlib as mpl
+import matplotlib.cm as cm
 
-url = 'http://www.kegg.jp/kegg-bin/mcolor_pathway'
+from pathomx.keggmaps import KEGGMapLibrary, kegg_organism
+
+# Maps (KGML + base image) are held locally; KEGG is only contacted for maps not yet stored
+library = KEGGMapLibrary(config.get('kegg_library_path') or os.path.join(_pathomx_cache_path, 'maps'), online=not config.get('kegg_offline'))
+
+pathway_id = config['kegg_pathway_id']
+organism = kegg_organism(pathway_id)
+kegg_map = library.get(pathway_id)
 
 node_colors = {}
 
 if input_data is not None:
 
-    mini, maxi = input_data.max().max(), input_data.min().min()
-    mapi = np.linspace(mini, maxi, 255)
-    color = lambda x: mapi[np.abs(mapi - x).argmin()]
-
-    if mini < 0:
-        # We're using a linear zero-centered map
-        cmap = cm.RdBu(x)
+    # KEGG ids for each variable; from a KEGG column, or the BioCyc object database links
+    names = input_data.columns.names
+    kegg_ids = [None] * input_data.shape[1]
+    for n, c in enumerate(input_data.columns.values):
+        c = c if type(input_data.columns) == pd.MultiIndex else (c,)
+        if 'KEGG' in names and pd.notnull(c[names.index('KEGG')]) and c[names.index('KEGG')]:
+            kegg_id = '%s' % c[names.index('KEGG')]
+            kegg_ids[n] = kegg_id if ':' in kegg_id else 'cpd:%s' % kegg_id
+
+        elif 'BioCyc' in names and hasattr(c[names.index('BioCyc')], 'dblinks'):
+            dblinks = c[names.index('BioCyc')].dblinks
+            if dblinks.get('LIGAND-CPD'):
+                kegg_ids[n] = 'cpd:%s' % dblinks['LIGAND-CPD']
+            elif dblinks.get('NCBI-GENE'):
+                kegg_ids[n] = '%s:%s' % (organism, dblinks['NCBI-GENE'])
+
+    # We can only use a single row at the moment, so process through fold change etc. first
+    values = input_data.values[0].astype(np.float64)
+    mini, maxi = np.nanmin(values), np.nanmax(values)
+
+    if mini < 0 and maxi > 0:
+        # If crossing zero use a diverging map, centred on zero
+        maxi = max(abs(mini), maxi)
+        mini = -maxi
+        colormap = cm.RdBu_r
+
+    elif mini < 0:
+        colormap = cm.Blues_r
 
     else:
-        # We're using a linear zero-based map
-        cmap = cm.PuOr(x)
-
-    scale = utils.calculate_scale([mini, 0, maxi], [9, 1], out=np.around)  # rdbu9 scale
-
-    #for n, m in enumerate(dsi.entities[1]):
-    #    xref = self.get_xref( m )
-
-    for n, m in enumerate(dsi.entities[1]):
-        if m:
-
-            if 'LIGAND-CPD' in m.databases:
-                kegg_id = m.databases['LIGAND-CPD']
-                if kegg_id is not None:
-                    node_colors[kegg_id] = cmap(color(dsi.data[0, n]))
-
-            elif 'NCBI-GENE' in m.databases:
-                kegg_id = m.databases['NCBI-GENE']
-                if kegg_id is not None:
-                    node_colors[kegg_id] = cmap(color(dsi.data[0, n]))
-
-with open(os.path.join(_pathomx_tempdir, 'kegg-pathway-data.txt'), 'w') as tmp:
-    tmp.write('#hsa\tData\n')
-    for k, c in list(node_colors.items()):
-        tmp.write('%s\t%s\n' % (k, c[0]))
-
-m = MultipartEncoder(
-        fields={
-          'map': config['kegg_pathway_id'],
-          'mapping_list': ('filename', open(os.path.join(_pathomx_tempdir, 'kegg-pathway-data.txt'), 'r')),
-          'mode': 'color',
-          'submit': 'Exec',
-         }
-)
-
-r = requests.post(url, data=m, headers={'Content-Type': m.content_type})
-html = r.text
-
-from pathomx.displayobjects import Html  # We've got the html page; pull out the image
-# <img src="/tmp/mark_pathway13818418802193/hsa05200.1.png" name="pathwayimage" usemap="#mapdata" border="0" />
-m = re.search('\<img src="(.*)" name="pathwayimage"', html)
-img = m.group(1)
-
-m = re.search('^KEGG PATHWAY: (.*)$', html, flags=re.MULTILINE)
-title = m.group(1)
-output_html = '<html><body><img src="http://www.kegg.jp%s"></body></html>' % img
-
-View = Html(output_html)
+        colormap = cm.Reds
+
+    # All the colours in one call
+    mapper = cm.ScalarMappable(norm=mpl.colors.Normalize(vmin=mini, vmax=maxi), cmap=colormap)
+    rgb = np.round(mapper.to_rgba(values)[:, :3] * 255).astype(int)
+
+    for kegg_id, v, (r, g, b) in zip(kegg_ids, values, rgb):
+        if kegg_id is not None and not np.isnan(v):
+            node_colors[kegg_id] = '#%02x%02x%02x' % (r, g, b)
+
+print("Coloured %d of %d nodes on %s" % (sum(1 for n in kegg_map.nodes if any(i in node_colors for i in n[0])), len(kegg_map.nodes), kegg_map.title))
+
+from IPython.core.display import SVG
+View = SVG(kegg_map.render(node_colors))
@@ -18,6 +18,29 @@ except ImportError:
     import xml.etree.ElementTree as et
 
 
+class KEGGLibraryConfigPanel(ui.ConfigPanel):
+
+    def __init__(self, *args, **kwargs):
+        super(KEGGLibraryConfigPanel, self).__init__(*args, **kwargs)
+
+        gb = QGroupBox('Map library')
+        grid = QGridLayout()
+
+        self.offline_cb = QCheckBox('Offline (use stored maps only)')
+        grid.addWidget(self.offline_cb, 0, 0, 1, 2)
+        self.config.add_handler('kegg_offline', self.offline_cb)
+
+        self.library_le = QLineEdit()
+        grid.addWidget(QLabel('Folder'), 1, 0)
+        grid.addWidget(self.library_le, 1, 1)
+        self.config.add_handler('kegg_library_path', self.library_le)
+
+        gb.setLayout(grid)
+        self.layout.addWidget(gb)
+
+        self.finalise()
+
+
 # Class for data visualisations using KEGG formatted pathways
 # Supports loading from KEGG site
 class KEGGPathwayApp(ui.AnalysisApp):
@@ -47,6 +70,8 @@ class KEGGPathwayApp(ui.AnalysisApp):
 
         self.config.set_defaults({
             'kegg_pathway_id': 'hsa00010',
+            'kegg_offline': False,
+            'kegg_library_path': '',
         })
 
         self.kegg_pathway_t = QLineEdit()
@@ -56,6 +81,8 @@ class KEGGPathwayApp(ui.AnalysisApp):
 
         self.config.add_handler('kegg_pathway_id', self.kegg_pathway_t)
 
+        self.addConfigPanel(KEGGLibraryConfigPanel, 'Library')
+
 
 class dialogWikiPathways(ui.remoteQueryDialog):
     def __init__(self, parent=None, query_target=None, **kwargs):
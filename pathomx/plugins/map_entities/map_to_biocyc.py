@@ -1,20 +1,12 @@
 from biocyc import biocyc
+from pathomx.identifiers import open_identifier_index
+from pathomx.entities import get_resolver
 import pandas as pd
+import numpy as np
 import os
 import csv
 
-biocyc.set_organism('HUMAN')
-biocyc.secondary_cache_paths.append(os.path.join(_pathomx_database_path, 'biocyc'))
-
-
-def map_generator(table):
-    map_dict = {}
-    with open(os.path.join(_pathomx_tool_path, table), 'rU') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            map_dict[row[1]] = row[0]
-
-    return lambda x: map_dict[x] if x in map_dict else None
+resolver = get_resolver(_pathomx_entity_store_path, _pathomx_database_path, organism='HUMAN')
 
 
 def reverse_map_generator(table):
@@ -26,22 +18,18 @@ def reverse_map_generator(table):
 
     return lambda x: map_dict[x] if x in map_dict else None
 
-lku = {
+map_object_type = config.get('map_object_type')
+
+# Prebuilt name/identifier index over the database and mapping tables (built on first use)
+identifiers = open_identifier_index(_pathomx_cache_path, _pathomx_database_path, _pathomx_tool_path)
+
+# Names not in the index can still be searched for in BioCyc; the mapping tables are complete
+fallback = {
     'Any': biocyc.find_by_name,
     'Gene': biocyc.find_gene_by_name,
     'Protein': biocyc.find_protein_by_name,
     'Compound': biocyc.find_compound_by_name,
-    # ----
-    'BiGG': map_generator('bigg'),
-    'BioPath': map_generator('biopath'),
-    'BRENDA': map_generator('brenda'),
-    'FIMA': map_generator('fima'),
-    'HMDB': map_generator('hmdb'),
-    'KEGG': map_generator('kegg'),
-    'LIPID MAPS': map_generator('lipidmaps'),
-    'SEED': map_generator('seed'),
-    'UPA': map_generator('upa'),
-    }[config.get('map_object_type')]
+    }.get(map_object_type)
 
 # Get the index; plus the existing one if available
 if type(input_data.columns) == pd.MultiIndex:
@@ -64,30 +52,33 @@ else:
     labels = input_data.columns.values
     current_biocyc = [None] * len(labels)
 
-count = 0
-
-for n, l in enumerate(labels):
-    if current_biocyc[n] is not None:
-        continue
+labels = list(labels)
+unmapped = np.array([b is None for b in current_biocyc], dtype=bool)
 
-    o = lku(l)
-    # Note that the BioCyc module returns an object, so we need to convert to ID if it is
-    if hasattr(o, 'id'):
-        current_biocyc[n] = o
-        count += 1
+# Single bulk lookup over all labels
+ids = identifiers.lookup(labels, map_object_type)
 
+objects = {}
+if fallback is not None:
+    for n in np.nonzero(unmapped & (ids == None))[0]:
+        l = labels[n]
+        if l not in objects:
+            objects[l] = fallback(l)
 
-    elif type(o) is str:
-        try:
-            current_biocyc[n] = biocyc.get(o)
-        except:
-            current_biocyc[n] = None
-        else:
-            count += 1
+        # The BioCyc module returns an object; keep it keyed by the label
+        if hasattr(objects[l], 'id'):
+            ids[n] = l
 
+# Resolve the remaining ids to BioCyc objects in one batch
+to_resolve = list(set(i for i in ids[unmapped] if i is not None and i not in objects))
+objects.update(zip(to_resolve, resolver.get_many(to_resolve)))
 
-    else:
-        current_biocyc[n] = None
+count = 0
+for n in np.nonzero(unmapped)[0]:
+    o = objects.get(ids[n])
+    if hasattr(o, 'id'):
+        current_biocyc[n] = o
+        count += 1
 
 print("Matched %d identifiers" % count)
 
@@ -1,51 +1,59 @@
 import pandas as pd
-
-
-df = pd.read_csv(config['filename'], delimiter='\t')
-
-_FILTER_PROBABILITIES = df['Localization prob'] >= 0.75
-df = df[_FILTER_PROBABILITIES]
+import numpy as np
+import re
 
 labels = ['Leading proteins', 'Amino acid', 'Position']
 substitutions = {'Leading proteins': 'Gene names'}
 other_indices = ['Multiplicity']
 
-labels_l = len(labels)
+_RATIO_COLUMN = re.compile(r'^([MLH]/[MLH] \d\w)$')
 
-labels.extend( substitutions.values())
+# Read only the columns we need; ratios as floats, labels as text
+header = pd.read_csv(config['filename'], delimiter='\t', nrows=0).columns
+ratios = [c for c in header if _RATIO_COLUMN.match(c)]
+label_columns = labels + list(substitutions.values())
 
-subs_ix = {labels.index(s): labels.index(t) for s, t in substitutions.items()}
+dtypes = {c: np.float64 for c in ratios + ['Localization prob']}
+dtypes.update({c: object for c in label_columns})
 
-la = []
-for args in zip(*[df[l] for l in labels]):
-    ol = []
-    for n, a in enumerate(args[:labels_l]):
-        if a:
-            ol.append(str(a))
-        elif n in subs_ix:
-             ol.append(str( args[subs_ix[n]]))
-    
-    la.append('-'.join(ol))
+df = pd.read_csv(config['filename'], delimiter='\t', usecols=label_columns + other_indices + ['Localization prob'] + ratios, dtype=dtypes)
 
-df['UniqueLabel'] = la
+_FILTER_PROBABILITIES = df['Localization prob'] >= 0.75
+df = df[_FILTER_PROBABILITIES]
+
+# Build the labels column-wise; missing parts are substituted (where available) or skipped
+parts = {}
+for l in label_columns:
+    parts[l] = df[l].fillna('').astype(str)
+
+for s, t in substitutions.items():
+    parts[s] = parts[s].where(parts[s] != '', parts[t])
+
+# Prefix non-empty parts with the separator, join and drop the leading one
+la = pd.Series('', index=df.index)
+for l in labels:
+    la = la + ('-' + parts[l]).where(parts[l] != '', '')
+
+df['UniqueLabel'] = la.str[1:]
 df.set_index(['UniqueLabel'] + other_indices, inplace=True)
-df = df.filter(regex='^([MLH]/[MLH] \d\w)$', axis=1)
+df = df[ratios]
 
-# Add the reverse ratios
-for a,b in [('H','L'), ('H','M'), ('M','L')]:
-    ds = df.filter(regex='%s/%s' % (a,b) )
-    ds.columns = pd.Index([l.replace('%s/%s' % (a,b),'%s/%s' % (b,a)) for l in ds.columns.values])
-    df = pd.concat([df, 1.0/ ds], axis=1)
+# Add the reverse ratios in a single reciprocal
+forward = [c for c in ratios if c[:3] in ['H/L', 'H/M', 'M/L']]
 
-df = df.T
+ds = 1.0 / df[forward]
+ds.columns = pd.Index([re.sub('^([MLH])/([MLH])', r'\2/\1', c) for c in forward])
+df = pd.concat([df, ds], axis=1)
 
+df = df.T
 
 classes = [c[:3] for c in df.index.values]
-df.index = pd.MultiIndex.from_tuples(zip(df.index.values,classes), names=['Label', 'Class'])
+df.index = pd.MultiIndex.from_arrays([df.index.values, classes], names=['Label', 'Class'])
 
 output_data = df
 df = None
 ds = None
+la = None
 
 from pathomx.figures import histogram
-Histogram = histogram(output_data)
\ No newline at end of file
+Histogram = histogram(output_data)
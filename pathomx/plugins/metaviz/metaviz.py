@@ -1,10 +1,10 @@
 import os
-from biocyc import biocyc, Pathway, Gene, Compound, Protein
-biocyc.set_organism('HUMAN')
-biocyc.secondary_cache_paths.append(os.path.join(_pathomx_database_path, 'biocyc'))
+from pathomx.entities import get_resolver, Entity
+resolver = get_resolver(_pathomx_entity_store_path, _pathomx_database_path, organism='HUMAN')
+from biocyc import Pathway, Gene, Compound, Protein
 
 import metaviz
-import tempfile
+from pathomx.graphcache import GraphRenderCache
 
 import pandas as pd
 import numpy as np
@@ -87,21 +87,18 @@ if suggested_pathways is not None:
         elif type(suggested_pathways.columns) == pd.MultiIndex:
             ps = suggested_pathways.columns.values[suggested_pathways.columns.names.index('BioCyc')]
 
-    pathways = []
-    for p in ps:
-        if type(p) == Pathway:
-            pathways.append(p)
-        else:
-            try:
-                p = biocyc.get(id)
-            except:
-                pass
-            else:
-                if type(p) == Pathway:
-                    pathways.append(p)
+    pathways = list(ps)
 else:
     pathways = []
-pathways.extend([biocyc.get(p) for p in config['show_pathways']])
+pathways.extend(config['show_pathways'])
+
+# Only full BioCyc pathways can be drawn; ids that couldn't be fetched (e.g. offline) resolve
+# to a bare Entity record without reactions
+resolved = resolver.get_many(pathways)
+skipped = [str(i) for i, p in zip(pathways, resolved) if isinstance(p, Entity)]
+if skipped:
+    print("Skipping pathways not available from BioCyc (offline?): %s" % ', '.join(skipped))
+pathways = [p for p in resolved if type(p) == Pathway]
 pathways = [p for p in pathways if p.id not in config['hide_pathways']]
 
 pathways = list(set(pathways))
@@ -111,8 +108,6 @@ print("Suppressing display of %s" % config['hide_pathways'])
 
 reactions = ['PYRUVDEH-RXN']  # Fix this; add some way to manually add reactions (UI)
 
-# By default use the generated pathomx file to view
-filename = tempfile.mkstemp(suffix='svg')
 graph = metaviz.generate(pathways, analysis=analysis, reactions=reactions, **{
     'cluster_by': config['cluster_by'],
     'show_enzymes': config['show_enzymes'],
@@ -126,10 +121,11 @@ graph = metaviz.generate(pathways, analysis=analysis, reactions=reactions, **{
 
     'show_pathway_links': config['show_pathway_links'],
 })
-graph.write(filename[1], format=config['output_format'], prog='neato')
+
+# Layouts and renders are cached; a colour-only change re-styles the cached layout
+render_cache = GraphRenderCache(os.path.join(_pathomx_cache_path, 'graphs'))
+svg = render_cache.render(graph.to_string(), prog='neato', format=config['output_format'])
 
 from IPython.core.display import SVG
-with open(filename[1], 'rU') as f:
-    svg = f.read()
 View = SVG(svg)
 View
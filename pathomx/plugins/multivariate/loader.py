@@ -7,6 +7,11 @@ import pathomx.ui as ui
 from pathomx.data import DataDefinition
 from pathomx.qt import *
 
+FILTER_SPACES = {
+    'Each pair of components': 'pairs',
+    'All components': 'all',
+}
+
 
 # Dialog box for Metabohunter search options
 class PLSDAConfigPanel(ui.ConfigPanel):
@@ -97,6 +102,15 @@ class PCAConfigPanel(ui.ConfigPanel):
         self.config.add_handler('filter_data', cb)
         self.layout.addWidget(cb)
 
+        row = QVBoxLayout()
+        cl = QLabel('Filter covariance space')
+        cb = QComboBox()
+        cb.addItems(FILTER_SPACES.keys())
+        row.addWidget(cl)
+        row.addWidget(cb)
+        self.config.add_handler('filter_space', cb, FILTER_SPACES)
+        self.layout.addLayout(row)
+
         self.finalise()
 
 
@@ -118,6 +132,7 @@ class PCATool(ui.IPythonApp):
         self.data.add_output('scores')
         self.data.add_output('weights')
         self.data.add_output('filtered_data')
+        self.data.add_output('outliers')
 
         # Setup data consumer options
         self.data.consumer_defs.append(
@@ -130,6 +145,9 @@ class PCATool(ui.IPythonApp):
             'number_of_components': 2,
 
             'plot_sample_numbers': False,
+
+            'filter_data': False,
+            'filter_space': 'pairs',
         })
 
         self.addConfigPanel(PCAConfigPanel, 'PCA')
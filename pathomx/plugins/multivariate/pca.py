@@ -20,7 +20,7 @@ dso_pc = {}
 weightsi = []
 
 # Generate simple result figure (using pathomx libs)
-from pathomx.figures import spectra, scatterplot, plot_point_cov
+from pathomx.figures import spectra, scatterplot
 
 for n in range(0, pca.components_.shape[0]):
     pcd = pd.DataFrame(weights.values[n:n + 1, :])
@@ -48,21 +48,28 @@ pcd = None
 # Clean up
 
 if config['filter_data']:
-    ffilter = None
-    for sc in score_combinations:
-        e = plot_point_cov( scores.iloc[:, score_combinations[0]])
-        filterset = []
-        for n in range(0, scores.shape[0]):
-            v = scores.iloc[n, score_combinations[0]].values
-            filterset.append( e.contains_point(v, radius=0))
-
-        filterset = np.array(filterset, dtype=np.bool)
-        if ffilter is not None:
-            ffilter = ffilter & filterset
-        else:
-            ffilter = filterset
-
-    filtered_data = input_data.iloc[filterset]
+    # Mahalanobis distance of every sample from the centre of the scores cloud; a sample
+    # lies within the n-sd covariance ellipse (see plot_point_cov) when the distance < nstd
+    nstd = 2
+
+    if config['filter_space'] == 'pairs' and score_combinations:
+        combinations = sorted(score_combinations)
+        combination_names = ['PC%d v PC%d' % (a + 1, b + 1) for a, b in combinations]
+    else:
+        combinations = [tuple(range(0, scores.shape[1]))]
+        combination_names = ['PC1-%d' % scores.shape[1]]
+
+    # Stack all combinations into a single (combinations x samples x components) block
+    x = scores.values[:, np.array(combinations)].transpose(1, 0, 2)
+    x = x - x.mean(axis=1)[:, np.newaxis, :]
+    cov = np.einsum('pni,pnj->pij', x, x) / (x.shape[1] - 1)
+    d2 = np.einsum('pni,pij,pnj->pn', x, np.linalg.inv(cov), x)
+
+    outliers = pd.DataFrame(np.sqrt(d2).T, index=scores.index, columns=combination_names)
+    outliers['Outlier'] = (outliers.values >= nstd).any(axis=1)
+
+    filtered_data = input_data.iloc[~outliers['Outlier'].values]
 
 else:
-    filtered_data = None
\ No newline at end of file
+    outliers = None
+    filtered_data = None
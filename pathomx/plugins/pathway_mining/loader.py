@@ -125,6 +125,9 @@ class PathwayMiningConfigPanel(ui.ConfigPanel):
         self.xb_miningShared = QCheckBox('Share compound scores between pathways')
         self.config.add_handler('/Data/MiningShared', self.xb_miningShared)
 
+        self.xb_miningPerSample = QCheckBox('Score each sample')
+        self.config.add_handler('/Data/MiningPerSample', self.xb_miningPerSample)
+
         self.sb_miningDepth = QSpinBox()
         self.sb_miningDepth.setMinimum(1)
         self.config.add_handler('/Data/MiningDepth', self.sb_miningDepth)
@@ -133,6 +136,7 @@ class PathwayMiningConfigPanel(ui.ConfigPanel):
         self.layout.addWidget(self.cb_miningType)
         self.layout.addWidget(self.xb_miningRelative)
         self.layout.addWidget(self.xb_miningShared)
+        self.layout.addWidget(self.xb_miningPerSample)
         self.layout.addWidget(self.sb_miningDepth)
 
         self.finalise()
@@ -156,6 +160,7 @@ class PathwayMiningApp(ui.AnalysisApp):
             '/Data/MiningType': 'c',
             '/Data/MiningRelative': False,
             '/Data/MiningShared': True,
+            '/Data/MiningPerSample': False,
             'include_pathways': [],
             'exclude_pathways': [],
         })
@@ -1,56 +1,65 @@
-from pathminer import mining
 import pandas as pd
 import numpy as np
-import os
 
-from biocyc import biocyc
+from pathomx.entities import get_resolver
+from pathomx.mining import load_incidence, score
 
-biocyc.set_organism('HUMAN')
-biocyc.secondary_cache_paths.append(os.path.join(_pathomx_database_path, 'biocyc'))
-# Flatten input data to single row
+resolver = get_resolver(_pathomx_entity_store_path, _pathomx_database_path, organism='HUMAN')
 
-data = []
+target = config['/Data/MiningTarget']
+per_sample = config.get('/Data/MiningPerSample', False)
+
+# Collect the data with BioCyc identifiers; either each sample or flattened to a single row
+datas, entities = [], []
 for input_data in input_1, input_2, input_3, input_4:
     if input_data is not None:
-        datam = input_data.mean()
         # We need BioCyc identifiers
         if 'BioCyc' in input_data.columns.names:
             if type(input_data.columns) == pd.MultiIndex:
-                entities = [k[input_data.columns.names.index('BioCyc')] for k in input_1.columns.values]
+                ids = [k[input_data.columns.names.index('BioCyc')] for k in input_data.columns.values]
+            else:
+                ids = input_data.columns.values
+
+            # Map to BioCyc if not already (objects are passed through)
+            entities.extend(resolver.get_many([e if hasattr(e, 'id') or type(e) is str else None for e in ids]))
+
+            if per_sample:
+                datas.append(pd.DataFrame(input_data.values, index=input_data.index))
             else:
-                entities = input_data.columns.values
-            # Map to BioCyc if not already
-            biocyc_entities = []
-            for e in entities:
-                if hasattr(e, 'id'):
-                    biocyc_entities.append(e)
-                elif type(e) is str:
-                    try:
-                        biocyc_entities[n] = biocyc.get(o)
-                    except:
-                        biocyc_entities[n] = None
-                else:
-                    biocyc_entities.append(None)
-
-            datas = [(e, s) for e, s in zip(biocyc_entities, datam.values) if e is not None]
-            data.extend(datas)
-
-print "%d entities with data" % len(data)
-
-results = mining(data, target=config['/Data/MiningTarget'],
-                       include=config['include_pathways'],
-                       exclude=config['exclude_pathways'],
-                       no_of_results=config['/Data/MiningDepth'],
-                       algorithm=config['/Data/MiningType'],
-                       relative=config['/Data/MiningRelative'],
-                       shared=config['/Data/MiningShared'],
-                )
-
-# Results in format [(pathway, score)] rebuild a new DataFrame of the data
-results
-
-pathways, data = zip(*results)
-
-output_data = pd.DataFrame(np.array(data)).T
+                datas.append(pd.DataFrame(input_data.mean().values[np.newaxis, :]))
+
+# Align samples across inputs (in mean mode there is just the one row)
+data = pd.concat(datas, axis=1) if datas else pd.DataFrame()
+
+# Incidence over the bundled database, extended with any fetched objects it doesn't cover
+incidence = load_incidence(_pathomx_cache_path, _pathomx_database_path, target).extend(entities, target)
+entity_ids = [e.id if e is not None else None for e in entities]
+
+print("%d entities with data" % (incidence.columns_for(entity_ids) >= 0).sum())
+
+scores = score(incidence, data.values, entity_ids,
+               algorithm=config['/Data/MiningType'],
+               relative=config['/Data/MiningRelative'],
+               shared=config['/Data/MiningShared'],
+               )
+
+segments = pd.Index(incidence.segments)
+keep = np.ones(len(segments), dtype=bool)
+if config['include_pathways']:
+    keep &= segments.isin(config['include_pathways'])
+if config['exclude_pathways']:
+    keep &= ~segments.isin(config['exclude_pathways'])
+
+# Rank on the overall score; keep the top N with a non-zero score
+overall = np.where(keep, scores.mean(axis=0), 0)
+order = [n for n in np.argsort(-overall, kind='mergesort') if overall[n] > 0][:config['/Data/MiningDepth']]
+
+assert order, "Not enough data to do anything useful. Add more data, or change the mining type."
+
+pathways = resolver.get_many(list(incidence.segments[order]))
+
+output_data = pd.DataFrame(scores[:, order])
+if per_sample:
+    output_data.index = data.index
 output_data.columns = pd.Index([p for p in pathways], name='BioCyc')
 output_data
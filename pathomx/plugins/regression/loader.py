@@ -10,6 +10,11 @@ import pathomx.ui as ui
 from pathomx.data import DataDefinition
 from pathomx.qt import *
 
+METHOD_TYPES = {
+    'Pearson': 'pearson',
+    'Spearman (rank)': 'spearman',
+}
+
 
 def make_label_for_entry(*args):
     return '\t'.join(map(str, [s for s in args if s is not None]))
@@ -122,6 +127,28 @@ class RegressionConfigPanel(ui.ConfigPanel):
 
         self.config.add_handler('variables', self.lw_variables, (self.map_list_fwd, self.map_list_rev))
 
+        cb = QCheckBox('Screen all pairs of variables')
+        self.config.add_handler('all_pairs', cb)
+        self.layout.addWidget(cb)
+
+        row = QVBoxLayout()
+        cl = QLabel('Correlation method')
+        cb = QComboBox()
+        cb.addItems(METHOD_TYPES.keys())
+        row.addWidget(cl)
+        row.addWidget(cb)
+        self.config.add_handler('method', cb, METHOD_TYPES)
+        self.layout.addLayout(row)
+
+        row = QVBoxLayout()
+        cl = QLabel('Plot top hits')
+        cb = QSpinBox()
+        cb.setRange(0, 100)
+        row.addWidget(cl)
+        row.addWidget(cb)
+        self.config.add_handler('plot_top_n', cb)
+        self.layout.addLayout(row)
+
         self.tool.data.source_updated.connect(self.onRefreshData)
         self.finalise()
 
@@ -196,6 +223,8 @@ class RegressionTool(ui.AnalysisApp):
         super(RegressionTool, self).__init__(*args, **kwargs)
 
         self.data.add_input('input_data')  # Add input slot
+        self.data.add_output('regression_data')
+        self.data.add_output('correlation_data')
 
         # Setup data consumer options
         self.data.consumer_defs.append(
@@ -206,6 +235,9 @@ class RegressionTool(ui.AnalysisApp):
 
         self.config.set_defaults({
             'variables': [],
+            'all_pairs': False,
+            'method': 'pearson',
+            'plot_top_n': 10,
         })
         self.addConfigPanel(RegressionConfigPanel, 'Settings')
 
@@ -1,64 +1,42 @@
 import pandas as pd
 import numpy as np
-import scipy as sp
-import scipy.stats
 
-# Build the labels for axes
-if type(input_data.columns) == pd.MultiIndex:
-    labels = [v[0] for v in input_data.columns.values]
+from pathomx.analysis import regression, correlation_matrix
 
-else: # pd.Index
-    labels = input_data.columns.values
+if config['all_pairs']:
+    pairs = None
+    a, b = np.triu_indices(input_data.shape[1], 1)
+else:
+    pairs = config.get('variables')
+    a, b = np.array(pairs, dtype=np.intp).reshape(-1, 2).T
 
+# Statistics for all pairs in a single pass; ignores missing values pairwise
+regression_data = regression(input_data, pairs=pairs, method=config['method'])
+regression_data.index = ["R%d" % (n + 1) for n in range(regression_data.shape[0])]
 
+progress(0.5)
 
-correlations = {}
-total_n = len(config.get('variables'))
-for n, v in enumerate(config.get('variables')):
-    a, b = v
-    x = input_data.ix[:, a ] 
-    y = input_data.ix[:, b ]  
+if config['all_pairs']:
+    correlation_data = correlation_matrix(input_data, method=config['method'])
+else:
+    correlation_data = None
 
-    fit = np.polyfit(x,y,1)
-
-    do = pd.DataFrame( np.zeros((len(x),2 )) )
+# Generate figures for the strongest hits only (lowest p, then highest r²)
+from pathomx.figures import scatterplot
 
-    do.iloc[:,0] = x.values
-    do.iloc[:,1] = y.values
-    
-    do.columns = pd.Index( [labels[a], labels[b]], names='Label' )
-    
-    # Keep class information for plot (make optional)
-    do.index = input_data.index
-    
-    rx = x.values.astype(np.float)
-    ry = y.values.astype(np.float)
+top = np.lexsort((-regression_data['r2'].values, regression_data['p'].values))[:config['plot_top_n']]
 
-    # Skip if zeros or containing nans
-    try:
-        slope, intercept, r_value, p_value, std_err = sp.stats.linregress(rx, ry)
-    except:
-        # Skip any that fail
-        pass
-    else:
-        correlations["R%d" % (n+1)] = {
-            'data': do,
-            'fit': fit,
-            'label': u'r²=%0.2f, p=%0.2f' % (r_value**2, p_value)
-        }
-        
-    progress(float(n)/total_n)
-        
-do = None;
+for n in top:
+    c = regression_data.iloc[n]
 
-# Generate simple result figure (using pathomx libs)
-from pathomx.figures import scatterplot
+    do = pd.DataFrame(input_data.iloc[:, [a[n], b[n]]].values, index=input_data.index)
+    do.columns = pd.Index([c['x'], c['y']], name='Label')
 
-for k,c in correlations.items():
-    x_data = np.linspace(np.min(c['data'].iloc[:,0]), np.max(c['data'].iloc[:,0]), 50)
+    x_data = np.linspace(np.nanmin(do.values[:, 0]), np.nanmax(do.values[:, 0]), 50)
     lines = [
-        (x_data, np.polyval(c['fit'], x_data), c['label'])
+        (x_data, c['slope'] * x_data + c['intercept'], u'r²=%0.2f, p=%0.2f' % (c['r2'], c['p']))
     ]
 
-    vars()[k] = scatterplot(c['data'], lines=lines, styles=styles);
+    vars()[regression_data.index[n]] = scatterplot(do, lines=lines, styles=styles)
 
+do, top, c, a, b = None, None, None, None, None
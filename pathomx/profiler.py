@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+'''
+Execution profiling of tool runs.
+
+Each job passing through the run queue carries a JobProfile, which collects timestamps as
+the job moves through its stages: waiting in the queue, transferring inputs to a kernel,
+setting up, running the tool code, collecting and pulling the outputs back, and prerendering
+and rendering the views. Stages in the kernel are timed by the kernel helpers and returned
+with the outputs. Completed profiles are held by the ExecutionProfiler, which draws them as
+a timeline across kernels and exports them as JSON or Chrome trace format (chrome://tracing).
+
+This module has no Qt dependency so it can be imported on the kernels.
+'''
+from __future__ import unicode_literals, division
+
+import sys
+import time
+import json
+import io
+
+from collections import deque, defaultdict
+from xml.sax.saxutils import escape
+
+# Stages as (name, start mark, end mark)
+PHASES = [
+    ('queue', 'queued', 'dispatched'),
+    ('transfer', 'dispatched', 'start_begin'),
+    ('notebook_start', 'start_begin', 'start_end'),
+    ('code', 'start_end', 'stop_begin'),
+    ('collect_outputs', 'stop_begin', 'stop_end'),
+    ('pull', 'stop_end', 'received'),
+    ('prerender', 'received', 'prerendered'),
+    ('render', 'render_begin', 'rendered'),
+]
+
+PHASE_COLORS = {
+    'queue': '#dddddd',
+    'transfer': '#ff7f0e',
+    'notebook_start': '#9467bd',
+    'code': '#1f77b4',
+    'collect_outputs': '#17becf',
+    'pull': '#d62728',
+    'prerender': '#2ca02c',
+    'render': '#98df8a',
+}
+
+
+def estimate_size(obj):
+    '''
+    Return an estimate of the size of an object in bytes, without serialising it.
+    '''
+    if obj is None:
+        return 0
+
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'index'):  # pandas
+        try:
+            return int(obj.memory_usage(index=True).sum())
+        except Exception:
+            pass
+
+    if hasattr(obj, 'nbytes'):  # numpy
+        return int(obj.nbytes)
+
+    if isinstance(obj, dict):
+        return sum(estimate_size(v) for v in obj.values())
+
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_size(v) for v in obj)
+
+    return sys.getsizeof(obj)
+
+
+def peak_memory():
+    '''
+    Return the peak resident memory of the current process in bytes, or None if not available.
+    '''
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset
+        except Exception:
+            return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on Mac OS X, kilobytes elsewhere
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class JobProfile(object):
+    '''
+    Timings of a single job.
+
+    :param tool_id: Id of the tool the job runs
+    :param name: Name of the tool
+    '''
+
+    def __init__(self, tool_id, name):
+        self.tool_id = tool_id
+        self.name = name
+        self.runner = None
+        self.status = None
+
+        self.marks = {}
+        self.input_bytes = None
+        self.output_bytes = None
+        self.peak_memory = None
+
+        self.mark('queued')
+
+    def mark(self, name, t=None):
+        self.marks[name] = time.time() if t is None else t
+
+    def update_from_kernel(self, kernel_profile):
+        '''
+        Merge in the timings recorded on the kernel by the kernel helpers.
+        '''
+        kernel_profile = dict(kernel_profile)
+        self.peak_memory = kernel_profile.pop('peak_memory', None)
+        self.output_bytes = kernel_profile.pop('output_bytes', None)
+        self.marks.update(kernel_profile)
+
+    @property
+    def phases(self):
+        '''
+        List of the recorded stages as (name, start, end).
+        '''
+        return [(name, self.marks[start], self.marks[end]) for name, start, end in PHASES
+                if start in self.marks and end in self.marks]
+
+    @property
+    def start(self):
+        return self.marks['queued']
+
+    @property
+    def end(self):
+        return max(self.marks.values())
+
+    def phase_args(self, name):
+        if name == 'transfer':
+            return {'bytes': self.input_bytes}
+        elif name == 'pull':
+            return {'bytes': self.output_bytes}
+        return {}
+
+    def as_dict(self):
+        return {
+            'tool_id': self.tool_id,
+            'name': self.name,
+            'runner': self.runner,
+            'status': self.status,
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+            'peak_memory': self.peak_memory,
+            'phases': [{'phase': name, 'start': start, 'end': end, 'duration': end - start}
+                       for name, start, end in self.phases],
+        }
+
+
+class ExecutionProfiler(object):
+    '''
+    Collects job profiles for display and export.
+
+    :param max_jobs: Number of jobs to keep; the oldest are discarded
+    '''
+
+    def __init__(self, max_jobs=5000):
+        self.jobs = deque(maxlen=max_jobs)
+
+    def add(self, job):
+        self.jobs.append(job)
+
+    def clear(self):
+        self.jobs.clear()
+
+    @property
+    def runners(self):
+        return sorted(set(j.runner for j in self.jobs if j.runner is not None))
+
+    @property
+    def peak_memory(self):
+        '''
+        Peak memory seen on each runner, in bytes.
+        '''
+        peaks = {}
+        for j in self.jobs:
+            if j.peak_memory is not None:
+                peaks[j.runner] = max(peaks.get(j.runner, 0), j.peak_memory)
+        return peaks
+
+    def summary(self):
+        '''
+        Total time in each stage for each tool, as a list of (name, total, {phase: seconds})
+        ordered by total time, longest first.
+        '''
+        totals = defaultdict(lambda: defaultdict(float))
+        for j in self.jobs:
+            for name, start, end in j.phases:
+                totals[j.name][name] += end - start
+
+        return sorted([(name, sum(phases.values()), dict(phases)) for name, phases in totals.items()],
+                      key=lambda x: -x[1])
+
+    def as_dict(self):
+        return {
+            'jobs': [j.as_dict() for j in self.jobs],
+            'peak_memory': self.peak_memory,
+        }
+
+    def chrome_trace(self):
+        '''
+        Return the jobs in Chrome trace event format; one thread per runner.
+        '''
+        runners = self.runners
+        tids = dict((r, n) for n, r in enumerate(runners))
+        t0 = min(j.start for j in self.jobs) if self.jobs else 0
+
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tids[r], 'args': {'name': r}} for r in runners]
+        for j in self.jobs:
+            if j.runner is None:
+                continue
+
+            for name, start, end in j.phases:
+                args = dict(j.phase_args(name), tool_id=j.tool_id)
+                events.append({
+                    'name': name,
+                    'cat': j.name,
+                    'ph': 'X',
+                    'ts': (start - t0) * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': 0,
+                    'tid': tids[j.runner],
+                    'args': args,
+                })
+
+            if j.peak_memory is not None:
+                events.append({'name': 'peak_memory', 'ph': 'C', 'ts': (j.end - t0) * 1e6, 'pid': 0,
+                               'args': {j.runner: j.peak_memory}})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, filename, format='json'):
+        '''
+        Save the profiles to a file.
+
+        :param filename: File to write
+        :param format: 'json' for the profile records, 'chrome' for Chrome trace format
+        '''
+        data = self.chrome_trace() if format == 'chrome' else self.as_dict()
+        with io.open(filename, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, indent=1))
+
+    def timeline_svg(self, width=1000, row_height=24):
+        '''
+        Draw the jobs as a Gantt chart: a row per runner, bars coloured by stage.
+
+        :rtype: str
+        '''
+        runners = self.runners
+        jobs = [j for j in self.jobs if j.runner is not None]
+        if not jobs:
+            return '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="20"></svg>' % width
+
+        label_width = 100
+        t0 = min(j.start for j in jobs)
+        span = max(max(j.end for j in jobs) - t0, 1e-3)
+        scale = (width - label_width - 10) / span
+        height = len(runners) * row_height + 40
+
+        items = []
+        for n, r in enumerate(runners):
+            y = n * row_height
+            items.append('<text x="4" y="%d" font-size="11">%s</text>' % (y + row_height * 0.65, escape(r)))
+            items.append('<line x1="%d" x2="%d" y1="%d" y2="%d" stroke="#eeeeee"/>' % (label_width, width, y + row_height, y + row_height))
+
+        for j in jobs:
+            y = runners.index(j.runner) * row_height
+            for name, start, end in j.phases:
+                # Waiting in the queue isn't time on the runner; show it as a thin bar
+                inset = row_height * 0.4 if name == 'queue' else row_height * 0.15
+                args = ', '.join('%s %s' % (k, v) for k, v in j.phase_args(name).items() if v is not None)
+                items.append('<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" fill="%s"><title>%s: %s %.3fs%s</title></rect>' % (
+                    label_width + (start - t0) * scale, y + inset, max((end - start) * scale, 0.5), row_height - 2 * inset,
+                    PHASE_COLORS[name], escape(j.name), name, end - start, ' (%s)' % args if args else ''))
+
+        # Time axis
+        y = len(runners) * row_height
+        step = _axis_step(span)
+        t = 0.
+        while t <= span:
+            x = label_width + t * scale
+            items.append('<line x1="%.1f" x2="%.1f" y1="0" y2="%d" stroke="#f4f4f4"/>' % (x, x, y))
+            items.append('<text x="%.1f" y="%d" font-size="10" text-anchor="middle">%gs</text>' % (x, y + 14, t))
+            t += step
+
+        # Legend
+        x = label_width
+        for name, start, end in PHASES:
+            items.append('<rect x="%d" y="%d" width="10" height="10" fill="%s"/><text x="%d" y="%d" font-size="10">%s</text>' % (
+                x, y + 24, PHASE_COLORS[name], x + 13, y + 33, name))
+            x += 20 + 6 * len(name)
+
+        return '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" font-family="sans-serif">\n%s\n</svg>' % (
+            width, height, '\n'.join(items))
+
+
+def _axis_step(span):
+    # A 1, 2 or 5 multiple giving roughly ten ticks
+    for step in [10 ** e * m for e in range(-3, 6) for m in (1, 2, 5)]:
+        if span / step <= 10:
+            return step
+    return span
+
+
+# Profiles of jobs run in this session
+profiler = ExecutionProfiler()
@@ -14,8 +14,12 @@ from datetime import datetime
 import re
 import os
 import sys
+import signal
+import multiprocessing
 from subprocess import Popen
-from IPython.parallel.apps import ipclusterapp
+from IPython.parallel.apps import ipclusterapp, ipengineapp
+
+from .profiler import profiler, JobProfile, estimate_size
 
 # Kernel is busy but not because of us
 STATUS_BLOCKED = -1
@@ -26,21 +30,96 @@ STATUS_RUNNING = 1
 STATUS_COMPLETE = 2
 STATUS_ERROR = 3
 
+# Seconds to wait for an interrupted kernel to stop before killing it
+INTERRUPT_TIMEOUT = 10
+
+# Job priorities; lowest first. The focused tool and its upstream chain run before the rest
+PRIORITY_FOCUS = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_FOCUS: 'focused',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_LOW: 'low',
+}
 
 # from pkg_resources import load_entry_point
 # load_entry_point('ipython==3.0.0-dev', 'console_scripts', 'ipcluster')()
 # IPython.parallel.apps.ipclusterapp:launch_new_instance'
 
 
+# Modules imported on each kernel as it starts, so the first run of a tool doesn't pay for them
+DEFAULT_PRELOAD_MODULES = ['numpy', 'pandas', 'scipy', 'scipy.stats', 'matplotlib', 'matplotlib.pyplot',
+                           'sklearn', 'nmrglue', 'pathomx.kernel_helpers']
+
+# IPython extensions providing each non-Python language
+LANGUAGE_EXTENSIONS = {
+    'r': 'rpy2.ipython',
+    'matlab': 'pymatbridge',
+}
+
+
+def preload_code(modules, languages=None):
+    '''
+    Return code to warm a kernel: import each of the modules (ignoring any that are not
+    installed) and load the extensions for the given languages.
+    '''
+    code = r'''import importlib
+for _pathomx_module in %r:
+    try:
+        importlib.import_module(_pathomx_module)
+    except Exception:
+        pass
+del _pathomx_module
+''' % [str(m) for m in modules]
+
+    for language in languages or []:
+        if language in LANGUAGE_EXTENSIONS:
+            code += '%%load_ext %s\n' % LANGUAGE_EXTENSIONS[language]
+
+    return code
+
+
+def tool_code(tool, varsi):
+    '''
+    Return the code to run for a tool; run under the profiler if requested for this run.
+    '''
+    if varsi.get('_pathomx_profile_run') and tool.language == 'python':
+        return 'from pathomx.kernel_helpers import pathomx_profile_code\nProfile = pathomx_profile_code(%r, vars(), %r)' % (
+            tool.code, '<%s>' % getattr(tool, 'shortname', 'tool'))
+
+    return tool.code
+
+
+class Job(object):
+    '''
+    A run of a tool, from being queued until its result is returned.
+
+    :param tool: Tool to run
+    :param varsi: Input variables for the run
+    :param progress_callback: Called with the progress (0-1) of the run
+    :param result_callback: Called with the result dict when the run completes
+    :param priority: PRIORITY_NORMAL or PRIORITY_LOW; raised to PRIORITY_FOCUS while the tool is focused
+    '''
+
+    def __init__(self, tool, varsi, progress_callback=None, result_callback=None, priority=PRIORITY_NORMAL):
+        self.tool = tool
+        self.varsi = varsi
+        self.progress_callback = progress_callback
+        self.result_callback = result_callback
+        self.priority = priority
+        self.profile = JobProfile(getattr(tool, 'id', None), getattr(tool, 'name', type(tool).__name__))
+
+        self.runner = None
+        self.is_cancelled = False  # The result is discarded
+
+
 # FIXME; we need to base-class the runner code
 def setup_languages(execute, language):
-    if language == 'r':
-        # Init R library loader (will take time first time; but instant thereafter)
-        execute(r'''%load_ext rpy2.ipython''')
-
-    elif language == 'matlab':
-        # Init MATLAB
-        execute(r'''%load_ext pymatbridge''')
+    if language in LANGUAGE_EXTENSIONS:
+        # Init language library loader (will take time first time; but instant thereafter)
+        execute(r'%%load_ext %s' % LANGUAGE_EXTENSIONS[language])
 
 
 class ClusterRunner(QObject):
@@ -59,6 +138,14 @@ class ClusterRunner(QObject):
         self._is_active = False
         self._status = STATUS_READY
         self.stdout = ""
+        self.jobs_run = 0
+        self.interrupted_at = None  # Time of an interrupt not yet acted on
+        self._interrupt_requested = False  # Interrupt once the tool code starts
+        self._setup_ars = []  # Executes queued ahead of the tool code
+
+        # Process id of the engine, for interrupting it
+        self._pid = None
+        self._pid_ar = e.apply_async(os.getpid)
         '''
         Runner metadata;
             - tool-metadata (?):
@@ -74,10 +161,65 @@ class ClusterRunner(QObject):
         self.progress_timer.timeout.connect(self.check_progress)
         self.progress_timer.start(1000)  # 1 sec
 
+    @property
+    def name(self):
+        return 'engine %s' % self.e.targets
+
     @property
     def is_active(self):
         return self._is_active or self.e.queue_status()['queue'] > 0
 
+    @property
+    def pid(self):
+        if self._pid is None and self._pid_ar.ready():
+            try:
+                self._pid = self._pid_ar.get(0)
+            except Exception:
+                pass
+        return self._pid
+
+    @property
+    def is_running_code(self):
+        # The tool code, rather than the setup before it or the collection of outputs after
+        return self.ar is not None and all(ar.ready() for ar in self._setup_ars) and not self.ar.ready()
+
+    def interrupt(self):
+        '''
+        Interrupt the tool code (KeyboardInterrupt on the engine). If the engine doesn't
+        respond it is killed, see RunManager.maintain_pool.
+
+        Only the tool code is interrupted: if it hasn't started the interrupt is sent when it
+        does, and once it has finished there is nothing to interrupt.
+        '''
+        if self.ar is None:
+            return
+
+        if self.is_running_code:
+            self.interrupted_at = datetime.now()
+            self.send_signal(signal.SIGINT)
+        else:
+            self._interrupt_requested = True
+
+    def kill(self):
+        self.send_signal(signal.SIGTERM)
+
+    def drop(self, names):
+        '''
+        Remove variables from the engine, e.g. outputs of a tool that are out of date.
+        '''
+        self.e.execute('for _name in %r: globals().pop(_name, None)' % list(names))
+
+    def send_signal(self, sig):
+        # Engines are local processes, started by the RunManager
+        if self.pid is None:
+            return False
+        try:
+            os.kill(self.pid, sig)
+        except (OSError, ValueError) as e:
+            logging.warn("Could not signal kernel %s: %s" % (self.e.targets, e))
+            return False
+        return True
+
     @property
     def status(self):
         if self._status == STATUS_READY and self.e.queue_status()['queue'] > 0:
@@ -86,11 +228,14 @@ class ClusterRunner(QObject):
             return self._status
 
     def run(self, tool, varsi, progress_callback=None, result_callback=None):
-        code = tool.code
+        code = tool_code(tool, varsi)
 
         self._is_active = True
         self._status = STATUS_RUNNING
         self.stdout = ""
+        self.jobs_run += 1
+        self.interrupted_at = None
+        self._interrupt_requested = False
 
         self._progress_callback = progress_callback
         self._result_callback = result_callback
@@ -99,10 +244,10 @@ class ClusterRunner(QObject):
         self.e.execute('%reset_selective -f [^_]')
         print(varsi)
         self.e.push({'varsi': varsi})
-        self.e.execute(r'''from pathomx.kernel_helpers import pathomx_notebook_start, pathomx_notebook_stop, progress, open_with_progress
-pathomx_notebook_start(varsi, vars());''')
+        self._setup_ars = [self.e.execute(r'''from pathomx.kernel_helpers import pathomx_notebook_start, pathomx_notebook_stop, progress, open_with_progress
+pathomx_notebook_start(varsi, vars());''')]
 
-        setup_languages(self.e.execute, tool.language)
+        setup_languages(lambda c: self._setup_ars.append(self.e.execute(c)), tool.language)
 
         self.ar = self.e.execute(code)
         self.e.execute(r'''pathomx_notebook_stop(vars());''')  # This will queue directly after the main code block
@@ -112,6 +257,10 @@ pathomx_notebook_start(varsi, vars());''')
 
         if self.ar:
 
+            if self._interrupt_requested and self.is_running_code:
+                self._interrupt_requested = False
+                self.interrupt()
+
             self.stdout = self.ar.stdout
             try:
                 r = self.ar.get(0)
@@ -126,11 +275,13 @@ pathomx_notebook_start(varsi, vars());''')
                     self._result_callback(result)
 
                 self.ar = None
+                self.interrupted_at = None  # The code has stopped
                 self._is_active = False  # Release this kernel
                 self._status = STATUS_ERROR
 
             else:
                 self.ar = None
+                self.interrupted_at = None  # The code has stopped; only the outputs are left
                 self.aro = self.e.pull('varso', block=False)
                 self._status = STATUS_COMPLETE
 
@@ -162,6 +313,20 @@ pathomx_notebook_start(varsi, vars());''')
                 self._is_active = False  # Release this kernel
                 self._status = STATUS_READY
 
+    def fail(self, message):
+        # Report the running job (if any) as failed; e.g. if the engine has died
+        if self._is_active and self._result_callback:
+            self._result_callback({'status': -1, 'traceback': message, 'stdout': self.stdout, 'varso': []})
+
+        self.ar = None
+        self.aro = None
+        self._is_active = False
+        self._status = STATUS_ERROR
+
+    def stop(self):
+        self.status_timer.stop()
+        self.progress_timer.stop()
+
     def check_progress(self):
         if self.ar and self._progress_callback:
             lines = self.ar.stdout.split('\n')
@@ -246,6 +411,8 @@ class InProcessRunner(BaseFrontendMixin, QObject):
         self.kernel_client = self.kernel_manager.client()
         self.kernel_client.start_channels()
 
+    name = 'in-process'
+
     def __del__(self):
         if self.kernel_client:
             self.kernel_client.stop_channels()
@@ -274,10 +441,19 @@ pathomx_notebook_start(varsi, vars());''')
 
         setup_languages(self._execute, tool.language)
 
-        msg_id = self._execute(tool.code)
-        self._cell_execute_ids[msg_id] = (tool.code, 1, 100)  # Store cell and progress
+        code = tool_code(tool, varsi)
+        msg_id = self._execute(code)
+        self._cell_execute_ids[msg_id] = (code, 1, 100)  # Store cell and progress
         self._final_msg_id = self._execute(r'''pathomx_notebook_stop(vars());''')
 
+    def interrupt(self):
+        # The in-process kernel runs on the UI thread; it can't be interrupted mid-run,
+        # the result is simply discarded
+        try:
+            self.interrupt_kernel()
+        except Exception:
+            pass
+
     def run_completed(self, error=False, traceback=None):
         logging.info("Notebook run took %s" % (datetime.now() - self._execute_start))
         result = {}
@@ -505,17 +681,31 @@ class RunManager(QObject):
     # Store metadata about tools' last run for variable passing etc.
     run_metadata = {}
 
-    def __init__(self):
+    def __init__(self, settings=None):
         super(RunManager, self).__init__()
 
+        self.settings = settings
+
         self.runners = []
-        self.jobs = []  # Job queue a tuple of (notebook, success_callback, error_callback)
+        self.jobs = []  # Job queue, of Job; in order added, run in order of priority
+        self.active_jobs = []  # Jobs running
+
+        self.focus = None  # Tool the user is looking at; it and its upstream chain run first
 
         self.start.connect(self.run)
 
         self.p = None
         self.client = None
 
+        # Kernels being warmed up, as (runner, async result); moved to runners once warm
+        self.warming = []
+        # Engines started to replace crashed or recycled ones, and the number not yet registered
+        self.engine_processes = []
+        self.engines_starting = 0
+        self._engines_starting_since = None
+        # Engines being shut down after recycling; not to be reused
+        self.retired = set()
+
     def __del__(self):
         self.terminate_cluster()
 
@@ -526,14 +716,122 @@ class RunManager(QObject):
 
         self._cluster_timer = QTimer()
         self._cluster_timer.timeout.connect(self.create_runners)
-        self._cluster_timer.start(5000)  # Re-check runners every 5 seconds
+        self._cluster_timer.start(1000)  # Re-check runners every second; picks up warmed kernels
 
-    def add_job(self, tool, varsi, progress_callback=None, result_callback=None):
-        # We take a copy of the notebook, so changes aren't applied back to the source
-        # ensuring each run starts with blank slate
-        self.jobs.append((tool, varsi, progress_callback, result_callback))
+        # Warm the in-process kernel once the UI is up, rather than on the first run
+        QTimer.singleShot(2000, self.warm_user_kernel)
+
+    def add_job(self, tool, varsi, progress_callback=None, result_callback=None, priority=PRIORITY_NORMAL):
+        # A new run of a tool supersedes any earlier run: only the latest config and inputs matter
+        self.cancel(tool)
+
+        self.jobs.append(Job(tool, varsi, progress_callback, result_callback, priority))
         self.start.emit()  # Auto-start on every add job
 
+    def forget(self, tool, keep=None):
+        '''
+        Drop the copies of a tool's outputs held on the kernels; they are pushed from the
+        tool when next needed.
+
+        :param keep: Runner whose copies are kept
+        '''
+        names = ["_%s_%s" % (o, id(tool)) for o in tool.data.o.keys()]
+        for runner in self.runners:
+            if runner is not keep and isinstance(runner, ClusterRunner):
+                runner.drop(names)
+
+        if keep is None:
+            self.run_metadata.pop(id(tool), None)
+
+    def set_focus(self, tool):
+        '''
+        Set the tool the user is looking at; queued jobs for it and the tools it takes input
+        from, directly or indirectly, run ahead of all others.
+        '''
+        self.focus = tool
+
+    def focus_chain(self):
+        '''
+        The focused tool and its upstream tools.
+        '''
+        found = set()
+        stack = [self.focus] if self.focus is not None else []
+        while stack:
+            tool = stack.pop()
+            found.add(tool)
+            for source in tool.data.i.values():
+                if source and source[0].v not in found:
+                    stack.append(source[0].v)
+        return found
+
+    def job_priority(self, job, focus_chain=None):
+        if focus_chain is None:
+            focus_chain = self.focus_chain()
+        return PRIORITY_FOCUS if job.tool in focus_chain else job.priority
+
+    def queued_by_priority(self):
+        '''
+        Number of queued jobs at each priority.
+        '''
+        focus_chain = self.focus_chain()
+        counts = dict((p, 0) for p in PRIORITY_NAMES)
+        for job in self.jobs:
+            counts[self.job_priority(job, focus_chain)] += 1
+        return counts
+
+    def next_job(self):
+        # Highest priority first, in order added; the focus is checked now as it may have
+        # changed since the job was queued
+        focus_chain = self.focus_chain()
+        n, job = min(enumerate(self.jobs), key=lambda x: (self.job_priority(x[1], focus_chain), x[0]))
+        return job
+
+    def cancel(self, tool):
+        '''
+        Cancel the runs of a tool: remove any queued, and interrupt any running and discard
+        the result.
+
+        :return: Number of runs cancelled
+        '''
+        queued = [j for j in self.jobs if j.tool is tool]
+        for job in queued:
+            self.jobs.remove(job)
+            logging.debug("Job for %s superseded" % job.profile.name)
+
+        running = [j for j in self.active_jobs if j.tool is tool and not j.is_cancelled]
+        for job in running:
+            job.is_cancelled = True
+            job.runner.interrupt()
+            logging.debug("Job for %s interrupted" % job.profile.name)
+
+        return len(queued) + len(running)
+
+    def get_setting(self, key, default):
+        value = self.settings.get(key) if self.settings is not None else None
+        return default if value is None else value
+
+    @property
+    def pool_size(self):
+        '''
+        Number of engines to keep running; from settings, or one per core leaving one for the UI.
+        '''
+        size = self.get_setting('Kernels/Pool_size', 0)
+        if not size:
+            size = max(1, multiprocessing.cpu_count() - 1)
+        return size
+
+    @property
+    def recycle_after(self):
+        '''
+        Number of jobs an engine runs before being replaced; 0 to keep engines indefinitely.
+        '''
+        return self.get_setting('Kernels/Recycle_after', 0)
+
+    @property
+    def preload(self):
+        return preload_code(self.get_setting('Kernels/Preload', DEFAULT_PRELOAD_MODULES),
+                            self.get_setting('Kernels/Preload_languages', []))
+
     @property
     def no_of_kernels(self):
         return len(self.runners)
@@ -549,9 +847,6 @@ class RunManager(QObject):
 
         logging.info('Currently %d jobs remaining' % len(self.jobs))
 
-        # We have job, get it
-        tool, varsi, progress_callback, result_callback = self.jobs.pop(0)  # Remove from the beginning
-
         # Identify the best runner for the job
         # - which runners are available
         # - which runners were the source data generated on
@@ -561,9 +856,14 @@ class RunManager(QObject):
                 # That'll do for now
                 break
         else:
-            self.jobs.insert(0, (tool, varsi, progress_callback, result_callback))
             return False
 
+        # We have a runner, get the job
+        job = self.next_job()
+        self.jobs.remove(job)
+        tool, varsi, profile = job.tool, job.varsi, job.profile
+
+        profile.input_bytes = 0
         if hasattr(tool, 'data'):
             # We can run code without an associated tool (e.g. for central-setup)
             varsi['_pathomx_expected_output_vars'] = list( tool.data.o.keys() )
@@ -576,12 +876,13 @@ class RunManager(QObject):
                     mo, mi = sm
                     io['input'][i] = "_%s_%s" % (mi, id(mo.v))
 
-                    # Check if the last run of this occurred on the selected runner
-                    if id(mo.v) in self.run_metadata and \
-                        self.run_metadata[id(mo.v)]['last_runner'] != id(runner):
+                    # Check if the last run of this occurred on the selected runner; if it is
+                    # not known to be there (e.g. restored or forgotten) it is pushed
+                    if self.run_metadata.get(id(mo.v), {}).get('last_runner') != id(runner):
 
                         # We need to push the actual data; this should do it?
                         varsi['_%s_%s' % (mi, id(mo.v))] = tool.data.get(i)
+                        profile.input_bytes += estimate_size(varsi['_%s_%s' % (mi, id(mo.v))])
                 else:
                     io['input'][i] = None
 
@@ -590,24 +891,67 @@ class RunManager(QObject):
 
             varsi['_io'] = io
 
-            self.run_metadata[id(tool)] = {
-                'last_runner': id(runner)
-            }
-
             tool.logger.info("Starting job....")
 
+        profile.runner = runner.name
+        profile.mark('dispatched')
+        job.runner = runner
+        self.active_jobs.append(job)
+
+        def profiled_result_callback(result):
+            if job in self.active_jobs:
+                self.active_jobs.remove(job)
+
+            # Merge the kernel timings and pass the profile on for the view stages
+            profile.mark('received')
+            profile.status = 'cancelled' if job.is_cancelled else result['status']
+            if result.get('varso'):
+                profile.update_from_kernel(result['varso'].pop('_pathomx_profile', {}))
+            profiler.add(profile)
+
+            if job.is_cancelled:
+                # Superseded or stopped; the tool doesn't want this result
+                return
+
+            if result['status'] == 0 and hasattr(tool, 'data'):
+                # Outputs are now on this runner; copies elsewhere are out of date
+                self.forget(tool, keep=runner)
+                self.run_metadata[id(tool)] = {
+                    'last_runner': id(runner)
+                }
+
+            result['profile'] = profile
+            if job.result_callback:
+                job.result_callback(result)
+
+        def progress_callback(progress):
+            if job.progress_callback and not job.is_cancelled:
+                job.progress_callback(progress)
+
         # Result callback gets the varso dict
-        runner.run(tool, varsi, progress_callback=progress_callback, result_callback=result_callback)
+        runner.run(tool, varsi, progress_callback=progress_callback, result_callback=profiled_result_callback)
 
     def restart(self):
         self.stop_cluster()
 
     def interrupt(self):
-        self.runner.interrupt_kernel()
+        # Stop all running jobs
+        for job in self.active_jobs[:]:
+            self.cancel(job.tool)
         
     def start_cluster(self):
-        # Start IPython ipcluster with 4 engines
-        self.p = Popen([sys.executable, ipclusterapp.__file__, 'start', '--n=4'], stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+        # Start IPython ipcluster with an engine per pool slot
+        self.p = Popen([sys.executable, ipclusterapp.__file__, 'start', '--n=%d' % self.pool_size], stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+        self.engines_starting = self.pool_size
+        self._engines_starting_since = datetime.now()
+
+    def start_engine(self):
+        # Start a single engine on the running cluster, to replace a lost one
+        self.engine_processes.append(
+            Popen([sys.executable, ipengineapp.__file__], stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+        )
+        self.engines_starting += 1
+        self._engines_starting_since = datetime.now()
 
     def stop_cluster(self):
         # Stop the ipcluster
@@ -616,15 +960,25 @@ class RunManager(QObject):
             pass
 
         self.p = None
-        self.client.shutdown()
-        self.client = None
+        if self.client is not None:
+            self.client.shutdown()
+            self.client = None
         self.runners = [self.in_process_runner]
+        self.warming = []
+        self.engine_processes = []
+        self.engines_starting = 0
+        self.retired = set()
 
     def terminate_cluster(self):
         if self.p:
             self.p.terminate()
             self.p = None
 
+        for p in self.engine_processes:
+            if p.poll() is None:
+                p.terminate()
+        self.engine_processes = []
+
     def create_runners(self):
         # Check the status of runners and the cluster process
         # If cluster process dead (non-None return to p.poll)
@@ -646,22 +1000,75 @@ class RunManager(QObject):
                 # FIXME: Inline plots are fine as long as we don't do it on the cluster+the interactive kernel; this results
                 # in an image cache being generated that breaks the pickle
 
-            for e in self.client:
-                found = False
-                for r in self.runners:
-                    if e.targets == r.e.targets:
-                        found = True
-
-                if not found:
-                    runner = ClusterRunner(e)
-                    runner.e.execute('%reset -f')
-                    runner.e.execute('%matplotlib inline')
-                    self.runners.append(runner)
+            self.maintain_pool()
 
         else:
             # We've got a -value for poll; it's terminated this will trigger restart on next poll
             self.stop_cluster()
 
+    def maintain_pool(self):
+        '''
+        Keep the pool of warm engines topped up: start warming any new engines, make warmed
+        engines available for jobs, drop dead engines and replace them, and recycle engines that
+        have run their quota of jobs.
+        '''
+        engine_ids = set(self.client.ids) - self.retired
+        known = set(r.e.targets for r in self.runners if isinstance(r, ClusterRunner)) | \
+                set(r.e.targets for r, ar in self.warming)
+
+        # New engines; reset and preload in the background before taking jobs
+        for target in engine_ids - known:
+            runner = ClusterRunner(self.client[target])
+            runner.e.execute('%reset -f')
+            runner.e.execute('%matplotlib inline')
+            self.warming.append((runner, runner.e.execute(self.preload)))
+
+        self.engines_starting = max(0, self.engines_starting - len(engine_ids - known))
+        if self.engines_starting and (datetime.now() - self._engines_starting_since).total_seconds() > 60:
+            # Engines that haven't registered in a minute aren't coming
+            self.engines_starting = 0
+
+        # Warmed engines join the pool (an engine that failed to warm is still usable)
+        for runner, ar in self.warming[:]:
+            if ar.ready():
+                self.warming.remove((runner, ar))
+                self.runners.append(runner)
+                logging.info("Kernel %s ready" % runner.e.targets)
+
+        # Drop engines that have died, failing any job they were running
+        for runner in self.runners[:]:
+            if isinstance(runner, ClusterRunner) and runner.e.targets not in engine_ids:
+                logging.warn("Kernel %s lost" % runner.e.targets)
+                runner.fail("Kernel died while running this tool")
+                runner.stop()
+                self.runners.remove(runner)
+
+        self.warming = [(r, ar) for r, ar in self.warming if r.e.targets in engine_ids]
+
+        # Kill engines that haven't responded to an interrupt; they'll be replaced as lost
+        for runner in self.runners:
+            if isinstance(runner, ClusterRunner) and runner.interrupted_at is not None and runner.is_active and \
+                    (datetime.now() - runner.interrupted_at).total_seconds() > INTERRUPT_TIMEOUT:
+                logging.warn("Kernel %s not responding to interrupt; killing" % runner.e.targets)
+                runner.interrupted_at = None
+                runner.kill()
+
+        # Retire idle engines that have run their quota of jobs
+        if self.recycle_after:
+            for runner in self.runners[:]:
+                if isinstance(runner, ClusterRunner) and not runner.is_active and runner.jobs_run >= self.recycle_after:
+                    logging.info("Recycling kernel %s" % runner.e.targets)
+                    self.runners.remove(runner)
+                    runner.stop()
+                    self.client.shutdown(targets=runner.e.targets, block=False)
+                    self.retired.add(runner.e.targets)
+                    engine_ids.discard(runner.e.targets)
+
+        # Replace lost engines, allowing for any still starting up
+        self.engine_processes = [p for p in self.engine_processes if p.poll() is None]
+        for n in range(self.pool_size - len(engine_ids) - self.engines_starting):
+            self.start_engine()
+
     def create_user_kernel(self):
         # Create an in-process user kernel to provide dynamic access to variables
         # Start an in-process runner for the time being
@@ -669,6 +1076,9 @@ class RunManager(QObject):
         self.in_process_runner.kernel_client.execute('%reset -f')
         #self.in_process_runner.kernel_client.execute('%matplotlib inline')
 
+    def warm_user_kernel(self):
+        self.in_process_runner.kernel_client.execute(self.preload)
+
 
 class ExecuteOnly(object):
     language = 'python'
@@ -20,7 +20,7 @@ from .globals import styles, MATCH_EXACT, MATCH_CONTAINS, MATCH_START, MATCH_END
                     MATCH_REGEXP, MARKERS, LINESTYLES, FILLSTYLES, HATCHSTYLES, \
                     StyleDefinition, ClassMatchDefinition, notebook_queue, \
                     current_tools, current_tools_by_id, installed_plugin_names, current_datasets, \
-                    mono_fontFamily, custom_pyqtconfig_hooks
+                    mono_fontFamily, custom_pyqtconfig_hooks, settings, memory_manager
 
 import tempfile
 
@@ -41,8 +41,13 @@ from IPython.nbconvert.filters.markdown import markdown2html_mistune
 from IPython.core import display
 from IPython.qt.console.ansi_code_processor import QtAnsiCodeProcessor
 
-from .runqueue import STATUS_READY, STATUS_RUNNING, STATUS_COMPLETE, STATUS_ERROR, STATUS_BLOCKED
+from .runqueue import STATUS_READY, STATUS_RUNNING, STATUS_COMPLETE, STATUS_ERROR, STATUS_BLOCKED, \
+                      PRIORITY_FOCUS, PRIORITY_NORMAL, PRIORITY_LOW, PRIORITY_NAMES
 from .kernel_helpers import PathomxTool
+from .profiler import profiler, PHASES
+from .workspace import state_key, Deferred
+from .memory import resident_size
+from xml.sax.saxutils import escape
 
 from PIL import Image
 
@@ -114,10 +119,23 @@ class KernelStatusWidget(QWidget):
 
         # Kernel queue list interrogate
         self.layout = QHBoxLayout()
-        self.setLayout(self.layout)
+
+        # Queued jobs at each priority
+        self.queue = QLabel()
+        font = self.queue.font()
+        font.setPointSize(8)
+        self.queue.setFont(font)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(self.layout)
+        layout.addWidget(self.queue)
+        self.setLayout(layout)
 
     def update(self, runmanager):
         runners = runmanager.runners
+        focus_chain = runmanager.focus_chain()
+        running = dict((id(j.runner), j) for j in runmanager.active_jobs)
 
         # Ensure we've got enough items
         if len(runners) != self.layout.count():
@@ -150,8 +168,19 @@ class KernelStatusWidget(QWidget):
 
             w.setPalette(p)
 
+            job = running.get(id(k))
+            if job is not None:
+                w.setToolTip('%s (%s priority)' % (job.profile.name, PRIORITY_NAMES[runmanager.job_priority(job, focus_chain)]))
+            else:
+                w.setToolTip('')
+
+        counts = runmanager.queued_by_priority()
+        self.queue.setText(' '.join('%d' % counts[p] for p in (PRIORITY_FOCUS, PRIORITY_NORMAL, PRIORITY_LOW)))
+        self.queue.setToolTip('Queued jobs: %s' % ', '.join('%d %s' % (counts[p], PRIORITY_NAMES[p])
+                                                         for p in (PRIORITY_FOCUS, PRIORITY_NORMAL, PRIORITY_LOW)))
+
     def sizeHint(self):
-        return QSize(self.layout.count() * 10, 10)
+        return QSize(self.layout.count() * 10 + self.queue.sizeHint().width(), 10)
 
 
 class QColorButton(QPushButton):
@@ -1169,7 +1198,11 @@ class DialogDataSource(GenericDialog):
                     for k, dataset in t.data.o.items():
                         interfaces.append((t.data, k))
 
-                        if type(dataset) == pd.DataFrame:
+                        if isinstance(dataset, Deferred):
+                            # Stored, not loaded; don't read it just to list it
+                            ts = 'stored'
+                            shape = 'x'.join([str(s) for s in getattr(dataset, 'shape', [])]) or '?'
+                        elif type(dataset) == pd.DataFrame:
                             ts = 'pandas.DataFrame(%s)' % dataset.values.dtype
                             shape = 'x'.join([str(s) for s in dataset.shape])
                         elif type(dataset) == np.ndarray:
@@ -1225,7 +1258,9 @@ class DialogDataOutput(GenericDialog):
             tw.setText(0, str(len(self.datasets) - 1))  # Store index
             tw.setText(1, k)
 
-            if type(dataset) == pd.DataFrame:
+            if isinstance(dataset, Deferred):
+                ts = 'stored'  # Not loaded
+            elif type(dataset) == pd.DataFrame:
                 ts = 'pandas.DataFrame(%s)' % dataset.values.dtype
             elif type(dataset) == np.ndarray:
                 ts = 'numpy.ndarray(%s)' % dataset.values.dtype
@@ -1233,7 +1268,7 @@ class DialogDataOutput(GenericDialog):
                 ts = type(dataset)
 
             tw.setText(2, ts)
-            tw.setText(3, 'x'.join([str(s) for s in dataset.shape]))
+            tw.setText(3, 'x'.join([str(s) for s in getattr(dataset, 'shape', [])]))
 
             self.lw_sources.addTopLevelItem(tw)
 
@@ -1248,6 +1283,76 @@ class DialogDataOutput(GenericDialog):
         self.dialogFinalise()
 
 
+class DialogProfiler(GenericDialog):
+    '''
+    Timeline of the jobs run this session across the kernels, with the time spent in each stage
+    per tool. Hover over a bar for details. Profiles can be exported as JSON or in Chrome trace
+    format (load in chrome://tracing).
+    '''
+
+    def __init__(self, parent=None, **kwargs):
+        super(DialogProfiler, self).__init__(parent, buttons=['ok'], **kwargs)
+
+        self.setWindowTitle(tr("Execution timeline"))
+
+        self.timeline = QWebView()
+        self.layout.addWidget(self.timeline)
+
+        buttons = QHBoxLayout()
+
+        refresh_btn = QPushButton(tr('Refresh'))
+        refresh_btn.clicked.connect(self.refresh)
+        buttons.addWidget(refresh_btn)
+
+        clear_btn = QPushButton(tr('Clear'))
+        clear_btn.clicked.connect(self.onClear)
+        buttons.addWidget(clear_btn)
+
+        buttons.addStretch()
+
+        export_json_btn = QPushButton(tr('Export JSON…'))
+        export_json_btn.clicked.connect(lambda: self.onExport('json'))
+        buttons.addWidget(export_json_btn)
+
+        export_trace_btn = QPushButton(tr('Export Chrome trace…'))
+        export_trace_btn.clicked.connect(lambda: self.onExport('chrome'))
+        buttons.addWidget(export_trace_btn)
+
+        self.layout.addLayout(buttons)
+        self.setMinimumSize(QSize(1100, 500))
+
+        self.refresh()
+        self.dialogFinalise()
+
+    def refresh(self):
+        rows = []
+        for name, total, phases in profiler.summary():
+            rows.append('<tr><td>%s</td><td>%.3f</td>%s</tr>' % (
+                escape(name), total, ''.join('<td>%.3f</td>' % phases.get(p, 0) for p, start, end in PHASES)))
+
+        peaks = ', '.join('%s %.0f MB' % (r, m / 1048576.) for r, m in sorted(profiler.peak_memory.items()))
+
+        self.timeline.setHtml('''<html><body style="font-family: sans-serif; font-size: 11px;">
+{svg}
+<p>Peak memory: {peaks}</p>
+<table cellpadding="3"><tr><th>Tool</th><th>Total (s)</th>{headers}</tr>{rows}</table>
+</body></html>'''.format(
+            svg=profiler.timeline_svg(),
+            peaks=peaks or '-',
+            headers=''.join('<th>%s</th>' % p for p, start, end in PHASES),
+            rows=''.join(rows),
+        ))
+
+    def onClear(self):
+        profiler.clear()
+        self.refresh()
+
+    def onExport(self, format):
+        filename, _ = QFileDialog.getSaveFileName(self, tr('Export execution profile'), '', "JSON (*.json)")
+        if filename:
+            profiler.save(filename, format)
+
+
 # Overload this to provide some better size hinting to the inside tabs
 class QTabWidgetExtend(QTabWidget):
 
@@ -1338,11 +1443,23 @@ class GenericApp(QObject):
         self._pause_analysis_flag = False
         self._latest_dock_widget = None
         self._latest_generator_result = None
+        self._profile = None  # Profile of the current run; timed through to the views
         self._auto_consume_data = auto_consume_data
 
+        # State (see state_key) of the current run, and of the run that produced the outputs
+        self._run_state = None
+        self._output_state = None
+        self._views_pending = False  # Restored results not yet shown
+        self._spill_files = []  # Files holding results spilled to disk by the memory manager
+        self._batch = None  # WorkflowRun holding runs of this tool, e.g. while a workflow loads
+
         # Set this to true to auto-start a new calculation after current (block multi-runs)
         self._is_job_active = False
-        self._queued_start = False
+
+        # Config changes are run after a pause, so rapid edits (e.g. dragging a spin box) run once
+        self._config_timer = QTimer()
+        self._config_timer.setSingleShot(True)
+        self._config_timer.timeout.connect(self.autogenerate)
 
         # Initiate logging
         self.log_viewer = QTextEdit()
@@ -1439,21 +1556,22 @@ class GenericApp(QObject):
         self._init_timer = QTimer.singleShot(PX_INIT_SHOT, self.init_notebook)
 
     def init_notebook(self):
-        self.logger.debug('Post-init: init_notebook')
+        try:
+            self.logger.debug('Post-init: init_notebook')
 
 
-        # Initial display of the notebook
-        if self.code_editor.is_enhanced_editor:
-            self.code_editor.detectSyntax(language='Python')
+            # Initial display of the notebook
+            if self.code_editor.is_enhanced_editor:
+                self.code_editor.detectSyntax(language='Python')
 
-        self.addDataToolBar()
-        self.addEditorToolBar()
-        self.addFigureToolBar()
+            self.addDataToolBar()
+            self.addEditorToolBar()
+            self.addFigureToolBar()
 
-        self.load_notes()
-        self.load_source()
+            self.load_notes()
+            self.load_source()
 
-        html = '''<html>
+            html = '''<html>
 <head><title>About</title><link rel="stylesheet" href="{css}"></head>
 <body>
 <div class="container" id="notebook-container">
@@ -1467,16 +1585,21 @@ class GenericApp(QObject):
         </body>
         </html>'''.format(**{'baseurl': 'file:///' + os.path.join(utils.scriptdir), 'css': 'file:///' + css, 'html': markdown2html_mistune(self.notes)})
 
-        self.notes_viewer.setHtml(unicode(html))
+            self.notes_viewer.setHtml(unicode(html))
+
+            self.views.addView(self.notes_viewer, '&?', unfocus_on_refresh=True)
+            self.views.addView(self.code_editor, '&#', unfocus_on_refresh=True)
+            self.views.addView(self.log_viewer, '&=', unfocus_on_refresh=True)
+            #self.views.addView( self.logView, 'Log')
 
-        self.views.addView(self.notes_viewer, '&?', unfocus_on_refresh=True)
-        self.views.addView(self.code_editor, '&#', unfocus_on_refresh=True)
-        self.views.addView(self.log_viewer, '&=', unfocus_on_refresh=True)
-        #self.views.addView( self.logView, 'Log')
+            if self._is_autoconsume_success is not False:
+                # This will fire after the notebook has completed above
+                self._init_timer = QTimer.singleShot(PX_INIT_SHOT, self.autogenerate)
 
-        if self._is_autoconsume_success is not False:
-            # This will fire after the notebook has completed above
-            self._init_timer = QTimer.singleShot(PX_INIT_SHOT, self.autogenerate)
+        finally:
+            # Release the batch even if initialisation failed, so the rest of the workflow can run
+            if self._batch is not None:
+                self._batch.tool_ready(self)
 
     def reload(self):
         self.load_notes()
@@ -1514,6 +1637,12 @@ class GenericApp(QObject):
         if self._pause_analysis_flag:
             self.status.emit('paused')
             return False
+
+        if self._batch is not None:
+            # Run by the batch once everything upstream is done
+            self._batch.mark_dirty(self)
+            return False
+
         self.generate()
 
     def generate(self):
@@ -1526,15 +1655,38 @@ class GenericApp(QObject):
             'styles': styles,
             '_pathomx_tool_path': self.plugin.path,
             '_pathomx_database_path': os.path.join(utils.scriptdir, 'database'),
+            '_pathomx_cache_path': os.path.join(QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0], self.plugin.id),
+            '_pathomx_entity_store_path': os.path.join(QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0], 'entities.sqlite'),
+            '_pathomx_profile_run': self.profile_runAction.isChecked() if hasattr(self, 'profile_runAction') else False,
         }
 
+        self._config_timer.stop()  # Running the latest config now
         self.status.emit('active')
         self.progress.emit(0.)
 
-        notebook_queue.add_job(self, varsi, progress_callback=self.progress.emit, result_callback=self._worker_result_callback)  # , error_callback=self._worker_error_callback)
+        self._run_state = self.state_key()
+
+        # Inputs are read as the job starts; keep them in memory over less recently used results
+        for source in self.data.i.values():
+            if source:
+                memory_manager.touch(source[0].v)
+
+        # Supersedes any queued or running job of this tool
+        priority = PRIORITY_LOW if hasattr(self, 'low_priorityAction') and self.low_priorityAction.isChecked() else PRIORITY_NORMAL
+        notebook_queue.add_job(self, varsi, progress_callback=self.progress.emit, result_callback=self._worker_result_callback, priority=priority)  # , error_callback=self._worker_error_callback)
+
+    def cancel(self):
+        '''
+        Stop any pending, queued or running calculation of this tool; the current outputs stand.
+        '''
+        self._config_timer.stop()
+        if notebook_queue.cancel(self):
+            self.progress.emit(1.)
+            self.status.emit('paused')
 
     def _worker_result_callback(self, result):
         self.progress.emit(1.)
+        self._profile = result.get('profile')
 
         if 'stdout' in result:
             self.logger.error(result['stdout'])
@@ -1543,6 +1695,7 @@ class GenericApp(QObject):
             self.logger.debug("Notebook complete %s" % self.name)
             self.status.emit('done')
             varso = result['varso']
+            self._output_state = self._run_state
 
             if 'styles' in varso:
                 global styles
@@ -1553,6 +1706,7 @@ class GenericApp(QObject):
             self.status.emit('error')
             self.logger.error(result['traceback'])
             varso = {}
+            self._output_state = None
         #varso['_pathomx_result_notebook'] = result['notebook']
         #self.nb = result['notebook']
 
@@ -1561,11 +1715,18 @@ class GenericApp(QObject):
     def worker_cleanup(self, varso):
         # Copy the data for the views here; or we're sending the same data to the get (main thread)
         # as to the prerender loop (seperate thread) without a lock
+        self._latest_generator_result = varso if self._output_state is not None else None
+        self._views_pending = False
         self.generated(**varso)
         self.autoprerender(varso)
+        if self._profile:
+            self._profile.mark('prerendered')
 
         self._is_job_active = False
 
+        memory_manager.touch(self)
+        memory_manager.enforce(keep=(self, notebook_queue.focus))
+
     # Callback function for threaded generators; see _worker_result_callback and start_worker_thread
     def generated(self, **kwargs):
         self.logger.debug("generated %s" % self.name)
@@ -1581,14 +1742,123 @@ class GenericApp(QObject):
         # Set into the workspace of user kernel
         notebook_queue.in_process_runner.kernel_manager.kernel.shell.push({'t%s' % self.id: PathomxTool(self.name, **kwargs)})
 
+        # Results of earlier runs spilled to disk are replaced
+        self.release_spill_files()
+
+    def state_key(self):
+        '''
+        Return a key for the current state of the tool: its code, config and the state of each input.
+        Runs in the same state give the same outputs, so results with a matching key can be reused.
+        '''
+        code = self.code or getattr(self, 'default_code', '')
+        inputs = sorted((i, s[0].v.state_key(), s[1]) for i, s in self.data.i.items() if s)
+        return state_key(type(self).__name__, code, self.config.as_dict(), inputs)
+
+    def restore(self, results, state):
+        '''
+        Restore the results of a previous run, e.g. from a workspace, without running the tool.
+        Outputs are available downstream immediately; Deferred results are loaded on first use.
+
+        :param results: dict of result variables, as returned from a run
+        :param state: State key of the run that produced the results
+        '''
+        self._latest_generator_result = results
+        self._output_state = state
+
+        for o in list(self.data.o.keys()):
+            if o in results:
+                # Set without notifying watchers; nothing downstream needs re-running
+                self.data.o[o] = results.peek(o) if hasattr(results, 'peek') else results[o]
+                self.data.output_updated.emit(o)
+
+        # Views are built when the tool is first shown (loading the results)
+        self._views_pending = True
+        self.status.emit('done')
+
+        memory_manager.touch(self)
+
+    def show_restored_views(self):
+        if not self._views_pending:
+            return
+
+        self._views_pending = False
+        varso = self._latest_generator_result.load_all() if hasattr(self._latest_generator_result, 'load_all') else self._latest_generator_result
+        self._latest_generator_result = varso
+
+        notebook_queue.in_process_runner.kernel_manager.kernel.shell.push({'t%s' % self.id: PathomxTool(self.name, **varso)})
+        self.autoprerender(varso)
+
+    def resident_bytes(self):
+        '''
+        Size in bytes of the results of this tool held in memory.
+        '''
+        return resident_size(self._latest_generator_result, self.data.o)
+
+    def spill(self, store):
+        '''
+        Move the large results of this tool to disk, to be read back when next used. The views
+        and the copy in the user kernel are dropped and rebuilt when the tool is next shown.
+
+        :param store: memory.SpillStore to write to
+        '''
+        if not self._latest_generator_result:
+            return
+
+        results, filename = store.spill(self._latest_generator_result)
+        if filename:
+            self._spill_files.append(filename)
+
+        self._latest_generator_result = results
+        for o in list(self.data.o.keys()):
+            if o in results:
+                self.data.o[o] = results.peek(o)
+
+        # Drop the other references to the results
+        self._views_pending = True
+        self.views.data = {}
+        for view in self.views.views.values():
+            if isinstance(view, DataFrameWidget):
+                view.setDataFrame(pd.DataFrame({}))
+
+        notebook_queue.in_process_runner.kernel_manager.kernel.shell.user_ns.pop('t%s' % self.id, None)
+        notebook_queue.forget(self)
+
+        self.release_spill_files()
+
+    def release_spill_files(self):
+        # Remove spill files no longer read from
+        self._spill_files = [f for f in self._spill_files
+                             if not memory_manager.store.release(f, self.data.o, self._latest_generator_result)]
+
+    def release_results(self):
+        '''
+        Stop tracking the results of this tool; remove any spilled to disk and the copies on the kernels.
+        '''
+        memory_manager.remove(self)
+        notebook_queue.forget(self)
+
+        for f in self._spill_files:
+            memory_manager.store.release(f)
+        self._spill_files = []
+
     def autoprerender(self, kwargs_dict):
         self.logger.debug("autoprerender %s" % self.name)
         self.views.data = self.prerender(**kwargs_dict)
         # Delay this 1/2 second so next processing gets underway
         # FIXME: when we've got a better runner system
-        QTimer.singleShot(PX_RENDER_SHOT, self.views.source_data_updated.emit)
+        QTimer.singleShot(PX_RENDER_SHOT, self.render_views)
         #self.views.source_data_updated.emit()
 
+    def render_views(self):
+        profile, self._profile = self._profile, None
+        if profile:
+            profile.mark('render_begin')
+
+        self.views.source_data_updated.emit()
+
+        if profile:
+            profile.mark('rendered')
+
     def prerender(self, *args, **kwargs):
 
         FIGURE_COLOR = QColor(0, 127, 0)
@@ -1644,6 +1914,8 @@ class GenericApp(QObject):
         self.parent().register_url_handler(self.id, url_handler)
 
     def delete(self):
+        self.cancel()
+        self.release_results()
         self.hide()
         self.w.close()  # Close the window
 
@@ -1668,10 +1940,19 @@ class GenericApp(QObject):
 
     def autoconfig(self, signal):
         if signal == RECALCULATE_ALL or self._latest_generator_result is None:
-            self.autogenerate()
+            delay = settings.get('Kernels/Config_run_delay') if settings else 0
+            if delay:
+                self._config_timer.start(delay)  # Restarts the wait if pending
+            else:
+                self.autogenerate()
 
         elif signal == RECALCULATE_VIEW:
-            self.autoprerender(self._latest_generator_result)
+            # View-only settings; the results stand for the new config
+            self._output_state = self.state_key()
+            if self._views_pending:
+                self.show_restored_views()
+            else:
+                self.autoprerender(self._latest_generator_result)
 
     def autoconfig_rename(self, signal):
         self.set_name(self.autoconfig_name.format(**self.config.as_dict()))
@@ -1685,6 +1966,12 @@ class GenericApp(QObject):
         self.nameChanged.emit(name)
 
     def show(self):
+        self.show_restored_views()
+        notebook_queue.set_focus(self)  # Run this tool's chain first
+
+        memory_manager.touch(self)
+        memory_manager.enforce(keep=(self,))
+
         self.parent().activetoolDock.setWidget(self.w)
         self.parent().activetoolDock.setWindowTitle(self.name)
         self.parent().activetoolDock.show()
@@ -1697,6 +1984,9 @@ class GenericApp(QObject):
         self.parent().activetoolDock.raise_()
 
     def hide(self):
+        if notebook_queue.focus is self:
+            notebook_queue.set_focus(None)
+
         self.parent().toolDock.setWidget(self.parent().toolbox)
         self.parent().activetoolDock.setWidget(QWidget())  # Empty
 
@@ -1732,6 +2022,11 @@ class GenericApp(QObject):
         select_dataAction.triggered.connect(self.onRecalculate)
         t.addAction(select_dataAction)
 
+        select_dataAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'cross.png')), tr('Stop calculation'), self.w)
+        select_dataAction.setStatusTip('Stop the current calculation')
+        select_dataAction.triggered.connect(self.cancel)
+        t.addAction(select_dataAction)
+
         self.pause_analysisAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'control-pause.png')), tr('Pause automatic analysis'), self.w)
         self.pause_analysisAction.setStatusTip('Do not automatically refresh analysis when source data updates')
         self.pause_analysisAction.setCheckable(True)
@@ -1740,6 +2035,11 @@ class GenericApp(QObject):
         t.addAction(self.pause_analysisAction)
         self._pause_analysis_flag = self.default_pause_analysis
 
+        self.low_priorityAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'cup.png')), tr('Run in background'), self.w)
+        self.low_priorityAction.setStatusTip('Run this tool at low priority, after other tools (unless it is being viewed)')
+        self.low_priorityAction.setCheckable(True)
+        t.addAction(self.low_priorityAction)
+
         select_dataAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'data-output.png')), tr('View resulting data…'), self.w)
         select_dataAction.setStatusTip('View resulting data output from this plugin')
         select_dataAction.triggered.connect(self.onViewDataOutput)
@@ -1771,8 +2071,21 @@ class GenericApp(QObject):
         reset_to_default_codeAction.triggered.connect(self.onResetDefaultCode)
         t.addAction(reset_to_default_codeAction)
 
+        t.addSeparator()
+
+        self.profile_runAction = QAction(QIcon(os.path.join(utils.scriptdir, 'icons', 'lightning.png')), tr('Profile runs'), self.w)
+        self.profile_runAction.setStatusTip('Run this tool under the profiler and show the slowest lines and functions')
+        self.profile_runAction.setCheckable(True)
+        self.profile_runAction.toggled.connect(self.onProfileRunToggle)
+        t.addAction(self.profile_runAction)
+
         self.toolbars['editor'] = t
 
+    def onProfileRunToggle(self, checked):
+        # Profile straight away, on the current inputs and config
+        if checked:
+            self.generate()
+
     def onResetDefaultCode(self):
         reply = QMessageBox.question(self.w, "Reset code to default", "Are you sure you want to reset your custom code to the tool default? Your work will be gone.",
                             QMessageBox.Yes | QMessageBox.No)
@@ -1967,6 +2280,143 @@ class GenericApp(QObject):
         return QSize(600 + 300, 400 + 100)
 
 
+class WorkflowRun(QObject):
+    '''
+    Runs a set of tools as a single batch: each dirty tool is run once, after everything
+    upstream of it in the batch. While the batch is open run requests from the tools (changed
+    inputs or config) mark them dirty rather than starting a run, so loading a workflow
+    doesn't set off a cascade of runs.
+
+    Tools join the batch on creation and the batch starts once all have initialised
+    (see tool_ready). When there is nothing left to run the tools are released.
+
+    :param tools: The tools in the batch
+    :param dirty: Tools to run; anything downstream of these is run too
+    '''
+    finished = pyqtSignal()
+
+    def __init__(self, tools, dirty=None, *args, **kwargs):
+        super(WorkflowRun, self).__init__(*args, **kwargs)
+
+        self.tools = set(tools)
+        self.waiting = set(tools)  # Not yet initialised
+        self.dirty = set()
+        self.running = set()
+
+        self._handlers = {}
+        self._is_schedule_pending = False
+        self._is_released = False
+
+        for t in self.tools:
+            t._batch = self
+            self._handlers[t] = (self.make_status_handler(t), self.make_deleted_handler(t))
+            t.status.connect(self._handlers[t][0])
+            t.deleted.connect(self._handlers[t][1])
+
+        for t in dirty if dirty is not None else self.tools:
+            self.mark_dirty(t)
+
+        # Release straight away if there is nothing to wait for or run (e.g. an empty workflow)
+        self.schedule()
+
+    def make_status_handler(self, tool):
+        return lambda status: self.tool_status(tool, status)
+
+    def make_deleted_handler(self, tool):
+        return lambda: self.remove(tool)
+
+    def downstream(self, tool):
+        '''
+        Tools in the batch taking input from the tool, directly or indirectly.
+        '''
+        found = set()
+        stack = [tool]
+        while stack:
+            for watchers in stack.pop().data.watchers.values():
+                for manager in watchers:
+                    if manager.v in self.tools and manager.v not in found:
+                        found.add(manager.v)
+                        stack.append(manager.v)
+        return found
+
+    def upstream(self, tool):
+        return set(s[0].v for s in tool.data.i.values() if s)
+
+    def mark_dirty(self, tool):
+        if tool not in self.tools:
+            return
+
+        self.dirty.add(tool)
+        self.dirty |= self.downstream(tool)
+        self.schedule()
+
+    def tool_ready(self, tool):
+        self.waiting.discard(tool)
+        self.schedule()
+
+    def tool_status(self, tool, status):
+        if tool not in self.running or status == 'active':
+            return
+
+        self.running.discard(tool)
+        if status != 'done':
+            # Failed or paused; what is downstream can't be run from it
+            self.dirty -= self.downstream(tool)
+        self.schedule()
+
+    def remove(self, tool):
+        self.tools.discard(tool)
+        self.waiting.discard(tool)
+        self.dirty.discard(tool)
+        self.running.discard(tool)
+        self._handlers.pop(tool, None)
+        self.schedule()
+
+    def schedule(self):
+        # Deferred to the event loop, so a finished tool has put all of its outputs first
+        if not self._is_schedule_pending:
+            self._is_schedule_pending = True
+            QTimer.singleShot(0, self._schedule)
+
+    def _schedule(self):
+        self._is_schedule_pending = False
+        if self.waiting or self._is_released:
+            return
+
+        for t in list(self.dirty):
+            if t not in self.dirty or self.upstream(t) & (self.dirty | self.running):
+                continue
+
+            self.dirty.discard(t)
+            if t._pause_analysis_flag:
+                t.status.emit('paused')
+                self.dirty -= self.downstream(t)
+                continue
+
+            self.running.add(t)
+            try:
+                t.generate()
+            except Exception as e:
+                logging.error("Error starting %s: %s" % (t.name, e))
+                self.running.discard(t)
+                self.dirty -= self.downstream(t)
+
+        if not self.dirty and not self.running:
+            self.release()
+
+    def release(self):
+        for t, (status_handler, deleted_handler) in self._handlers.items():
+            t.status.disconnect(status_handler)
+            t.deleted.disconnect(deleted_handler)
+            if t._batch is self:
+                t._batch = None
+
+        self._handlers = {}
+        self.tools = set()
+        self._is_released = True
+        self.finished.emit()
+
+
 class IPythonApp(GenericApp):
     pass
 
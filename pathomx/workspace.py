@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+'''
+Workspace files: a workflow together with the results of its tools.
+
+A workspace (.mpw) is a zip container holding the workflow definition (the same XML as a
+.mpf workflow), a JSON manifest and the results of each tool. DataFrames and arrays are
+stored as raw .npy values (plus pickled axes for DataFrames) and anything else, e.g. figures,
+is pickled; all members are compressed.
+
+Results are stored under a key derived from the state of the tool that produced them (its
+code, config and the state of its inputs), so identical results are only stored once and
+entries not yet loaded from an earlier save can be copied across without decoding them.
+
+On open results are returned as Deferred placeholders, read from the file on first use.
+'''
+from __future__ import unicode_literals
+
+import os
+import io
+import json
+import shutil
+import hashlib
+import tempfile
+import zipfile
+import logging
+
+import numpy as np
+import pandas as pd
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+WORKSPACE_VERSION = 1
+
+WORKFLOW_MEMBER = 'workflow.mpf'
+MANIFEST_MEMBER = 'manifest.json'
+
+
+class Deferred(object):
+    '''
+    Placeholder for a value held elsewhere, loaded on first use and then kept.
+
+    :param loader: Function returning the value
+    :param args: Arguments to the loader
+    :param shape: Shape of the value, if known, so it can be shown without loading
+    '''
+
+    def __init__(self, loader, *args, **kwargs):
+        self.loader = loader
+        self.args = args
+        self.is_loaded = False
+        self._value = None
+
+        if kwargs.get('shape') is not None:
+            self.shape = tuple(kwargs['shape'])
+
+    def load(self):
+        if not self.is_loaded:
+            self._value = self.loader(*self.args)
+            self.is_loaded = True
+        return self._value
+
+
+class DeferredDict(dict):
+    '''
+    A dict resolving Deferred values on access by key.
+
+    Iterating (items, values) does not load; values not yet loaded are returned as Deferred.
+    Use peek to get a value without loading it, and load_all for a plain dict of loaded values.
+    '''
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, Deferred):
+            value = value.load()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def peek(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def is_loaded(self, key):
+        return not isinstance(dict.get(self, key), Deferred)
+
+    def load_all(self):
+        return dict((k, self[k]) for k in list(self.keys()))
+
+
+def state_key(*args):
+    '''
+    Return a key for a tool state from JSON-able parts, e.g. code, config and input state keys.
+    '''
+    state = json.dumps(args, sort_keys=True, default=str)
+    return hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+
+def _entry_format(value):
+    if isinstance(value, pd.DataFrame) and len(set(value.dtypes)) <= 1 and value.values.dtype != object:
+        return 'dataframe'
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        return 'ndarray'
+    return 'pickle'
+
+
+def _write_entry(z, prefix, value, fmt, tmp_path):
+    # Values go via a temporary file so large arrays are compressed without a copy in memory
+    def write_member(name, fn):
+        filename = os.path.join(tmp_path, name)
+        with open(filename, 'wb') as f:
+            fn(f)
+        z.write(filename, '%s/%s' % (prefix, name))
+        os.remove(filename)
+
+    if fmt == 'dataframe':
+        write_member('values.npy', lambda f: np.save(f, np.ascontiguousarray(value.values)))
+        write_member('axes.pickle', lambda f: pickle.dump((value.index, value.columns), f, pickle.HIGHEST_PROTOCOL))
+    elif fmt == 'ndarray':
+        write_member('values.npy', lambda f: np.save(f, value))
+    else:
+        write_member('object.pickle', lambda f: pickle.dump(value, f, pickle.HIGHEST_PROTOCOL))
+
+
+def _read_entry(filename, prefix, fmt):
+    with zipfile.ZipFile(filename, 'r') as z:
+        if fmt == 'dataframe':
+            with z.open('%s/axes.pickle' % prefix) as f:
+                index, columns = pickle.load(f)
+            with z.open('%s/values.npy' % prefix) as f:
+                values = np.lib.format.read_array(f)
+            return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+        elif fmt == 'ndarray':
+            with z.open('%s/values.npy' % prefix) as f:
+                return np.lib.format.read_array(f)
+
+        else:
+            with z.open('%s/object.pickle' % prefix) as f:
+                return pickle.load(f)
+
+
+def save_workspace(filename, workflow, tools):
+    '''
+    Write a workspace file.
+
+    Deferred values from a workspace not yet loaded are copied across as stored, so saving
+    over the workspace they came from is safe.
+
+    :param filename: Path of the .mpw file
+    :param workflow: Workflow XML
+    :type workflow: bytes
+    :param tools: List of (tool id, state key, results dict) for each tool with results
+    '''
+    manifest = {'version': WORKSPACE_VERSION, 'tools': {}}
+
+    tmp_path = tempfile.mkdtemp()
+    tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        with zipfile.ZipFile(tmp_filename, 'w', zipfile.ZIP_DEFLATED, True) as z:
+            z.writestr(WORKFLOW_MEMBER, workflow)
+            written = set()
+
+            for tool_id, state, results in tools:
+                entries = {}
+                for name in list(results.keys()):
+                    value = results.peek(name) if isinstance(results, DeferredDict) else results[name]
+                    key = hashlib.sha1(('%s\n%s' % (state, name)).encode('utf-8')).hexdigest()
+                    prefix = 'results/%s' % key
+
+                    if isinstance(value, Deferred) and not value.is_loaded and value.loader == _read_entry:
+                        fmt = value.args[2]
+                        if prefix not in written:
+                            # Copy the stored members without decoding
+                            source, source_prefix = value.args[0], value.args[1]
+                            with zipfile.ZipFile(source, 'r') as zs:
+                                for member in zs.namelist():
+                                    if member.startswith(source_prefix + '/'):
+                                        z.writestr(prefix + member[len(source_prefix):], zs.read(member))
+
+                    else:
+                        if isinstance(value, Deferred):
+                            value = value.load()
+                        if value is None:
+                            continue
+
+                        fmt = _entry_format(value)
+                        if prefix not in written:
+                            try:
+                                _write_entry(z, prefix, value, fmt, tmp_path)
+                            except Exception as e:
+                                logging.warning("Could not store %s of tool %s in workspace: %s" % (name, tool_id, e))
+                                entries = None  # Incomplete; the tool will be re-run on open
+                                break
+
+                    written.add(prefix)
+                    entries[name] = {
+                        'key': key,
+                        'format': fmt,
+                        'shape': list(value.shape) if hasattr(value, 'shape') else None,
+                    }
+
+                if entries is not None:
+                    manifest['tools'][tool_id] = {'state': state, 'results': entries}
+
+            z.writestr(MANIFEST_MEMBER, json.dumps(manifest, indent=1).encode('utf-8'))
+
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp_filename, filename)
+
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+class WorkspaceReader(object):
+    '''
+    Read a workspace file: the workflow, and the stored results of each tool on demand.
+
+    :param filename: Path of the .mpw file
+    '''
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+
+        with zipfile.ZipFile(self.filename, 'r') as z:
+            self.workflow = z.read(WORKFLOW_MEMBER)
+            self.manifest = json.loads(z.read(MANIFEST_MEMBER).decode('utf-8'))
+
+        if self.manifest.get('version', 0) > WORKSPACE_VERSION:
+            raise Exception("Workspace was saved with a newer version of Pathomx")
+
+        self.tools = self.manifest['tools']
+
+    def workflow_file(self):
+        '''
+        Return the workflow XML as a file object.
+        '''
+        return io.BytesIO(self.workflow)
+
+    def state(self, tool_id):
+        '''
+        Return the state key stored for a tool, or None if no results are stored.
+        '''
+        return self.tools[tool_id]['state'] if tool_id in self.tools else None
+
+    def results(self, tool_id):
+        '''
+        Return the results of a tool, each loaded from the file on first access.
+
+        :rtype: DeferredDict
+        '''
+        results = DeferredDict()
+        for name, entry in self.tools[tool_id]['results'].items():
+            results[name] = Deferred(_read_entry, self.filename, 'results/%s' % entry['key'], entry['format'], shape=entry.get('shape'))
+        return results